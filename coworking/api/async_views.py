@@ -0,0 +1,64 @@
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+from rest_framework import status
+
+from base.async_views import AsyncDetailView, AsyncListView
+from base.pagination import KeysetPagination
+from base.serializers import ValuesSerializer
+from management.models import Employee, Equipment
+from api import views
+from api.serializers import EquipmentSerializer
+
+
+async def paginated_response(request, queryset, serializer_class):
+    """
+    Paginate a queryset the same way async list views do
+    """
+    serializer = ValuesSerializer.of(serializer_class)
+    paginator = KeysetPagination()
+    page = await paginator.apaginate_queryset(serializer.values(queryset), request)
+    return HttpResponse(
+        AsyncListView.renderer.render(paginator.get_paginated_data(serializer.to_representation(page))),
+        content_type='application/json'
+    )
+
+
+class EquipmentList(AsyncListView):
+    """
+    List all equipments, or create one or many
+    """
+    drf_view = views.EquipmentViewSet
+    drf_actions = {'get': 'list', 'post': 'create'}
+
+
+class EquipmentDetail(AsyncDetailView):
+    """
+    Retrieve, update or delete an equipment.
+    """
+    drf_view = views.EquipmentViewSet
+    drf_actions = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+
+
+class EmployeeList(AsyncListView):
+    """
+    List all Employees, or create one or many
+    """
+    drf_view = views.EmployeeList
+
+
+class EmployeeDetail(AsyncDetailView):
+    """
+    Retrieve, update or delete a employee.
+    """
+    drf_view = views.EmployeeDetail
+
+
+@require_safe
+async def employee_equipment_list(request, employee_id):
+    """
+    List all employee's equipments
+    """
+    if not await Employee.objects.filter(pk=employee_id).aexists():
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+
+    return await paginated_response(request, Equipment.objects.filter(employee=employee_id), EquipmentSerializer)
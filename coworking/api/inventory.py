@@ -0,0 +1,243 @@
+import csv
+import json
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from base.cache import detail_cache
+from management.models import AssignmentEvent, Company, CompanyRoleSummary, Employee
+from api.serializers import (
+    CompanyImportSerializer,
+    EmployeeImportSerializer,
+    EquipmentImportSerializer
+)
+
+
+class InventoryImporter:
+    """
+    Import companies, employees and equipments from a CSV or NDJSON stream.
+
+    Every row has a `kind` (company, employee or equipment) and the fields of
+    its serializer. An employee references its company and a used equipment its
+    employee by id or by name (`name surname` for an employee), through an
+    in-memory index of the objects seen so far, the unknown ones being looked up
+    once per batch. Rows are validated and inserted by batches, each in its own
+    transaction: the invalid rows are reported and the others created.
+    """
+    kinds = ('company', 'employee', 'equipment')
+    formats = ('csv', 'ndjson')
+    batch_size = 1000
+    max_reported_errors = 100
+    names_per_query = 500
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or self.batch_size
+        self.objects = {Company: {}, Employee: {}}
+        self.names = {Company: {}, Employee: {}}
+        # names already looked up in the database
+        self.loaded_names = {Company: set(), Employee: set()}
+        self.rows = 0
+        self.rejected = 0
+        self.created = Counter()
+        self.errors = []
+        self.started = None
+
+    @staticmethod
+    def read_csv(stream):
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # empty cells are missing fields
+            yield reader.line_num, {key: value for key, value in row.items() if key and value not in ('', None)}
+
+    @staticmethod
+    def read_ndjson(stream):
+        for line, content in enumerate(stream, start=1):
+            if not content.strip():
+                continue
+            try:
+                yield line, json.loads(content)
+            except ValueError:
+                yield line, None
+
+    def run(self, stream, file_format, progress=None):
+        """
+        Import the rows of the stream, calling `progress` with the report after each batch
+        """
+        self.started = time.monotonic()
+        batch = []
+        for line, row in getattr(self, f'read_{file_format}')(stream):
+            batch.append((line, row))
+            if len(batch) == self.batch_size:
+                self.import_batch(batch)
+                batch = []
+                if progress is not None:
+                    progress(self.report())
+        if batch:
+            self.import_batch(batch)
+            if progress is not None:
+                progress(self.report())
+        return self.report()
+
+    def report(self):
+        seconds = time.monotonic() - self.started
+        return {
+            'rows': self.rows,
+            'created': {kind: self.created[kind] for kind in self.kinds},
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(self.rows / seconds) if seconds else None,
+        }
+
+    def reject(self, line, errors):
+        self.rejected += 1
+        if len(self.errors) < self.max_reported_errors:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def import_batch(self, batch):
+        first_error = len(self.errors)
+        rows = defaultdict(list)
+        for line, row in batch:
+            if not isinstance(row, dict):
+                self.reject(line, {'non_field_errors': ['Invalid JSON object']})
+            elif row.get('kind') not in self.kinds:
+                self.reject(line, {'kind': [f'Must be one of: {", ".join(self.kinds)}.']})
+            else:
+                rows[row['kind']].append((line, row))
+
+        # a batch can reference the companies and employees it creates
+        with transaction.atomic():
+            if rows['company']:
+                self.import_rows('company', CompanyImportSerializer, rows['company'], {})
+            if rows['employee']:
+                companies = self.resolve(rows['employee'], 'company', Company)
+                self.import_rows('employee', EmployeeImportSerializer, rows['employee'], {'company': companies})
+            if rows['equipment']:
+                employees = self.resolve(rows['equipment'], 'employee', Employee)
+                created = self.import_rows(
+                    'equipment', EquipmentImportSerializer, rows['equipment'], {'employee': employees}
+                )
+                self.update_equipment_counters(created)
+                AssignmentEvent.record([
+                    AssignmentEvent.assignment(equipment.pk, equipment.employee_id, equipment.equipment_type,
+                                               equipment.created_at)
+                    for equipment in created if equipment.employee_id is not None
+                ])
+        self.rows += len(batch)
+        self.errors[first_error:] = sorted(self.errors[first_error:], key=lambda error: error['line'])
+
+    def import_rows(self, kind, serializer_class, rows, prefetched):
+        lines = [line for line, _ in rows]
+        serializer = serializer_class(
+            data=[row for _, row in rows], many=True,
+            context={'allow_partial': True, 'prefetched': prefetched},
+        )
+        serializer.is_valid(raise_exception=True)
+        created = serializer.save()
+
+        for row_error in serializer.row_errors:
+            self.reject(lines[row_error['index']], row_error['errors'])
+        self.created[kind] += len(created)
+        model = serializer.child.Meta.model
+        if model in self.objects:
+            for obj in created:
+                self.add(obj)
+        return created
+
+    def add(self, obj):
+        model = type(obj)
+        self.objects[model][obj.pk] = obj
+        name = str(obj)
+        # a name shared by several objects can not be used as a reference
+        self.names[model][name] = obj.pk if self.names[model].get(name, obj.pk) == obj.pk else None
+        if model is Employee:
+            # employee names are unique, the database has no other employee of this name
+            self.loaded_names[model].add(name)
+
+    def resolve(self, rows, field, model):
+        """
+        Replace the references of the rows by primary keys and return the referenced objects by primary key.
+        Rows with an unknown reference are rejected and removed from the list.
+        """
+        index, names = self.objects[model], self.names[model]
+        references = {}
+        for _, row in rows:
+            if not isinstance(row.get(field), str):
+                continue
+            try:
+                references[row[field]] = uuid.UUID(str(row[field]))
+            except ValueError:
+                references[row[field]] = None
+
+        missing_pks = {pk for pk in references.values() if pk is not None and pk not in index}
+        loaded_names = self.loaded_names[model]
+        missing_names = {
+            reference for reference, pk in references.items() if pk is None and reference not in loaded_names
+        }
+        self.load(model, missing_pks, missing_names)
+
+        resolved = []
+        for line, row in rows:
+            if isinstance(row.get(field), str):
+                pk = references[row[field]] or names.get(row[field])
+                if pk not in index:
+                    self.reject(line, {field: [f'Unknown or ambiguous {field} "{row[field]}".']})
+                    continue
+                row[field] = str(pk)
+            resolved.append((line, row))
+        rows[:] = resolved
+        return index
+
+    def load(self, model, pks, names):
+        """
+        Add to the index the objects of the database referenced by id or by name
+        """
+        names = list(names)
+        conditions = [Q(pk__in=pks)] if pks else []
+        for start in range(0, len(names), self.names_per_query):
+            chunk = names[start:start + self.names_per_query]
+            conditions.append(Q(*(self.name_condition(model, name) for name in chunk), _connector=Q.OR))
+        for condition in conditions:
+            for obj in model.objects.filter(condition):
+                self.add(obj)
+        self.loaded_names[model].update(names)
+
+    @staticmethod
+    def name_condition(model, name):
+        if model is Company:
+            return Q(name=name)
+        # `name surname` may be split on any of its spaces
+        parts = name.split(' ')
+        return Q(*(
+            Q(name=' '.join(parts[:i]), surname=' '.join(parts[i:])) for i in range(1, len(parts))
+        ), _connector=Q.OR) if len(parts) > 1 else Q(pk__in=[])
+
+    @staticmethod
+    def update_equipment_counters(equipments):
+        # the indexed employees count them for the rules of the next batches
+        for equipment in equipments:
+            if equipment.employee_id is not None:
+                equipment.employee.shift_equipment_count(equipment.equipment_type, 1)
+
+        # employees are grouped by shift of counter: usually one update per type of equipment
+        counts = Counter(
+            (equipment.employee_id, Employee.counter_fields[equipment.equipment_type])
+            for equipment in equipments if equipment.employee_id is not None
+        )
+        groups = defaultdict(list)
+        for (pk, field), delta in counts.items():
+            groups[field, delta].append(pk)
+
+        now = timezone.now()
+        for (field, delta), pks in groups.items():
+            Employee.objects.filter(pk__in=pks).update(**{field: F(field) + delta}, updated_at=now)
+        CompanyRoleSummary.shift(added=[
+            ((equipment.employee.company_id, equipment.employee.role),
+             {Employee.counter_fields[equipment.equipment_type]: 1})
+            for equipment in equipments if equipment.employee_id is not None
+        ])
+        detail_cache.invalidate(Employee, {pk for pk, _ in counts})
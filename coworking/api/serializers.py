@@ -1,36 +1,272 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import serializers
 
-from management.models import Company, Equipment, Employee
+from base.models import EquipmentStatus, TypeOfEquipment
+from base.serializers import BulkListSerializer, ModelSerializer, PrefetchedPrimaryKeyRelatedField
+from management.models import (
+    ArchivedCompany,
+    ArchivedEmployee,
+    AssignmentEvent,
+    Company,
+    CompanyRoleSummary,
+    Equipment,
+    EquipmentRule,
+    Employee
+)
 
 
-class CompanySerializer(serializers.ModelSerializer):
+class CompanySerializer(ModelSerializer):
     class Meta:
         model = Company
         fields = '__all__'
         read_only_fields = ['active']
+        list_serializer_class = BulkListSerializer
 
 
-class CompanyActiveSerializer(serializers.ModelSerializer):
+class CompanyActiveSerializer(ModelSerializer):
     class Meta:
         model = Company
         fields = ['active']
 
 
-class EmployeeSerializer(serializers.ModelSerializer):
+class EmployeeSerializer(ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
     class Meta:
         model = Employee
         fields = '__all__'
-        read_only_fields = ['active']
+        read_only_fields = ['active', 'pc_count', 'screen_count']
+        list_serializer_class = BulkListSerializer
+
+    def validate_company(self, company):
+        joins_company = self.instance is None or self.instance.company_id != company.pk
+        if joins_company and not company.active:
+            raise serializers.ValidationError('The company of the new employee must be active')
+        return company
 
 
-class EmployeeActiveSerializer(serializers.ModelSerializer):
+class EmployeeActiveSerializer(ModelSerializer):
     class Meta:
         model = Employee
         fields = ['active']
 
 
-class EquipmentSerializer(serializers.ModelSerializer):
+class EquipmentSerializer(ModelSerializer):
+    # fields each type of equipment must define, the others must stay empty
+    # (mirror of the `criteria_matches_equipment_type` check constraint)
+    criteria_fields = {
+        TypeOfEquipment.PC: ('memory', 'hard_disk_size'),
+        TypeOfEquipment.SCREEN: ('size',),
+    }
+
     class Meta:
         model = Equipment
         fields = '__all__'
         read_only_fields = ['employee']
+        list_serializer_class = BulkListSerializer
+
+    def validate(self, attrs):
+        values = {
+            field: attrs[field] if field in attrs else getattr(self.instance, field, None)
+            for field in ('equipment_type', 'memory', 'hard_disk_size', 'size')
+        }
+        required = self.criteria_fields.get(values['equipment_type'], ())
+        errors = {}
+        for field in ('memory', 'hard_disk_size', 'size'):
+            if field in required and values[field] is None:
+                errors[field] = f"This field is required for a {values['equipment_type']}."
+            elif field not in required and values[field] is not None:
+                errors[field] = f"This field must be empty for a {values['equipment_type']}."
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+
+class EquipmentRuleSerializer(ModelSerializer):
+    class Meta:
+        model = EquipmentRule
+        fields = '__all__'
+
+    def validate(self, attrs):
+        equipment_type = attrs.get('equipment_type', getattr(self.instance, 'equipment_type', None))
+        criteria = EquipmentSerializer.criteria_fields.get(equipment_type, ())
+        errors = {}
+        for field in ('memory', 'hard_disk_size'):
+            minimum = 'min_' + field
+            value = attrs[minimum] if minimum in attrs else getattr(self.instance, minimum, None)
+            if field not in criteria and value is not None:
+                errors[minimum] = f'This field must be empty for a {equipment_type}.'
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+
+class CompanyImportSerializer(CompanySerializer):
+    """
+    Company rows of an inventory import, which may set the id and the active flag
+    """
+    id = serializers.UUIDField(required=False)
+
+    class Meta(CompanySerializer.Meta):
+        read_only_fields = []
+
+
+class EmployeeImportSerializer(EmployeeSerializer):
+    """
+    Employee rows of an inventory import, which may set the id and the active flag.
+    Name unicity is left to the database constraint, checked once per batch.
+    """
+    id = serializers.UUIDField(required=False)
+
+    class Meta(EmployeeSerializer.Meta):
+        read_only_fields = ['pc_count', 'screen_count']
+        validators = []
+
+
+class EquipmentImportListSerializer(BulkListSerializer):
+    """
+    Equipment rows of an import, the used ones checked against the rules of their
+    holder like an assignment: the rows of the batch count for their employee on
+    top of the equipments it holds.
+    """
+
+    def validate_batch(self, validated):
+        errors = super().validate_batch(validated)
+        policy = EquipmentRule.policy()
+        held = {}
+        for attrs, error in zip(validated, errors):
+            employee = attrs.get('employee')
+            if employee is None or error:
+                continue
+            counts = held.setdefault(employee.pk, employee.equipment_counts())
+            equipment = Equipment(**{name: value for name, value in attrs.items() if name != 'employee'})
+            try:
+                equipment.check_holder(employee, counts, policy)
+            except ValueError as exc:
+                error['employee'] = [str(exc)]
+                continue
+            counts[equipment.equipment_type] += 1
+        return errors
+
+
+class EquipmentImportSerializer(EquipmentSerializer):
+    """
+    Equipment rows of an inventory import, which may set the id and the employee
+    holding a used equipment
+    """
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+    id = serializers.UUIDField(required=False)
+
+    class Meta(EquipmentSerializer.Meta):
+        read_only_fields = []
+        list_serializer_class = EquipmentImportListSerializer
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if attrs['status'] == EquipmentStatus.USED and attrs.get('employee') is None:
+            raise serializers.ValidationError({'employee': 'This field is required for a used equipment.'})
+        if attrs['status'] == EquipmentStatus.FREE and attrs.get('employee') is not None:
+            raise serializers.ValidationError({'employee': 'This field must be empty for a free equipment.'})
+        return attrs
+
+
+class AssignmentSerializer(serializers.Serializer):
+    equipment = serializers.UUIDField()
+    employee = serializers.UUIDField()
+
+
+class AllocationSerializer(serializers.Serializer):
+    employee = serializers.UUIDField()
+    equipment_type = serializers.ChoiceField(choices=TypeOfEquipment.choices)
+
+
+class AssignmentEventSerializer(ModelSerializer):
+    class Meta:
+        model = AssignmentEvent
+        fields = '__all__'
+
+
+class CompanyRoleSummarySerializer(ModelSerializer):
+    class Meta:
+        model = CompanyRoleSummary
+        fields = ['company', 'role', 'head_count', 'active_count', 'pc_count', 'screen_count']
+
+
+class ArchivedCompanySerializer(ModelSerializer):
+    class Meta:
+        model = ArchivedCompany
+        fields = '__all__'
+
+
+class ArchivedEmployeeSerializer(ModelSerializer):
+    class Meta:
+        model = ArchivedEmployee
+        fields = '__all__'
+
+
+class HolderQuerySerializer(serializers.Serializer):
+    at = serializers.DateTimeField(required=False)
+
+
+class PeriodQuerySerializer(serializers.Serializer):
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        if 'start' in attrs and 'end' in attrs and attrs['start'] > attrs['end']:
+            raise serializers.ValidationError({'end': 'The end of the period must follow its start.'})
+        return attrs
+
+
+class DateOrDateTimeField(serializers.DateTimeField):
+    """
+    A datetime, or a date (`YYYY-MM-DD`) kept as a date so a bound can cover the whole day
+    """
+
+    def to_internal_value(self, value):
+        try:
+            day = parse_date(value) if isinstance(value, str) else None
+        except ValueError:
+            day = None
+        if day is not None:
+            return day
+        return super().to_internal_value(value)
+
+
+class HiringWindowSerializer(serializers.Serializer):
+    start = DateOrDateTimeField(required=False)
+    end = DateOrDateTimeField(required=False)
+    bucket = serializers.ChoiceField(choices=['month', 'week'], required=False)
+
+    def validate(self, attrs):
+        """
+        Add the `created_at` range of the window: a start date from its first instant,
+        an end date up to the next day excluded, the datetimes as they are
+        """
+        window = {}
+        if 'start' in attrs:
+            window['created_at__gte'] = self.instant(attrs['start'])
+        if 'end' in attrs:
+            end = attrs['end']
+            if isinstance(end, datetime):
+                window['created_at__lte'] = end
+            else:
+                window['created_at__lt'] = self.instant(end + timedelta(days=1))
+        start = window.get('created_at__gte')
+        empty = start is not None and (
+            ('created_at__lte' in window and start > window['created_at__lte'])
+            or ('created_at__lt' in window and start >= window['created_at__lt'])
+        )
+        if empty:
+            raise serializers.ValidationError({'end': 'The end of the window must follow its start.'})
+        attrs['window'] = window
+        return attrs
+
+    @staticmethod
+    def instant(value):
+        if isinstance(value, datetime):
+            return value
+        return timezone.make_aware(datetime.combine(value, time.min))
@@ -1,13 +1,40 @@
+import csv
 import datetime
+import io
+import json
 import pytz
+import time
+import uuid
 from unittest import mock
 
+from asgiref.sync import async_to_sync
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import AsyncClient, AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from rest_framework import status
+from django.utils import timezone
+from rest_framework import serializers, status
 from rest_framework.test import APITestCase
 
-from base.models import EmployeeRole
-from management.models import Company, Employee, Equipment
+from api import async_views, views
+from api.inventory import InventoryImporter
+from base.cache import detail_cache
+from base.instrumentation import request_histogram
+from base.models import EmployeeRole, TypeOfEquipment
+from management.metrics import stock
+from management.models import (
+    ArchivedAssignmentEvent,
+    ArchivedCompany,
+    ArchivedEmployee,
+    AssignmentEvent,
+    Company,
+    CompanyRoleSummary,
+    Employee,
+    Equipment,
+    EquipmentRule
+)
 
 
 class CompanyTests(APITestCase):
@@ -25,6 +52,20 @@ class CompanyTests(APITestCase):
         self.assertEqual(Company.objects.get().name, 'LtuTech')
         self.assertEqual(Company.objects.get().active, False)
 
+    def test_bulk_create(self):
+        """
+        Ensure we can create many companies at once.
+        """
+        payload = [{'name': f'Company {i}'} for i in range(3)]
+        response = self.client.post(self.url_list, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.json()), 3)
+        self.assertEqual(Company.objects.count(), 3)
+
+        response = self.client.post(self.url_list, [{'name': 'Valid'}, {}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Company.objects.count(), 3)
+
     def test_toggle_company(self):
         """
         Ensure we can activate and desactivate a company.
@@ -42,6 +83,23 @@ class CompanyTests(APITestCase):
         )
         self.assertEqual(Company.objects.get().active, False)
 
+    @override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_STICKY_SECONDS=5)
+    def test_toggle_company_on_primary(self):
+        """
+        Ensure the activation, a GET that writes, reads from the primary and sticks the client to it.
+        """
+        company = Company.objects.create(**self.company_data)
+        url = reverse('company-activate', args=(company.id,))
+        # there is no replica1 database: a read routed to it would fail
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('coworking_primary_until', response.cookies)
+
+        response = async_to_sync(AsyncClient().get)(reverse('company-desactivate', args=(company.id,)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('coworking_primary_until', response.cookies)
+        self.assertEqual(Company.objects.get().active, False)
+
     def test_list(self):
         """
         Ensure we can get companies.
@@ -49,7 +107,45 @@ class CompanyTests(APITestCase):
         Company.objects.create(**self.company_data)
         response = self.client.get(self.url_list)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.json()), 1)
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_list_pagination(self):
+        """
+        Ensure cursors walk through all companies, forward and backward.
+        """
+        mocked = datetime.datetime(2022, 1, 1, tzinfo=pytz.utc)
+        with mock.patch('django.utils.timezone.now', mock.Mock(return_value=mocked)):
+            for i in range(3):
+                Company.objects.create(name=f'Same time {i}')
+        for i in range(4):
+            Company.objects.create(name=f'Company {i}')
+
+        names = []
+        url = self.url_list + '?page_size=3'
+        while url:
+            data = self.client.get(url).json()
+            self.assertLessEqual(len(data['results']), 3)
+            names += [company['name'] for company in data['results']]
+            previous, url = data['previous'], data['next']
+        expected = list(Company.objects.order_by('-created_at', '-id').values_list('name', flat=True))
+        self.assertEqual(names, expected)
+
+        data = self.client.get(previous).json()
+        self.assertEqual([company['name'] for company in data['results']], expected[3:6])
+
+    def test_list_max_page_size(self):
+        """
+        Ensure the requested page size is capped and bad cursors are rejected.
+        """
+        for i in range(3):
+            Company.objects.create(name=f'Company {i}')
+        with self.settings(PAGINATION_MAX_PAGE_SIZE=2):
+            data = self.client.get(self.url_list + '?page_size=50').json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertIsNotNone(data['next'])
+
+        response = self.client.get(self.url_list + '?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_get_company_detail(self):
         """
@@ -63,6 +159,79 @@ class CompanyTests(APITestCase):
         self.assertEqual(data['id'], str(company.id))
         self.assertEqual(data['name'], company.name)
 
+    def test_get_company_detail_cached(self):
+        """
+        Ensure company details are served from the cache until the company changes
+        """
+        company = Company.objects.create(**self.company_data)
+        url = reverse(self.url_detail, args=(company.id,))
+        detail_cache.reset_stats()
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.json()['name'], company.name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('company-activate', args=(company.id,)))
+        self.assertEqual(self.client.get(url).json()['active'], True)
+        stats = self.client.get(reverse('cache-stats')).json()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_conditional_get(self):
+        """
+        Ensure up to date clients get a 304 not modified answer
+        """
+        company = Company.objects.create(**self.company_data)
+        url = reverse(self.url_detail, args=(company.id,))
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('company-activate', args=(company.id,)))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # the page query only, the validators come from the page fetched
+        with CaptureQueriesContext(connection) as context:
+            list_etag = self.client.get(self.url_list)['ETag']
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertNotIn('COUNT(', context.captured_queries[0]['sql'])
+        # without serializing the list
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url_list, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        Company.objects.create(name='Other')
+        response = self.client.get(self.url_list, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # a change out of the page keeps its ETag
+        page_etag = self.client.get(self.url_list + '?page_size=1')['ETag']
+        Company.objects.filter(pk=company.pk).update(name='Renamed', updated_at=timezone.now())
+        response = self.client.get(self.url_list + '?page_size=1', HTTP_IF_NONE_MATCH=page_etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_export(self):
+        """
+        Ensure an empty CSV export still has its header, and the export is filtered like the list
+        """
+        response = self.client.get(reverse('company-export') + '?export_format=csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(content.splitlines(), ['id,created_at,updated_at,name,active'])
+
+        Company.objects.create(name='LtuTech', active=True)
+        Company.objects.create(name='Ltd Closed')
+        Company.objects.create(name='Other', active=True)
+        response = self.client.get(reverse('company-export') + '?active=true&search=Lt')
+        names = [json.loads(line)['name'] for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(names, ['LtuTech'])
+
     def test_delete_company(self):
         """
         Ensure we can delete a company
@@ -102,6 +271,66 @@ class EmployeeTests(APITestCase):
         )
         self.assertEqual(Employee.objects.get().active, False)
 
+    def test_filter(self):
+        """
+        Ensure employees can be filtered by company and searched by name prefix
+        """
+        company = Company.objects.create(**self.company_data)
+        Employee.objects.create(**self.employee_data, company=company)
+        other = Company.objects.create(name='Other', active=True)
+        Employee.objects.create(name='Sarah', surname='Marcu', role=EmployeeRole.DEV, company=other)
+        url = reverse('employee-list')
+
+        response = self.client.get(url + f'?company={other.id}')
+        self.assertEqual([item['name'] for item in response.json()['results']], ['Sarah'])
+        response = self.client.get(url + '?search=Rami Bel')
+        self.assertEqual([item['name'] for item in response.json()['results']], ['Rami'])
+        response = self.client.get(url + '?search=Mar')
+        self.assertEqual([item['name'] for item in response.json()['results']], ['Sarah'])
+        # the search is case sensitive
+        for search in ('bel', 'BEL', 'rAmi'):
+            response = self.client.get(url + f'?search={search}')
+            self.assertEqual(response.json()['results'], [], search)
+
+    def test_bulk_create(self):
+        """
+        Ensure a batch of employees checks all companies with one query
+        """
+        company = Company.objects.create(**self.company_data)
+        inactive = Company.objects.create(name='Closed')
+        payload = [
+            {'name': f'Name {i}', 'surname': 'Surname', 'role': 'dev', 'company': str(company.id)}
+            for i in range(5)
+        ]
+        payload.append({'name': 'Other', 'surname': 'Surname', 'role': 'dev', 'company': str(inactive.id)})
+
+        response = self.client.post(reverse('employee-list'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('The company of the new employee must be active', response.content.decode())
+        self.assertEqual(Employee.objects.count(), 0)
+
+        # companies, the uniqueness check of the batch, then the insert and the summary in a savepoint
+        with self.assertNumQueries(1 + 1 + 4):
+            response = self.client.post(reverse('employee-list') + '?partial=true', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(len(response.json()['created']), 5)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [5])
+        self.assertEqual(Employee.objects.count(), 5)
+
+        # duplicates inside a batch and existing employees are reported by index
+        payload = [{'name': 'Twin', 'surname': 'Surname', 'role': 'dev', 'company': str(company.id)}] * 2
+        payload.append({'name': 'Name 0', 'surname': 'Surname', 'role': 'dev', 'company': str(company.id)})
+        response = self.client.post(reverse('employee-list') + '?partial=true', payload, format='json')
+        self.assertEqual([error['index'] for error in response.json()['errors']], [1, 2])
+        self.assertEqual(Employee.objects.count(), 6)
+
+        payload[0] = {'name': 'New', 'surname': 'Surname', 'role': 'dev', 'company': str(company.id)}
+        response = self.client.post(reverse('employee-list'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()[0], {})
+        self.assertIn('must make a unique set', response.json()[2]['non_field_errors'][0])
+        self.assertEqual(Employee.objects.count(), 6)
+
 
 class EquipmentTests(APITestCase):
     company_data = {'name': 'LtuTech', 'active': True}
@@ -137,9 +366,74 @@ class EquipmentTests(APITestCase):
         "status": "free",
     }
 
+    def test_bulk_create(self):
+        """
+        Ensure a batch of equipments is checked against the equipment type criteria
+        """
+        payload = [self.equipment_data1, self.equipment_data2, dict(self.equipment_data1, memory=16)]
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('equipment-list'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('This field must be empty for a screen.', response.content.decode())
+
+        response = self.client.post(reverse('equipment-list') + '?partial=1', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(Equipment.objects.count(), 2)
+
+    def test_export(self):
+        """
+        Ensure the equipment export streams the same items as the list
+        """
+        Equipment.objects.create(**self.equipment_data1)
+        Equipment.objects.create(**self.equipment_data2)
+        url = reverse('equipment-export')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        listed = self.client.get(reverse('equipment-list')).json()['results']
+        self.assertEqual([json.loads(line) for line in lines], listed)
+
+        response = self.client.get(url + '?export_format=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['model'] for row in rows], ['HP', 'ACER'])
+        self.assertEqual(rows[0]['size'], '')
+
+        response = self.client.get(url + '?export_format=xml')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter(self):
+        """
+        Ensure equipments can be filtered, searched and ordered
+        """
+        Equipment.objects.create(**self.equipment_data1)
+        Equipment.objects.create(**self.equipment_data2)
+        Equipment.objects.create(**dict(self.equipment_data2, memory=16, model='Dell'))
+        url = reverse('equipment-list')
+
+        def models(query):
+            response = self.client.get(url + query)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return [item['model'] for item in response.json()['results']]
+
+        self.assertEqual(models('?status=free&equipment_type=pc&memory__gte=32'), ['HP'])
+        self.assertEqual(models('?employee__isnull=true&equipment_type=screen'), ['ACER'])
+        self.assertEqual(models('?search=D'), ['Dell'])
+        self.assertEqual(models('?ordering=model'), ['ACER', 'Dell', 'HP'])
+        self.assertEqual(models('?ordering=-model&page_size=2'), ['HP', 'Dell'])
+
+        next_url = self.client.get(url + '?ordering=-model&page_size=2').json()['next']
+        self.assertEqual([item['model'] for item in self.client.get(next_url).json()['results']], ['ACER'])
+
+        for query in ('?memory__gte=a lot', '?status=broken', '?ordering=memory'):
+            self.assertEqual(self.client.get(url + query).status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_employee_equipment_assign(self):
         """
-        Ensure we can assign an equipment to an employee
+        Ensure we can assign an equipment to an employee, unless it breaks the rules of its role
         """
         company = Company.objects.create(**self.company_data)
         self.employee_data1.update({'company': company})
@@ -155,6 +449,118 @@ class EquipmentTests(APITestCase):
         equipment = Equipment.objects.get(pk=equipment.id)
         self.assertEqual(equipment.employee, employee)
 
+        # an intern may only hold one screen
+        screen = Equipment.objects.create(**self.equipment_data1)
+        response = self.client.post(reverse('employee-equipment-assign', args=(screen.id, employee.id)))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('detail', response.json())
+        self.assertEqual(Equipment.objects.get(pk=screen.id).employee, None)
+
+    def test_employee_equipment_assign_queries(self):
+        """
+        Ensure the assign path runs a fixed number of queries whatever the rules
+        """
+        company = Company.objects.create(**self.company_data)
+        self.employee_data1.update({'company': company})
+        employee = Employee.objects.create(**self.employee_data1)
+        screen = Equipment.objects.create(**self.equipment_data1)
+        pc = Equipment.objects.create(**self.equipment_data2)
+        self.client.post(reverse('employee-equipment-assign', args=(screen.id, employee.id)))
+
+        # the version of the rules, then in a savepoint: the locked employee, the equipment, its conditional
+        # update, the counter, its summary and the event
+        with self.assertNumQueries(1 + 8):
+            response = self.client.post(reverse('employee-equipment-assign', args=(pc.id, employee.id)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_allocate(self):
+        """
+        Ensure a tech lead is given a free PC matching its rules
+        """
+        company = Company.objects.create(**self.company_data)
+        employee = Employee.objects.create(**dict(self.employee_data2, company=company))
+        Equipment.objects.create(**dict(self.equipment_data2, memory=16, model='Small'))
+        pc = Equipment.objects.create(**self.equipment_data2)
+        url = reverse('equipment-allocate')
+
+        response = self.client.post(url, {'employee': employee.id, 'equipment_type': 'pc'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['id'], str(pc.id))
+        pc.refresh_from_db()
+        self.assertEqual(pc.employee, employee)
+        employee.refresh_from_db()
+        self.assertEqual(employee.pc_count, 1)
+
+        response = self.client.post(url, {'employee': employee.id, 'equipment_type': 'pc'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {'employee': employee.id, 'equipment_type': 'screen'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {'employee': company.id, 'equipment_type': 'pc'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_bulk_assign(self):
+        """
+        Ensure a batch is checked against the rules, including its own earlier items
+        """
+        company = Company.objects.create(**self.company_data)
+        self.employee_data1.update({'company': company})
+        intern = Employee.objects.create(**self.employee_data1)
+        screens = [Equipment.objects.create(**self.equipment_data1) for _ in range(2)]
+        pc = Equipment.objects.create(**self.equipment_data2)
+        payload = [
+            {'equipment': str(screens[0].id), 'employee': str(intern.id)},
+            {'equipment': str(screens[1].id), 'employee': str(intern.id)},
+            {'equipment': str(pc.id), 'employee': str(intern.id)},
+            {'equipment': str(pc.id), 'employee': str(intern.id)},
+        ]
+
+        # the rules are compiled once per process, then only their version is read
+        EquipmentRule.policy()
+        # the version of the rules, then in a savepoint: the locked employees and equipments, the equipments,
+        # counters and summary updates, the events
+        with self.assertNumQueries(1 + 8):
+            response = self.client.post(reverse('equipment-bulk-assign'), payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['success'] for item in response.json()], [True, False, True, False])
+        intern.refresh_from_db()
+        self.assertEqual(intern.equipment_counts(), {'pc': 1, 'screen': 1})
+
+        payload = [
+            {'equipment': str(screens[0].id), 'employee': str(intern.id)},
+            {'equipment': str(screens[1].id), 'employee': str(intern.id)},
+        ]
+        response = self.client.post(reverse('equipment-bulk-revoke'), payload, format='json')
+        self.assertEqual([item['success'] for item in response.json()], [True, False])
+        intern.refresh_from_db()
+        self.assertEqual(intern.equipment_counts(), {'pc': 1, 'screen': 0})
+
+        response = self.client.post(reverse('equipment-bulk-revoke'), [{'equipment': 'x'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_equipment_detail_cache_invalidation(self):
+        """
+        Ensure cached equipment and employee details follow the assignments
+        """
+        company = Company.objects.create(**self.company_data)
+        self.employee_data1.update({'company': company})
+        employee = Employee.objects.create(**self.employee_data1)
+        equipment = Equipment.objects.create(**self.equipment_data1)
+        equipment_url = reverse('equipment-detail', args=(equipment.id,))
+        employee_url = reverse('employee-detail', args=(employee.id,))
+        self.client.get(equipment_url)
+        self.client.get(employee_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('employee-equipment-assign', args=(equipment.id, employee.id)))
+        self.assertEqual(self.client.get(equipment_url).json()['employee'], str(employee.id))
+        self.assertEqual(self.client.get(employee_url).json()['screen_count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('employee-equipment-revoke-all', args=(employee.id,)))
+        self.assertEqual(self.client.get(equipment_url).json()['employee'], None)
+        self.assertEqual(self.client.get(employee_url).json()['screen_count'], 0)
+
     def test_employee_equipment_revoke(self):
         """
         Ensure we can revoke an equipment from an employee
@@ -177,6 +583,67 @@ class EquipmentTests(APITestCase):
         equipment = Equipment.objects.get(pk=equipment.id)
         self.assertEqual(equipment.employee, None)
 
+    def test_employee_equipment_revoke_queries(self):
+        """
+        Ensure a revoke only runs the counter and the conditional equipment updates, then inserts its event
+        """
+        company = Company.objects.create(**self.company_data)
+        employee = Employee.objects.create(**dict(self.employee_data1, company=company))
+        equipment = Equipment.objects.create(**self.equipment_data1)
+        self.client.post(reverse('employee-equipment-assign', args=(equipment.id, employee.id)))
+
+        # the counter, its summary and the equipment updates, then the event in a savepoint,
+        # the metrics use the role and type returned by the updates
+        with self.assertNumQueries(6), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('employee-equipment-revoke', args=(equipment.id, employee.id)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        employee.refresh_from_db()
+        self.assertEqual(employee.equipment_counts(), {TypeOfEquipment.PC: 0, TypeOfEquipment.SCREEN: 0})
+
+    def test_employee_equipment_revoke_errors(self):
+        """
+        Ensure a failed revoke leaves the counters untouched
+        """
+        company = Company.objects.create(**self.company_data)
+        employee = Employee.objects.create(**dict(self.employee_data1, company=company))
+        other = Employee.objects.create(**dict(self.employee_data2, company=company))
+        equipment = Equipment.objects.create(**self.equipment_data1)
+        self.client.post(reverse('employee-equipment-assign', args=(equipment.id, employee.id)))
+
+        response = self.client.post(reverse('employee-equipment-revoke', args=(equipment.id, other.id)))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'detail': 'The employee is not assigned to this equipment'})
+        response = self.client.post(reverse('employee-equipment-revoke', args=(uuid.uuid4(), employee.id)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(reverse('employee-equipment-revoke', args=(equipment.id, uuid.uuid4())))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        employee.refresh_from_db()
+        self.assertEqual(employee.screen_count, 1)
+        self.assertEqual(Equipment.objects.get(pk=equipment.id).employee_id, employee.id)
+
+    def test_employee_equipment_revoke_all_queries(self):
+        """
+        Ensure revoke-all resets the counters, then frees the equipments held and records them in one statement each
+        """
+        company = Company.objects.create(**self.company_data)
+        employee = Employee.objects.create(**dict(self.employee_data1, company=company))
+        for data in (self.equipment_data1, self.equipment_data2):
+            equipment = Equipment.objects.create(**data)
+            self.client.post(reverse('employee-equipment-assign', args=(equipment.id, employee.id)))
+
+        # in a savepoint: the counters, the ids of the equipments held, their update, their events and the summary
+        with self.assertNumQueries(7):
+            response = self.client.post(reverse('employee-equipment-revoke-all', args=(employee.id,)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # nothing left to free
+        with self.assertNumQueries(4):
+            response = self.client.post(reverse('employee-equipment-revoke-all', args=(employee.id,)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.post(reverse('employee-equipment-revoke-all', args=(uuid.uuid4(),)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_employee_equipment_revoke_all(self):
         """
         Ensure we can revoke all employee's equipments
@@ -227,11 +694,11 @@ class EquipmentTests(APITestCase):
             reverse('employee-equipment-list', args=(employee.id,))
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.json()), 2)
+        self.assertEqual(len(response.json()['results']), 2)
 
-    def test_employees_lastyear(self):
+    def test_techleads_hired_last_year(self):
         """
-        Ensure we can get only employees of the last year
+        Ensure we can get only the tech leads hired in the last year
         """
         company = Company.objects.create(**self.company_data)
         self.employee_data2.update({'company': company})
@@ -243,8 +710,745 @@ class EquipmentTests(APITestCase):
             employee3 = Employee.objects.create(**self.employee_data3)
             self.assertEqual(employee3.created_at, mocked)
 
-        response = self.client.get(reverse('employee-last-year'))
-        self.assertEqual(len(response.json()), 1)
-        data = response.json()
+        start = timezone.now() - datetime.timedelta(days=365)
+        response = self.client.get(reverse('employee-hired'), {'role': 'techlead', 'start': start.isoformat()})
+        self.assertEqual(len(response.json()['results']), 1)
+        data = response.json()['results']
         self.assertEqual(data[0]['name'], employee2.name)
         self.assertEqual(data[0]['surname'], employee2.surname)
+
+
+class EquipmentRuleTests(APITestCase):
+
+    def test_create_rule(self):
+        """
+        Ensure rules can be declared for a role, with criteria matching the type of equipment
+        """
+        url = reverse('equipment-rule-list')
+        response = self.client.post(url, {'role': 'cto', 'equipment_type': 'screen', 'min_memory': 8}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'role': 'cto', 'equipment_type': 'pc', 'min_memory': 64}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        condition = EquipmentRule.policy()['cto'].suitable_equipment('pc', {'pc': 3})
+        self.assertEqual(condition.children, [('memory__gte', 64)])
+
+        response = self.client.get(url + '?role=cto')
+        self.assertEqual(len(response.json()['results']), 1)
+
+
+class AssignmentLedgerTests(APITestCase):
+
+    def setUp(self):
+        company = Company.objects.create(name='LtuTech', active=True)
+        self.first = Employee.objects.create(
+            name='Rami', surname='Belgacem', active=True, role=EmployeeRole.IT, company=company
+        )
+        self.second = Employee.objects.create(
+            name='Sarah', surname='Marcu', active=True, role=EmployeeRole.IT, company=company
+        )
+        self.screen = Equipment.objects.create(equipment_type='screen', size=24, model='ACER', status='free')
+        self.pc = Equipment.objects.create(
+            equipment_type='pc', memory=32, hard_disk_size=512, model='HP', status='free'
+        )
+
+    def post(self, name, *args):
+        response = self.client.post(reverse(name, args=args))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return timezone.now()
+
+    def holder(self, equipment, at):
+        return self.client.get(reverse('equipment-holder', args=(equipment.id,)), {'at': at.isoformat()}).json()
+
+    def holdings(self, employee, **period):
+        params = {name: value.isoformat() for name, value in period.items()}
+        response = self.client.get(reverse('employee-holdings', args=(employee.id,)), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(item['operation'], item['equipment']) for item in response.json()['results']]
+
+    def test_holder_at(self):
+        """
+        Ensure the holder of an equipment is known at any time of its history
+        """
+        before = timezone.now()
+        assigned = self.post('employee-equipment-assign', self.screen.id, self.first.id)
+        revoked = self.post('employee-equipment-revoke', self.screen.id, self.first.id)
+        reassigned = self.post('employee-equipment-assign', self.screen.id, self.second.id)
+
+        self.assertEqual(self.holder(self.screen, before)['employee'], None)
+        self.assertEqual(self.holder(self.screen, assigned)['employee'], str(self.first.id))
+        self.assertEqual(self.holder(self.screen, revoked)['employee'], None)
+        data = self.holder(self.screen, reassigned)
+        self.assertEqual(data['employee'], str(self.second.id))
+        self.assertIsNotNone(data['held_since'])
+        self.assertEqual(
+            self.client.get(reverse('equipment-holder', args=(self.screen.id,))).json()['employee'],
+            str(self.second.id)
+        )
+
+        response = self.client.get(reverse('equipment-holder', args=(self.screen.id,)), {'at': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('equipment-holder', args=(uuid.uuid4(),)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # one index seek in the ledger
+        with self.assertNumQueries(1):
+            self.holder(self.screen, revoked)
+
+    def test_holdings(self):
+        """
+        Ensure the holdings of an employee overlapping a period are listed, closed ones with their start
+        """
+        self.post('employee-equipment-assign', self.screen.id, self.first.id)
+        self.post('employee-equipment-assign', self.pc.id, self.first.id)
+        revoked = self.post('employee-equipment-revoke', self.screen.id, self.first.id)
+        later = self.post('employee-equipment-assign', self.screen.id, self.second.id)
+
+        screen, pc = str(self.screen.id), str(self.pc.id)
+        self.assertEqual(self.holdings(self.first), [('revoke', screen), ('assign', pc)])
+        self.assertEqual(self.holdings(self.first, start=later), [('assign', pc)])
+        self.assertEqual(self.holdings(self.second, end=revoked), [])
+        self.assertEqual(self.holdings(self.second, start=revoked, end=later), [('assign', screen)])
+
+        closed = self.client.get(reverse('employee-holdings', args=(self.first.id,))).json()['results'][0]
+        self.assertLess(closed['held_since'], closed['created_at'])
+
+        # revoke-all closes every holding with one insert
+        self.post('employee-equipment-revoke-all', self.first.id)
+        self.assertCountEqual(self.holdings(self.first), [('revoke', pc), ('revoke', screen)])
+        self.assertTrue(all(
+            item['held_since'] for item in
+            self.client.get(reverse('employee-holdings', args=(self.first.id,))).json()['results']
+        ))
+
+        response = self.client.get(
+            reverse('employee-holdings', args=(self.first.id,)),
+            {'start': later.isoformat(), 'end': revoked.isoformat()}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_holdings_pagination(self):
+        """
+        Ensure the holdings are paginated with a cursor
+        """
+        for equipment in (self.screen, self.pc):
+            self.post('employee-equipment-assign', equipment.id, self.first.id)
+
+        response = self.client.get(reverse('employee-holdings', args=(self.first.id,)), {'page_size': 1})
+        page = response.json()
+        self.assertEqual([item['equipment'] for item in page['results']], [str(self.pc.id)])
+        page = self.client.get(page['next']).json()
+        self.assertEqual([item['equipment'] for item in page['results']], [str(self.screen.id)])
+        self.assertIsNone(page['next'])
+
+    def test_deletions_close_holdings(self):
+        """
+        Ensure deleting an equipment or an employee closes its holdings in the ledger
+        """
+        self.post('employee-equipment-assign', self.screen.id, self.first.id)
+        self.post('employee-equipment-assign', self.pc.id, self.second.id)
+
+        self.client.delete(reverse('equipment-detail', args=(self.screen.id,)))
+        self.assertEqual(self.holdings(self.first), [('revoke', str(self.screen.id))])
+        self.client.delete(reverse('employee-detail', args=(self.second.id,)))
+        self.assertEqual(self.holdings(self.second), [('revoke', str(self.pc.id))])
+        self.assertEqual(self.holder(self.pc, timezone.now())['employee'], None)
+
+
+class InventorySummaryTests(APITestCase):
+
+    def setUp(self):
+        cache.delete_many(list(stock.keys()))
+        self.company = Company.objects.create(name='LtuTech', active=True)
+        self.other = Company.objects.create(name='Other', active=True)
+        self.intern = Employee.objects.create(
+            name='Rami', surname='Belgacem', active=True, role=EmployeeRole.INTERN, company=self.company
+        )
+        self.dev = Employee.objects.create(
+            name='Sarah', surname='Marcu', role=EmployeeRole.DEV, company=self.company
+        )
+        self.screen = Equipment.objects.create(equipment_type='screen', size=24, model='ACER', status='free')
+        self.pc = Equipment.objects.create(
+            equipment_type='pc', memory=32, hard_disk_size=512, model='HP', status='free'
+        )
+
+    def totals(self):
+        return {
+            (row[0], row[1]): row[2:] for row in CompanyRoleSummary.objects.values_list(
+                'company', 'role', *CompanyRoleSummary.total_fields
+            )
+        }
+
+    def assertSummaryRebuilt(self):
+        totals = self.totals()
+        CompanyRoleSummary.rebuild()
+        self.assertEqual(totals, self.totals())
+
+    def test_summary(self):
+        """
+        Ensure the summary gives the totals per company and role, per role and the equipments per type
+        """
+        self.client.post(reverse('employee-equipment-assign', args=(self.screen.id, self.intern.id)))
+        self.client.post(reverse('employee-equipment-assign', args=(self.pc.id, self.intern.id)))
+
+        response = self.client.get(reverse('inventory-summary'), {'company': str(self.company.id)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        cells = {item['role']: item for item in data['results']}
+        self.assertEqual(len(cells), len(EmployeeRole.values))
+        self.assertEqual(cells['intern'], {
+            'company': str(self.company.id), 'role': 'intern',
+            'head_count': 1, 'active_count': 1, 'pc_count': 1, 'screen_count': 1,
+        })
+        self.assertEqual((cells['dev']['head_count'], cells['dev']['active_count']), (1, 0))
+        roles = {item['role']: item for item in data['roles']}
+        self.assertEqual(roles['intern']['pc_count'], 1)
+        self.assertEqual(data['equipments'], [
+            {'equipment_type': 'pc', 'free': 0, 'used': 1},
+            {'equipment_type': 'screen', 'free': 0, 'used': 1},
+        ])
+
+        page = self.client.get(reverse('inventory-summary'), {'page_size': 4}).json()
+        self.assertEqual(len(page['results']), 4)
+        self.assertIn('roles', page)
+        next_url = page['next']
+        # the next pages only read their rows, the stock is cached
+        with self.assertNumQueries(1):
+            page = self.client.get(next_url).json()
+        self.assertEqual(len(page['results']), 4)
+        self.assertNotIn('roles', page)
+        self.assertEqual(len(page['equipments']), 2)
+
+        # the page and the totals per role
+        with self.assertNumQueries(2):
+            self.client.get(reverse('inventory-summary'))
+
+    def test_summary_follows_writes(self):
+        """
+        Ensure the summary shifted by every write matches the one rebuilt from the employees
+        """
+        self.client.post(reverse('employee-equipment-assign', args=(self.screen.id, self.intern.id)))
+        self.client.get(reverse('employee-activate', args=(self.dev.id,)))
+        self.client.post(reverse('equipment-bulk-assign'), [
+            {'equipment': str(self.pc.id), 'employee': str(self.dev.id)},
+        ], format='json')
+        self.assertSummaryRebuilt()
+
+        self.client.post(reverse('employee-equipment-revoke', args=(self.screen.id, self.intern.id)))
+        self.client.post(reverse('employee-equipment-revoke-all', args=(self.dev.id,)))
+        self.client.post(reverse('employee-list'), [
+            {'name': f'Name {i}', 'surname': 'Surname', 'role': 'it', 'company': str(self.other.id)}
+            for i in range(3)
+        ], format='json')
+        self.client.patch(
+            reverse('employee-detail', args=(self.intern.id,)),
+            {'role': 'dev', 'company': str(self.other.id)}, format='json'
+        )
+        self.assertSummaryRebuilt()
+
+        self.client.post(reverse('equipment-allocate'), {'employee': self.intern.id, 'equipment_type': 'pc'},
+                         format='json')
+        self.client.delete(reverse('employee-detail', args=(self.dev.id,)))
+        self.client.delete(reverse('equipment-detail', args=(self.pc.id,)))
+        self.client.post(reverse('company-list'), [{'name': 'New'}], format='json')
+        self.assertSummaryRebuilt()
+        self.assertEqual(CompanyRoleSummary.objects.count(), 3 * len(EmployeeRole.values))
+
+
+class HiringWindowTests(APITestCase):
+
+    def setUp(self):
+        self.company = Company.objects.create(name='LtuTech', active=True)
+        self.other = Company.objects.create(name='Other', active=True)
+        self.hired = {}
+        for name, role, company, active, created_at in (
+            ('intern-2023', EmployeeRole.INTERN, self.company, True, datetime.datetime(2023, 3, 6, 10)),
+            ('intern-new-year', EmployeeRole.INTERN, self.company, False, datetime.datetime(2023, 12, 31, 18)),
+            ('dev-2024', EmployeeRole.DEV, self.company, True, datetime.datetime(2024, 1, 3, 9)),
+            ('intern-2024', EmployeeRole.INTERN, self.other, True, datetime.datetime(2024, 1, 15, 12)),
+            ('dev-2022', EmployeeRole.DEV, self.other, True, datetime.datetime(2022, 6, 1, 8)),
+        ):
+            moment = created_at.replace(tzinfo=datetime.timezone.utc)
+            with mock.patch('django.utils.timezone.now', mock.Mock(return_value=moment)):
+                self.hired[name] = Employee.objects.create(
+                    name=name, surname='Hired', role=role, company=company, active=active
+                )
+
+    def names(self, **params):
+        response = self.client.get(reverse('employee-hired'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [employee['name'] for employee in response.json()['results']]
+
+    def test_window(self):
+        """
+        Ensure the window filters any role, company and active flag, most recent first
+        """
+        self.assertEqual(len(self.names()), 5)
+        self.assertEqual(self.names(role='intern'), ['intern-2024', 'intern-new-year', 'intern-2023'])
+        self.assertEqual(self.names(role__in='intern,dev', company=self.other.id), ['intern-2024', 'dev-2022'])
+        self.assertEqual(self.names(role='intern', active='true'), ['intern-2024', 'intern-2023'])
+
+    def test_bounds(self):
+        """
+        Ensure a date end bound covers its whole day, and a datetime bound is exact
+        """
+        self.assertEqual(self.names(role='intern', start='2023-01-01', end='2023-12-31'),
+                         ['intern-new-year', 'intern-2023'])
+        self.assertEqual(self.names(start='2023-12-31T18:00:00Z', end='2024-01-03T09:00:00Z'),
+                         ['dev-2024', 'intern-new-year'])
+        self.assertEqual(self.names(start='2024-01-15'), ['intern-2024'])
+        self.assertEqual(self.names(end='2022-06-01'), ['dev-2022'])
+
+        for params in ({'start': '2024-01-02', 'end': '2024-01-01'}, {'start': '2024-13-01'}, {'bucket': 'day'}):
+            response = self.client.get(reverse('employee-hired'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_buckets(self):
+        """
+        Ensure the hires are counted per month or week of the whole window, whatever the page
+        """
+        url = reverse('employee-hired')
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'start': '2023-01-01', 'bucket': 'month', 'page_size': 1})
+        data = response.json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['buckets'], [
+            {'period': '2023-03-01', 'count': 1},
+            {'period': '2023-12-01', 'count': 1},
+            {'period': '2024-01-01', 'count': 2},
+        ])
+
+        response = self.client.get(url, {'start': '2023-12-25', 'bucket': 'week'})
+        self.assertEqual(response.json()['buckets'], [
+            {'period': '2023-12-25', 'count': 1},
+            {'period': '2024-01-01', 'count': 1},
+            {'period': '2024-01-15', 'count': 1},
+        ])
+        self.assertNotIn('buckets', self.client.get(url).json())
+
+    def test_pagination(self):
+        """
+        Ensure the window is paginated with a cursor
+        """
+        url = reverse('employee-hired') + '?start=2023-01-01&page_size=2'
+        names = []
+        while url:
+            data = self.client.get(url).json()
+            names += [employee['name'] for employee in data['results']]
+            url = data['next']
+        self.assertEqual(names, ['intern-2024', 'dev-2024', 'intern-new-year', 'intern-2023'])
+
+
+class ArchiveTests(APITestCase):
+
+    def setUp(self):
+        cache.delete_many(list(stock.keys()))
+        self.closed = Company.objects.create(name='Closed', active=True)
+        self.company = Company.objects.create(name='LtuTech', active=True)
+        self.holder = Employee.objects.create(
+            name='Rami', surname='Belgacem', active=True, role=EmployeeRole.IT, company=self.closed
+        )
+        self.left = Employee.objects.create(name='Sarah', surname='Marcu', role=EmployeeRole.DEV, company=self.closed)
+        self.gone = Employee.objects.create(
+            name='Paul', surname='Durand', active=True, role=EmployeeRole.DEV, company=self.company
+        )
+        self.staying = Employee.objects.create(
+            name='Anna', surname='Petit', active=True, role=EmployeeRole.DEV, company=self.company
+        )
+        self.pc = Equipment.objects.create(
+            equipment_type='pc', memory=32, hard_disk_size=512, model='HP', status='free'
+        )
+        self.screen = Equipment.objects.create(equipment_type='screen', size=24, model='ACER', status='free')
+        self.client.post(reverse('employee-equipment-assign', args=(self.pc.id, self.holder.id)))
+        self.client.post(reverse('employee-equipment-assign', args=(self.screen.id, self.gone.id)))
+
+        long_ago = timezone.now() - datetime.timedelta(days=400)
+        Company.objects.filter(pk=self.closed.pk).update(active=False, updated_at=long_ago)
+        Employee.objects.filter(pk=self.gone.pk).update(active=False, updated_at=long_ago)
+        # the updates bypass the signals keeping the summary
+        CompanyRoleSummary.rebuild()
+        self.before = timezone.now() - datetime.timedelta(days=365)
+
+    def archive(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(ArchivedCompany.archive_inactive(self.before), (1, 2, 2))
+            self.assertEqual(ArchivedEmployee.archive_inactive(self.before), (1, 2))
+            self.assertEqual(ArchivedCompany.archive_inactive(self.before), (0, 0, 0))
+
+    def assertSummaryRebuilt(self):
+        totals = list(CompanyRoleSummary.objects.order_by('company', 'role').values_list(
+            'company', 'role', *CompanyRoleSummary.total_fields
+        ))
+        CompanyRoleSummary.rebuild()
+        self.assertEqual(totals, list(CompanyRoleSummary.objects.order_by('company', 'role').values_list(
+            'company', 'role', *CompanyRoleSummary.total_fields
+        )))
+
+    def test_archive(self):
+        """
+        Ensure the long inactive companies and employees leave the live tables with their assignment events
+        """
+        recent = Company.objects.create(name='Recently closed')
+        self.archive()
+
+        self.assertCountEqual(Company.objects.values_list('pk', flat=True), [self.company.pk, recent.pk])
+        self.assertEqual(list(Employee.objects.values_list('pk', flat=True)), [self.staying.pk])
+        self.assertCountEqual(
+            ArchivedEmployee.objects.values_list('pk', 'company'),
+            [(self.holder.pk, self.closed.pk), (self.left.pk, self.closed.pk), (self.gone.pk, self.company.pk)],
+        )
+        self.assertFalse(AssignmentEvent.objects.exists())
+        self.assertEqual(ArchivedAssignmentEvent.objects.filter(operation='revoke').count(), 2)
+        self.assertFalse(Equipment.objects.filter(status='used').exists())
+        self.assertEqual(stock.counts()[('pc', 'used')], 0)
+        self.assertFalse(CompanyRoleSummary.objects.filter(company=self.closed.pk).exists())
+        self.assertSummaryRebuilt()
+
+        response = self.client.get(reverse('employee-detail', args=(self.holder.id,)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('employee-archived'), {'company': str(self.closed.id)})
+        self.assertEqual(len(response.json()['results']), 2)
+        response = self.client.get(reverse('company-archived'))
+        self.assertEqual([company['name'] for company in response.json()['results']], ['Closed'])
+
+    def test_restore(self):
+        """
+        Ensure archived companies and employees are restored with their assignment events
+        """
+        self.archive()
+        response = self.client.post(reverse('employee-restore', args=(self.holder.id,)))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(reverse('company-restore', args=(self.company.id,)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.post(reverse('employee-restore', args=(self.gone.id,)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['screen_count'], 0)
+        self.assertEqual(AssignmentEvent.holdings(self.gone.pk).count(), 1)
+        self.assertSummaryRebuilt()
+
+        response = self.client.post(reverse('company-restore', args=(self.closed.id,)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.json()['active'])
+        self.assertEqual(Employee.objects.filter(company=self.closed).count(), 2)
+        self.assertEqual(AssignmentEvent.objects.count(), 4)
+        self.assertFalse(ArchivedEmployee.objects.exists() or ArchivedAssignmentEvent.objects.exists())
+        self.assertGreater(Company.objects.get(pk=self.closed.pk).updated_at, self.before)
+        self.assertEqual(CompanyRoleSummary.objects.filter(company=self.closed.pk).count(), len(EmployeeRole.values))
+        self.assertSummaryRebuilt()
+        # restored recently, they are not archived again
+        self.assertEqual(ArchivedCompany.archive_inactive(self.before), (0, 0, 0))
+
+    def test_restore_taken_name(self):
+        """
+        Ensure an employee is not restored when a live employee took its name
+        """
+        self.archive()
+        Employee.objects.create(name='Paul', surname='Durand', role=EmployeeRole.IT, company=self.company)
+        response = self.client.post(reverse('employee-restore', args=(self.gone.id,)))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(ArchivedEmployee.objects.filter(pk=self.gone.pk).exists())
+
+
+class AsyncViewTests(APITestCase):
+    """
+    Ensure the async read views answer like the synchronous ones.
+    """
+
+    def setUp(self):
+        company = Company.objects.create(name='LtuTech', active=True)
+        self.employee = Employee.objects.create(
+            name='Rami', surname='Belgacem', active=True, role=EmployeeRole.DEV, company=company
+        )
+        self.screen = Equipment.objects.create(
+            equipment_type='screen', size=24, model='ACER', status='used', employee=self.employee
+        )
+        Equipment.objects.create(equipment_type='pc', memory=32, hard_disk_size=512, model='HP', status='free')
+
+    def call(self, view, path, method='get', data=None, **kwargs):
+        request = getattr(AsyncRequestFactory(), method)(path, data, content_type='application/json')
+        return async_to_sync(view)(request, **kwargs)
+
+    def assertSameResponse(self, view, path, **kwargs):
+        expected = self.client.get(path)
+        response = self.call(view, path, **kwargs)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response.get('ETag'), expected.get('ETag'))
+
+    def test_lists(self):
+        url = reverse('equipment-list')
+        self.assertSameResponse(async_views.EquipmentList.as_view(), url + '?page_size=1')
+        self.assertSameResponse(async_views.EquipmentList.as_view(), url + '?equipment_type=pc')
+        self.assertSameResponse(async_views.EmployeeList.as_view(), reverse('employee-list') + '?search=Ra')
+        self.assertSameResponse(
+            async_views.employee_equipment_list, reverse('employee-equipment-list', args=(self.employee.id,)),
+            employee_id=self.employee.id
+        )
+
+        response = self.call(async_views.EquipmentList.as_view(), url + '?status=broken')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_details(self):
+        for view, obj, name in (
+            (async_views.EquipmentDetail.as_view(), self.screen, 'equipment-detail'),
+            (async_views.EmployeeDetail.as_view(), self.employee, 'employee-detail'),
+        ):
+            url = reverse(name, args=(obj.id,))
+            self.assertSameResponse(view, url, pk=obj.id)
+            # and once more from the detail cache
+            self.assertSameResponse(view, url, pk=obj.id)
+
+        response = self.call(async_views.EmployeeDetail.as_view(), '/', pk=self.screen.id)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_other_methods(self):
+        """
+        Ensure the writes are handed over to the DRF views.
+        """
+        response = self.call(
+            async_views.EquipmentList.as_view(), reverse('equipment-list'), method='post',
+            data={'equipment_type': 'screen', 'size': 27, 'model': 'DELL', 'status': 'free'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Equipment.objects.count(), 3)
+
+
+class InventoryImportTests(APITestCase):
+    csv_content = '\n'.join([
+        'kind,name,surname,active,role,company,equipment_type,memory,hard_disk_size,size,model,status,employee',
+        'company,LtuTech,,true,,,,,,,,,',
+        'employee,Rami,Belgacem,true,dev,LtuTech,,,,,,,',
+        'employee,Jean Pierre,Martin,true,intern,LtuTech,,,,,,,',
+        'employee,Sarah,Marcu,true,dev,Unknown,,,,,,,',
+        'equipment,,,,,,pc,16,256,,HP,used,Rami Belgacem',
+        'equipment,,,,,,screen,,,24,ACER,used,Jean Pierre Martin',
+        'equipment,,,,,,screen,16,,24,ACER,free,',
+        'unknown,,,,,,,,,,,,',
+    ])
+
+    def upload(self, content, name='inventory.csv'):
+        upload = SimpleUploadedFile(name, content.encode())
+        return self.client.post(reverse('inventory-import'), {'file': upload}, format='multipart')
+
+    def test_import(self):
+        """
+        Ensure the valid rows are imported with their references and the others reported
+        """
+        response = self.upload(self.csv_content)
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        report = response.json()
+        self.assertEqual(report['rows'], 8)
+        self.assertEqual(report['created'], {'company': 1, 'employee': 2, 'equipment': 2})
+        self.assertEqual([error['line'] for error in report['errors']], [5, 8, 9])
+
+        employee = Employee.objects.get(name='Jean Pierre')
+        self.assertEqual(employee.company.name, 'LtuTech')
+        self.assertEqual(employee.equipment_counts(), {'pc': 0, 'screen': 1})
+        self.assertEqual(Employee.objects.get(name='Rami').equipment_counts(), {'pc': 1, 'screen': 0})
+
+    def test_import_existing_references(self):
+        """
+        Ensure rows can reference the objects of the database by id
+        """
+        company = Company.objects.create(name='LtuTech', active=True)
+        content = json.dumps({
+            'kind': 'employee', 'name': 'Rami', 'surname': 'Belgacem', 'role': 'dev', 'company': str(company.id)
+        })
+        response = self.upload(content + '\n' + content, name='inventory.ndjson')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.json()['created']['employee'], 1)
+        self.assertEqual(response.json()['errors'][0]['line'], 2)
+
+    def test_import_assignment_rules(self):
+        """
+        Ensure used equipments are only imported for active employees within the rules of their role
+        """
+        company = Company.objects.create(name='LtuTech', active=True)
+        intern = Employee.objects.create(
+            name='Rami', surname='Belgacem', active=True, role=EmployeeRole.INTERN, company=company
+        )
+        Employee.objects.create(name='Jean', surname='Martin', role=EmployeeRole.DEV, company=company)
+        Equipment.objects.create(equipment_type='screen', size=24, model='ACER', status='free').assign(intern)
+        content = '\n'.join([
+            'kind,equipment_type,memory,hard_disk_size,size,model,status,employee',
+            'equipment,screen,,,24,ACER,used,Rami Belgacem',
+            'equipment,pc,16,256,,HP,used,Rami Belgacem',
+            'equipment,pc,16,256,,HP,used,Rami Belgacem',
+            'equipment,pc,16,256,,HP,used,Jean Martin',
+        ])
+
+        # the rows of the previous batches count for their employee
+        for batch_size in (1000, 1):
+            with self.subTest(batch_size=batch_size), transaction.atomic():
+                upload = io.StringIO(content)
+                report = InventoryImporter(batch_size).run(upload, 'csv')
+                self.assertEqual(report['created']['equipment'], 1)
+                self.assertEqual([error['line'] for error in report['errors']], [2, 4, 5])
+                self.assertIn('inactive', report['errors'][2]['errors']['employee'][0])
+                intern.refresh_from_db()
+                self.assertEqual(intern.equipment_counts(), {'pc': 1, 'screen': 1})
+                transaction.set_rollback(True)
+
+    def test_import_format(self):
+        response = self.upload(self.csv_content, name='inventory.xml')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class InstrumentationTests(APITestCase):
+
+    def setUp(self):
+        request_histogram.reset()
+        self.company = Company.objects.create(name='LtuTech', active=True)
+
+    def test_server_timing(self):
+        """
+        Ensure API responses tell their queries and timings
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('company-list'))
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertEqual([metric.split(';')[0] for metric in timing.split(', ')], ['db', 'serialize', 'total'])
+
+        response = self.client.get('/admin/login/')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_serialization_timing(self):
+        """
+        Ensure the model serializers of the detail, create and update responses are timed
+        """
+        represent = serializers.Serializer.to_representation
+
+        def slow_representation(serializer, instance):
+            time.sleep(0.05)
+            return represent(serializer, instance)
+
+        url = reverse('company-detail', args=(self.company.id,))
+        with mock.patch.object(serializers.Serializer, 'to_representation', slow_representation):
+            for response in (
+                self.client.get(url),
+                self.client.post(reverse('company-list'), {'name': 'Other'}),
+                self.client.patch(url, {'name': 'Renamed'}),
+            ):
+                serialize = response['Server-Timing'].split(', ')[1]
+                self.assertGreaterEqual(float(serialize.split('dur=')[1]), 50, response.request['REQUEST_METHOD'])
+
+    @override_settings(REQUEST_INSTRUMENTATION={'SERVER_TIMING': False, 'LOG': False})
+    def test_configuration(self):
+        response = self.client.get(reverse('company-list'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(request_histogram.snapshot()['views']['company-list']['count'], 1)
+
+    def test_n_plus_one(self):
+        """
+        Ensure repeated statements of the same shape are logged as an N+1
+        """
+        def rules_one_by_one(view):
+            for role in EmployeeRole.values:
+                EquipmentRule.objects.filter(role=role).exists()
+            return EquipmentRule.objects.all()
+
+        with self.assertLogs('coworking.requests', 'INFO') as logs:
+            self.client.get(reverse('company-list'))
+            with mock.patch.object(views.EquipmentRuleList, 'get_queryset', rules_one_by_one):
+                self.client.get(reverse('equipment-rule-list'))
+        first, second = (json.loads(record.getMessage()) for record in logs.records)
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+        self.assertEqual((first['view'], first['status'], first['n_plus_one']), ('company-list', 200, []))
+        self.assertEqual(logs.records[1].levelname, 'WARNING')
+        self.assertEqual(second['n_plus_one'][0]['count'], 5)
+
+        metrics = self.client.get(reverse('request-metrics')).json()
+        self.assertEqual(metrics['views']['equipment-rule-list']['n_plus_one'], 1)
+        self.assertEqual(sum(metrics['views']['company-list']['counts']), 1)
+
+    def test_async_requests(self):
+        """
+        Ensure the middleware counts the queries of requests served in async mode
+        """
+        response = async_to_sync(AsyncClient().get)(reverse('company-detail', args=(self.company.id,)))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+        self.assertEqual(request_histogram.snapshot()['views']['company-detail']['count'], 1)
+
+
+class PrometheusMetricsTests(APITestCase):
+
+    def setUp(self):
+        cache.delete_many(list(stock.keys()))
+        EquipmentRule.policy()
+        company = Company.objects.create(name='LtuTech', active=True)
+        self.intern = Employee.objects.create(
+            name='Rami', surname='Belgacem', active=True, role=EmployeeRole.INTERN, company=company
+        )
+        self.screens = [
+            Equipment.objects.create(equipment_type='screen', size=24, model='ACER', status='free') for _ in range(2)
+        ]
+
+    def scrape(self):
+        response = self.client.get(reverse('prometheus-metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_metrics(self):
+        """
+        Ensure latencies, assignments, rule rejections and stock are exposed
+        """
+        assigned = 'coworking_equipment_assignments_total{operation="assign",role="intern"}'
+        revoked = 'coworking_equipment_assignments_total{operation="revoke",role="intern"}'
+        rejected = 'coworking_equipment_rule_rejections_total{role="intern",equipment_type="screen"}'
+        free = 'coworking_equipments{equipment_type="screen",status="free"}'
+        used = 'coworking_equipments{equipment_type="screen",status="used"}'
+        before = self.scrape()
+        self.assertEqual((before[free], before[used]), (2, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('employee-equipment-assign', args=(self.screens[0].id, self.intern.id)))
+            response = self.client.post(
+                reverse('equipment-allocate'), {'employee': self.intern.id, 'equipment_type': 'screen'}
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('employee-equipment-revoke', args=(self.screens[0].id, self.intern.id)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('employee-equipment-assign', args=(self.screens[1].id, self.intern.id)))
+
+        # the stock is not counted again
+        with self.assertNumQueries(0):
+            after = self.scrape()
+        self.assertEqual(after[assigned] - before.get(assigned, 0), 2)
+        self.assertEqual(after[revoked] - before.get(revoked, 0), 1)
+        self.assertEqual(after[rejected] - before.get(rejected, 0), 1)
+        self.assertEqual((after[free], after[used]), (1, 1))
+        self.assertIn('coworking_request_duration_seconds_count{url_name="equipment-allocate",method="POST"}', after)
+        self.assertIn(
+            'coworking_request_duration_seconds_bucket{url_name="equipment-allocate",method="POST",le="+Inf"}', after
+        )
+
+    def test_stock_follows_writes(self):
+        """
+        Ensure creations, updates and deletions shift the stock
+        """
+        free = ('screen', 'free')
+        self.assertEqual(stock.counts()[free], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('equipment-list'), [
+                {'equipment_type': 'screen', 'size': 27, 'model': 'DELL', 'status': 'free'} for _ in range(3)
+            ], format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('equipment-detail', args=(self.screens[0].id,)), {'status': 'used'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('equipment-detail', args=(self.screens[1].id,)))
+
+        with self.assertNumQueries(0):
+            counts = stock.counts()
+        self.assertEqual((counts[free], counts['screen', 'used']), (3, 1))
+        cache.delete_many(list(stock.keys()))
+        self.assertEqual(stock.counts(), counts)
@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api import views
+from api import async_views, views
 
 
 router = DefaultRouter()
@@ -9,18 +10,46 @@ router.register(r'', views.EquipmentViewSet, basename="equipment")
 
 urlpatterns = [
     path('company/', views.CompanyList.as_view(), name='company-list'),
+    path('company/archived/', views.ArchivedCompanyList.as_view(), name='company-archived'),
+    path('company/<uuid:pk>/restore/', views.restore_company, name='company-restore'),
+    path('company/export/', views.CompanyExport.as_view(), name='company-export'),
     path('company/<uuid:pk>/', views.CompanyDetail.as_view(), name='company-detail'),
     path('company/<uuid:pk>/activate/', views.CompanyActivate.as_view(), name='company-activate'),
     path('company/<uuid:pk>/desactivate/', views.CompanyDesactivate.as_view(), name='company-desactivate'),
     path('employee/', views.EmployeeList.as_view(), name='employee-list'),
+    path('employee/hired/', views.EmployeeHiring.as_view(), name='employee-hired'),
+    path('employee/archived/', views.ArchivedEmployeeList.as_view(), name='employee-archived'),
+    path('employee/<uuid:pk>/restore/', views.restore_employee, name='employee-restore'),
+    path('employee/export/', views.EmployeeExport.as_view(), name='employee-export'),
     path('employee/<uuid:pk>/', views.EmployeeDetail.as_view(), name='employee-detail'),
     path('employee/<uuid:pk>/activate/', views.EmployeeActivate.as_view(), name='employee-activate'),
     path('employee/<uuid:pk>/desactivate/', views.EmployeeDesactivate.as_view(), name='employee-desactivate'),
+    path('equipment/allocate/', views.allocate_equipment, name='equipment-allocate'),
+    path('equipment/bulk-assign/', views.bulk_assign_equipment, name='equipment-bulk-assign'),
+    path('equipment/bulk-revoke/', views.bulk_revoke_equipment, name='equipment-bulk-revoke'),
     path('equipment/', include(router.urls)),
     path('equipment/<uuid:employee_id>/list/', views.employee_equipment_list, name='employee-equipment-list'),
     path('equipment/<uuid:pk>/<uuid:employee_id>/assign/', views.assign_equipment, name='employee-equipment-assign'),
     path('equipment/<uuid:pk>/<uuid:employee_id>/revoke/', views.revoke_equipment, name='employee-equipment-revoke'),
     path('equipment/<uuid:employee_id>/revoke-all/', views.revoke_all, name='employee-equipment-revoke-all'),
-    path('employee/last-year/', views.employees_lastyear, name='employee-last-year'),
-    path('employee/<int:start_year>/<int:end_year>/', views.employee_period, name='employee-in-period'),
+    path('equipment/<uuid:pk>/holder/', views.equipment_holder, name='equipment-holder'),
+    path('employee/<uuid:employee_id>/holdings/', views.employee_holdings, name='employee-holdings'),
+    path('rule/', views.EquipmentRuleList.as_view(), name='equipment-rule-list'),
+    path('rule/<uuid:pk>/', views.EquipmentRuleDetail.as_view(), name='equipment-rule-detail'),
+    path('inventory/import/', views.import_inventory, name='inventory-import'),
+    path('inventory/summary/', views.InventorySummary.as_view(), name='inventory-summary'),
+    path('internal/cache/', views.cache_stats, name='cache-stats'),
+    path('internal/metrics/', views.request_metrics, name='request-metrics'),
+    path('internal/prometheus/', views.prometheus_metrics, name='prometheus-metrics'),
 ]
+
+if settings.ASYNC_READ_VIEWS:
+    # same routes and names, in front of the synchronous ones
+    urlpatterns = [
+        path('equipment/', async_views.EquipmentList.as_view(), name='equipment-list'),
+        path('equipment/<uuid:pk>/', async_views.EquipmentDetail.as_view(), name='equipment-detail'),
+        path('employee/', async_views.EmployeeList.as_view(), name='employee-list'),
+        path('employee/<uuid:pk>/', async_views.EmployeeDetail.as_view(), name='employee-detail'),
+        path('equipment/<uuid:employee_id>/list/', async_views.employee_equipment_list,
+             name='employee-equipment-list'),
+    ] + urlpatterns
@@ -1,23 +1,74 @@
-from datetime import date
-from datetime import datetime
-
+import io
+import os
+
+from django.http import HttpResponse
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+from django.views.decorators.http import require_safe
 from rest_framework import generics, status, viewsets
 from rest_framework.response import Response
-from rest_framework.decorators import api_view
-from dateutil.relativedelta import relativedelta
-
-from base.generics import ActivateAPIView, DesactivateAPIView
-from base.models import EmployeeRole
-from management.models import Company, Employee, Equipment
+from rest_framework.decorators import action, api_view, parser_classes
+from rest_framework.parsers import MultiPartParser
+
+from base.cache import detail_cache
+from base.instrumentation import request_histogram
+from base.metrics import registry
+from base.generics import (
+    ActivateAPIView,
+    BulkCreateModelMixin,
+    BulkListCreateAPIView,
+    CachedRetrieveModelMixin,
+    ConditionalGetMixin,
+    DesactivateAPIView,
+    ExportAPIView,
+    ExportModelMixin,
+    ValuesListModelMixin
+)
+from base.models import AssignmentOperation, EquipmentStatus, TypeOfEquipment
+from base.pagination import KeysetPagination
+from base.serializers import ValuesSerializer
+from management.metrics import stock
+from management.models import (
+    ArchivedCompany,
+    ArchivedEmployee,
+    AssignmentEvent,
+    Company,
+    CompanyRoleSummary,
+    Employee,
+    Equipment,
+    EquipmentRule
+)
+from api.inventory import InventoryImporter
 from api.serializers import (
     CompanySerializer,
     CompanyActiveSerializer,
     EmployeeSerializer,
     EmployeeActiveSerializer,
-    EquipmentSerializer
+    EquipmentSerializer,
+    EquipmentRuleSerializer,
+    AllocationSerializer,
+    ArchivedCompanySerializer,
+    ArchivedEmployeeSerializer,
+    AssignmentEventSerializer,
+    AssignmentSerializer,
+    CompanyRoleSummarySerializer,
+    HiringWindowSerializer,
+    HolderQuerySerializer,
+    PeriodQuerySerializer
 )
 
 
+def paginated_response(request, queryset, serializer_class):
+    """
+    Paginate a queryset the same way generic list views do
+    """
+    serializer = ValuesSerializer.of(serializer_class)
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(serializer.values(queryset), request)
+    return paginator.get_paginated_response(serializer.to_representation(page))
+
+
 class CompanyActivate(ActivateAPIView):
     """
     Activate a company APIView
@@ -36,16 +87,31 @@ class CompanyDesactivate(DesactivateAPIView):
     serializer_class = CompanyActiveSerializer
 
 
-class CompanyList(generics.ListCreateAPIView):
+class CompanyListMixin:
     """
-    List all companies, or create a new one
+    Queryset and filters of the company list, shared by its export
     """
 
     queryset = Company.objects.all()
     serializer_class = CompanySerializer
+    filter_fields = {'active': ['exact']}
+    search_fields = ('name',)
+    ordering_fields = ('created_at', 'name')
+
+
+class CompanyList(CompanyListMixin, ConditionalGetMixin, ValuesListModelMixin, BulkListCreateAPIView):
+    """
+    List all companies, or create one or many
+    """
+
+
+class CompanyExport(CompanyListMixin, ExportAPIView):
+    """
+    Stream all companies as NDJSON or CSV, filtered like the list
+    """
 
 
-class CompanyDetail(generics.RetrieveUpdateDestroyAPIView):
+class CompanyDetail(ConditionalGetMixin, CachedRetrieveModelMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update or delete a company.
     """
@@ -72,16 +138,69 @@ class EmployeeDesactivate(DesactivateAPIView):
     serializer_class = EmployeeActiveSerializer
 
 
-class EmployeeList(generics.ListCreateAPIView):
+class EmployeeListMixin:
     """
-    List all Employees, or create a new one
+    Queryset and filters of the employee list, shared by its export
     """
 
     queryset = Employee.objects.all()
     serializer_class = EmployeeSerializer
+    filter_fields = {
+        'company': ['exact', 'in'],
+        'role': ['exact', 'in'],
+        'active': ['exact'],
+    }
+    search_fields = ('name', 'surname')
+    ordering_fields = ('created_at', 'name', 'surname')
 
 
-class EmployeeDetail(generics.RetrieveUpdateDestroyAPIView):
+class EmployeeList(EmployeeListMixin, ConditionalGetMixin, ValuesListModelMixin, BulkListCreateAPIView):
+    """
+    List all Employees, or create one or many
+    """
+
+
+class EmployeeHiring(ValuesListModelMixin, generics.ListAPIView):
+    """
+    List the employees hired in a window of `created_at` (`?start=&end=`, dates
+    or datetimes), most recent first, with the hires per month or week (`?bucket=`).
+
+    The window is a range of the role, company or creation date indexes, the
+    buckets one grouped query on the same range.
+    """
+
+    queryset = Employee.objects.all()
+    serializer_class = EmployeeSerializer
+    filter_fields = {
+        'company': ['exact', 'in'],
+        'role': ['exact', 'in'],
+        'active': ['exact'],
+    }
+
+    def filter_queryset(self, queryset):
+        self.window = HiringWindowSerializer(data=self.request.query_params)
+        self.window.is_valid(raise_exception=True)
+        return super().filter_queryset(queryset).filter(**self.window.validated_data['window'])
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        bucket = self.window.validated_data.get('bucket')
+        if bucket is not None:
+            trunc = TruncMonth if bucket == 'month' else TruncWeek
+            counts = self.filter_queryset(self.get_queryset()).order_by() \
+                .annotate(period=trunc('created_at', output_field=DateField())) \
+                .values('period').annotate(count=Count('pk')).order_by('period')
+            response.data['buckets'] = list(counts)
+        return response
+
+
+class EmployeeExport(EmployeeListMixin, ExportAPIView):
+    """
+    Stream all employees as NDJSON or CSV, filtered like the list
+    """
+
+
+class EmployeeDetail(ConditionalGetMixin, CachedRetrieveModelMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update or delete a employee.
     """
@@ -90,12 +209,84 @@ class EmployeeDetail(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = EmployeeSerializer
 
 
-class EquipmentViewSet(viewsets.ModelViewSet):
+class EquipmentViewSet(ConditionalGetMixin, CachedRetrieveModelMixin, ValuesListModelMixin, BulkCreateModelMixin,
+                       ExportModelMixin, viewsets.ModelViewSet):
     """
     A ViewSet for all equipment endpoints.
     """
     queryset = Equipment.objects.all()
     serializer_class = EquipmentSerializer
+    filter_fields = {
+        'status': ['exact'],
+        'equipment_type': ['exact'],
+        'memory': ['exact', 'gte', 'lte'],
+        'hard_disk_size': ['exact', 'gte', 'lte'],
+        'size': ['exact', 'gte', 'lte'],
+        'employee': ['exact', 'isnull'],
+    }
+    search_fields = ('model',)
+    ordering_fields = ('created_at', 'model')
+
+    @action(detail=False, methods=['get'])
+    def export(self, request, *args, **kwargs):
+        """
+        Stream all equipments as NDJSON or CSV
+        """
+        return super().export(request, *args, **kwargs)
+
+
+class EquipmentRuleList(generics.ListCreateAPIView):
+    """
+    List all equipment rules, or create one
+    """
+
+    queryset = EquipmentRule.objects.all()
+    serializer_class = EquipmentRuleSerializer
+    filter_fields = {'role': ['exact']}
+
+
+class EquipmentRuleDetail(generics.RetrieveUpdateDestroyAPIView):
+    """
+    Retrieve, update or delete an equipment rule.
+    """
+
+    queryset = EquipmentRule.objects.all()
+    serializer_class = EquipmentRuleSerializer
+
+
+class InventorySummary(ValuesListModelMixin, generics.ListAPIView):
+    """
+    Head count, active count and equipments held per company and role, with
+    their totals per role and the free and used equipments per type.
+
+    Read from the materialized company summary and the equipment stock: a
+    page of the summary, the stock from the cache, and on the first page only
+    one grouped query over the filtered summary rows for the totals per role.
+    """
+
+    queryset = CompanyRoleSummary.objects.order_by('company', 'role')
+    serializer_class = CompanyRoleSummarySerializer
+    filter_fields = {
+        'company': ['exact', 'in'],
+        'role': ['exact', 'in'],
+    }
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.paginator.cursor is None:
+            # the next pages do not aggregate the filtered rows again
+            totals = self.filter_queryset(self.get_queryset()).order_by('role').values('role') \
+                .annotate(**{field: Sum(field) for field in CompanyRoleSummary.total_fields})
+            response.data['roles'] = list(totals)
+        counts = stock.counts()
+        response.data['equipments'] = [
+            {
+                'equipment_type': equipment_type,
+                **{state: counts[equipment_type, state] for state in EquipmentStatus.values},
+            }
+            for equipment_type in TypeOfEquipment.values
+        ]
+        return response
 
 
 @api_view(['GET'])
@@ -108,9 +299,7 @@ def employee_equipment_list(request, employee_id):
     except Employee.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
-    equipments = employee.equipments
-    serializer = EquipmentSerializer(equipments, many=True)
-    return Response(serializer.data)
+    return paginated_response(request, employee.equipments.all(), EquipmentSerializer)
 
 
 @api_view(['POST'])
@@ -119,91 +308,213 @@ def assign_equipment(request, pk, employee_id):
     Assign an equipment to an employee
     """
     try:
-        equipment = Equipment.objects.get(pk=pk)
-    except Equipment.DoesNotExist:
+        Equipment.assign_to(pk, employee_id)
+    except (Equipment.DoesNotExist, Employee.DoesNotExist):
         return Response(status=status.HTTP_404_NOT_FOUND)
+    except ValueError as error:
+        return Response(data={'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(status=status.HTTP_200_OK)
+
 
+@api_view(['POST'])
+def revoke_equipment(request, pk, employee_id):
+    """
+    Revoke an equipment from an employee
+    """
     try:
-        employee = Employee.objects.get(pk=employee_id)
-    except Employee.DoesNotExist:
+        Equipment.revoke_from(pk, employee_id)
+    except (Equipment.DoesNotExist, Employee.DoesNotExist):
         return Response(status=status.HTTP_404_NOT_FOUND)
-
-    equipment.assign(employee)
+    except ValueError as error:
+        return Response(data={'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
     return Response(status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
-def revoke_equipment(request, pk, employee_id):
+def revoke_all(request, employee_id):
     """
-    Revoke an equipment from an employee
+    Revoke all employee's equipment
     """
     try:
-        equipment = Equipment.objects.get(pk=pk)
-    except Equipment.DoesNotExist:
+        Employee.revoke_all_of(employee_id)
+    except Employee.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
+    return Response(status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+def allocate_equipment(request):
+    """
+    Assign to an employee a free equipment of the given type its rules accept
+    """
+    serializer = AllocationSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
 
+    data = serializer.validated_data
     try:
-        employee = Employee.objects.get(pk=employee_id)
+        equipment = Equipment.allocate(data['employee'], data['equipment_type'])
     except Employee.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
+    except ValueError as error:
+        return Response(data={'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(EquipmentSerializer(equipment).data)
+
+
+def bulk_assignment_response(request, operation):
+    """
+    Run a bulk assignment operation and report the outcome of every item
+    """
+    serializer = AssignmentSerializer(data=request.data, many=True)
+    serializer.is_valid(raise_exception=True)
+
+    pairs = [(item['equipment'], item['employee']) for item in serializer.validated_data]
+    errors = operation(pairs)
+    return Response([
+        {'equipment': equipment_id, 'employee': employee_id, 'success': error is None, 'detail': error}
+        for (equipment_id, employee_id), error in zip(pairs, errors)
+    ])
+
+
+@api_view(['POST'])
+def bulk_assign_equipment(request):
+    """
+    Assign a list of equipments to employees
+    """
+    return bulk_assignment_response(request, Equipment.bulk_assign)
+
+
+@api_view(['POST'])
+def bulk_revoke_equipment(request):
+    """
+    Revoke a list of equipments from employees
+    """
+    return bulk_assignment_response(request, Equipment.bulk_revoke)
+
+
+@api_view(['GET'])
+def equipment_holder(request, pk):
+    """
+    The employee holding an equipment at a time (`?at=`, now by default), read from the assignment ledger
+    """
+    serializer = HolderQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+
+    at = serializer.validated_data.get('at') or timezone.now()
+    event = AssignmentEvent.holder_at(pk, at)
+    if event is None and not Equipment.objects.filter(pk=pk).exists():
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    held = event is not None and event.operation == AssignmentOperation.ASSIGN
+    return Response({
+        'equipment': pk,
+        'at': at,
+        'employee': event.employee_id if held else None,
+        'held_since': event.held_since if held else None,
+    })
+
+
+@api_view(['GET'])
+def employee_holdings(request, employee_id):
+    """
+    List the holdings of an employee overlapping a period (`?start=&end=`), read from the assignment ledger.
+    A revoke event is a holding from `held_since` to its `created_at`, an assign event a holding still running.
+    """
+    serializer = PeriodQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+
+    period = serializer.validated_data
+    events = AssignmentEvent.holdings(employee_id, period.get('start'), period.get('end'))
+    return paginated_response(request, events, AssignmentEventSerializer)
+
 
-    if equipment.employee != employee:
+@api_view(['POST'])
+@parser_classes([MultiPartParser])
+def import_inventory(request):
+    """
+    Import companies, employees and equipments from an uploaded CSV or NDJSON file
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response(data={'detail': 'A file is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    file_format = request.query_params.get('import_format') or os.path.splitext(upload.name)[1].lstrip('.').lower()
+    if file_format not in InventoryImporter.formats:
         return Response(
-            data={'detail': 'The employee is not assigned to this equipment'},
+            data={'detail': f'Unknown import format "{file_format}"'},
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    equipment.revoke()
-    return Response(status=status.HTTP_200_OK)
+    report = InventoryImporter().run(io.TextIOWrapper(upload, encoding='utf-8-sig', newline=''), file_format)
+    return Response(report, status=status.HTTP_207_MULTI_STATUS if report['rejected'] else status.HTTP_201_CREATED)
+
+
+class ArchivedCompanyList(ValuesListModelMixin, generics.ListAPIView):
+    """
+    List the archived companies, the last archived first
+    """
+
+    queryset = ArchivedCompany.objects.order_by('-archived_at', '-id')
+    serializer_class = ArchivedCompanySerializer
+
+
+class ArchivedEmployeeList(ValuesListModelMixin, generics.ListAPIView):
+    """
+    List the archived employees, the last archived first
+    """
+
+    queryset = ArchivedEmployee.objects.order_by('-archived_at', '-id')
+    serializer_class = ArchivedEmployeeSerializer
+    filter_fields = {
+        'company': ['exact'],
+    }
 
 
 @api_view(['POST'])
-def revoke_all(request, employee_id):
+def restore_company(request, pk):
     """
-    Revoke all employee's equipment
+    Restore an archived company with its archived employees and their assignment events
     """
     try:
-        employee = Employee.objects.get(pk=employee_id)
-    except Employee.DoesNotExist:
+        ArchivedCompany.restore(pk)
+    except ArchivedCompany.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
-
-    employee.revoke_all()
-    return Response(status=status.HTTP_200_OK)
+    except ValueError as error:
+        return Response(data={'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(CompanySerializer(Company.objects.get(pk=pk)).data)
 
 
-@api_view(['GET'])
-def employees_lastyear(request):
+@api_view(['POST'])
+def restore_employee(request, pk):
     """
-    List tech lead employees joined in the last year
+    Restore an archived employee of a live company with its assignment events
     """
-    today = datetime.combine(date.today(), datetime.min.time())
+    try:
+        ArchivedEmployee.restore(pk)
+    except ArchivedEmployee.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    except ValueError as error:
+        return Response(data={'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(EmployeeSerializer(Employee.objects.get(pk=pk)).data)
 
-    same_day_last_year = today - relativedelta(years=1)
-    employees = Employee.objects.filter(
-        role=EmployeeRole.TECHLEAD,
-        created_at__gte=same_day_last_year,
-    )
 
-    serializer = EmployeeSerializer(employees, many=True)
-    return Response(serializer.data)
+@api_view(['GET'])
+def cache_stats(request):
+    """
+    Hit and miss counters of the detail cache of this process
+    """
+    return Response(detail_cache.stats())
 
 
 @api_view(['GET'])
-def employee_period(request, start_year, end_year):
+def request_metrics(request):
     """
-    List interns that joined between two given dates
+    Rolling latency histogram, queries and N+1 flags per view of this process
     """
-    start_year = datetime(start_year, 1, 1)
-    end_year = datetime(end_year, 12, 31)
+    return Response(request_histogram.snapshot())
 
-    if start_year > end_year:
-        raise ValueError('second path parameter must be greater than the first one')
 
-    employees = Employee.objects.filter(
-        role=EmployeeRole.INTERN,
-        created_at__gte=start_year,
-        created_at__lte=end_year,
-    )
-
-    serializer = EmployeeSerializer(employees, many=True)
-    return Response(serializer.data)
+@require_safe
+def prometheus_metrics(request):
+    """
+    Latency, assignment and stock metrics in the Prometheus text format
+    """
+    return HttpResponse(registry.exposition(), content_type=registry.content_type)
@@ -0,0 +1,121 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import classonlymethod
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+
+from base.cache import detail_cache
+from base.generics import ConditionalGetMixin
+from base.instrumentation import InstrumentedJSONRenderer
+from base.routers import primary_reads
+from base.serializers import ValuesSerializer
+
+
+class AsyncReadView(View):
+    """
+    Async implementation of the GET of a DRF view, for ASGI deployments.
+
+    The queryset, serializer, filters and pagination are those of `drf_view`
+    and the JSON output is the same, the queries go through the async ORM.
+    Other methods are run by the DRF view itself (`drf_actions` for a viewset).
+    """
+    drf_view = None
+    drf_actions = None
+    renderer = InstrumentedJSONRenderer()
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # like DRF views, the API does not use session authentication
+        view.csrf_exempt = True
+        return view
+
+    @classmethod
+    def get_drf_callable(cls):
+        if '_drf_callable' not in cls.__dict__:
+            cls._drf_callable = cls.drf_view.as_view(cls.drf_actions) if cls.drf_actions else cls.drf_view.as_view()
+        return cls._drf_callable
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await sync_to_async(self.get_drf_callable())(request, *args, **kwargs)
+        try:
+            return await self.get(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return self.render(detail, exc.status_code)
+
+    def render(self, data, status_code=status.HTTP_200_OK):
+        return HttpResponse(self.renderer.render(data), content_type='application/json', status=status_code)
+
+    def get_queryset(self):
+        return self.drf_view.queryset.all()
+
+    def get_values_serializer(self):
+        return ValuesSerializer.of(self.drf_view.serializer_class)
+
+    def filter_queryset(self, request, queryset):
+        request = Request(request)
+        for backend in self.drf_view.filter_backends:
+            queryset = backend().filter_queryset(request, queryset, self.drf_view)
+        return queryset
+
+    async def conditional_response(self, request, validator, last_modified, respond):
+        etag, timestamp = ConditionalGetMixin.get_validators(validator, last_modified)
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = await respond()
+        return ConditionalGetMixin.set_validators(response, etag, timestamp)
+
+
+class AsyncListView(AsyncReadView):
+    """
+    Async list of a DRF list view, with its filters, pagination and validators.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(request, self.get_queryset())
+        serializer = self.get_values_serializer()
+        paginator = self.drf_view.pagination_class()
+        page = await paginator.apaginate_queryset(serializer.values(queryset), request)
+
+        async def respond():
+            return self.render(paginator.get_paginated_data(serializer.to_representation(page)))
+
+        validator = ConditionalGetMixin.page_validator(request, paginator, page)
+        return await self.conditional_response(request, validator, None, respond)
+
+
+class AsyncDetailView(AsyncReadView):
+    """
+    Async retrieve of a DRF detail view, through the detail cache and with its validators.
+    """
+
+    async def get(self, request, pk, *args, **kwargs):
+        queryset = self.get_queryset()
+        payload = await detail_cache.apeek(queryset.model, pk)
+        if payload is not None:
+            last_modified = parse_datetime(payload['updated_at'])
+        else:
+            last_modified = await queryset.filter(pk=pk).values_list('updated_at', flat=True).afirst()
+        if last_modified is None:
+            raise exceptions.NotFound(f'No {queryset.model._meta.object_name} matches the given query.')
+
+        return await self.conditional_response(
+            request, (str(pk), last_modified), last_modified, lambda: self.retrieve(queryset, pk)
+        )
+
+    async def retrieve(self, queryset, pk):
+        payload, generation = await detail_cache.aget(queryset.model, pk)
+        if payload is None:
+            serializer = self.get_values_serializer()
+            with primary_reads():
+                row = await serializer.values(queryset.filter(pk=pk)).afirst()
+            if row is None:
+                raise exceptions.NotFound(f'No {queryset.model._meta.object_name} matches the given query.')
+            payload = serializer.to_representation([row])[0]
+            await detail_cache.aset(queryset.model, pk, payload, generation)
+        return self.render(payload)
@@ -0,0 +1,115 @@
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+class DetailCache:
+    """
+    Cache of the serialized payload of model instances, keyed by model and primary key.
+
+    It uses the `DETAIL_CACHE_ALIAS` Django cache, the invalidations are done by
+    the writes of the models (see `management.signals`) once they commit. Hits and misses are
+    counted per process.
+
+    Every instance has a generation, changed by each invalidation, read along with
+    its payload and stored with it: a payload read from the database before an
+    invalidation is filled under the old generation, so it is never served.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[settings.DETAIL_CACHE_ALIAS]
+
+    @staticmethod
+    def key(model, pk):
+        return f'detail:{model._meta.label_lower}:{pk}'
+
+    @staticmethod
+    def generation_key(model, pk):
+        return f'detail-generation:{model._meta.label_lower}:{pk}'
+
+    def get(self, model, pk):
+        """
+        The payload of an instance, None when missing or outdated, and the generation to fill it under
+        """
+        payload, generation = self.current(model, pk, self.cache.get_many(self.keys(model, pk)))
+        return self.count(payload), generation
+
+    async def aget(self, model, pk):
+        payload, generation = self.current(model, pk, await self.cache.aget_many(self.keys(model, pk)))
+        return self.count(payload), generation
+
+    def keys(self, model, pk):
+        return [self.key(model, pk), self.generation_key(model, pk)]
+
+    def current(self, model, pk, values):
+        generation = values.get(self.generation_key(model, pk))
+        entry = values.get(self.key(model, pk))
+        if entry is None or entry[0] != generation:
+            return None, generation
+        return entry[1], generation
+
+    def count(self, payload):
+        with self._lock:
+            if payload is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return payload
+
+    def peek(self, model, pk):
+        """
+        Read a payload without counting a hit or a miss
+        """
+        return self.current(model, pk, self.cache.get_many(self.keys(model, pk)))[0]
+
+    async def apeek(self, model, pk):
+        return self.current(model, pk, await self.cache.aget_many(self.keys(model, pk)))[0]
+
+    def set(self, model, pk, payload, generation):
+        """
+        Fill a payload under the generation returned by `get` before its row was read
+        """
+        self.cache.set(self.key(model, pk), (generation, payload))
+
+    async def aset(self, model, pk, payload, generation):
+        await self.cache.aset(self.key(model, pk), (generation, payload))
+
+    def invalidate(self, model, pks):
+        """
+        Once the current transaction commits, move the instances to a new generation and
+        drop their payloads: a read done before would cache the rows as they were, and
+        a rollback leaves them valid.
+        """
+        pks = list(pks)
+        if pks:
+            transaction.on_commit(lambda: self.drop(model, pks))
+
+    def drop(self, model, pks):
+        # the generations outlive the payloads, or an outdated payload could match a missing one
+        self.cache.set_many({self.generation_key(model, pk): uuid.uuid4().hex for pk in pks}, timeout=None)
+        self.cache.delete_many([self.key(model, pk) for pk in pks])
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / requests if requests else None,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+detail_cache = DetailCache()
@@ -0,0 +1,117 @@
+import sys
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import models
+from django.db.models import Q
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class FieldFilterBackend(BaseFilterBackend):
+    """
+    Filter on the `filter_fields` of the view, a `{field: [lookups]}` dict.
+
+    A field is filtered with `?field=value` or `?field__lookup=value`,
+    values are parsed by the model field and the `in` lookup takes a comma
+    separated list.
+    """
+    lookups = ('exact', 'in', 'gt', 'gte', 'lt', 'lte', 'isnull')
+
+    def filter_queryset(self, request, queryset, view):
+        filters, errors = {}, {}
+        for name, lookups in getattr(view, 'filter_fields', {}).items():
+            field = queryset.model._meta.get_field(name)
+            for lookup in lookups:
+                param = name if lookup == 'exact' else f'{name}__{lookup}'
+                if param not in request.query_params:
+                    continue
+                try:
+                    value = self.parse(field, lookup, request.query_params[param])
+                except DjangoValidationError as error:
+                    errors[param] = error.messages
+                    continue
+                if lookup == 'exact' and isinstance(field, models.BooleanField):
+                    # `WHERE active` can not use an index on SQLite, `WHERE active IN (1)` can
+                    param, value = f'{name}__in', [value]
+                filters[param] = value
+        if errors:
+            raise ValidationError(errors)
+        return queryset.filter(**filters) if filters else queryset
+
+    def parse(self, field, lookup, value):
+        if lookup == 'isnull' or isinstance(field, models.BooleanField):
+            return self.parse_boolean(value)
+        if lookup == 'in':
+            return [self.parse(field, 'exact', item) for item in value.split(',')]
+
+        value = field.to_python(value)
+        if field.choices and value not in dict(field.flatchoices):
+            raise DjangoValidationError(f'Select a valid choice. {value} is not one of the available choices.')
+        return value
+
+    @staticmethod
+    def parse_boolean(value):
+        # the spellings accepted by the serializers, `true` and `1` among others
+        if value in serializers.BooleanField.TRUE_VALUES:
+            return True
+        if value in serializers.BooleanField.FALSE_VALUES:
+            return False
+        raise DjangoValidationError(f'"{value}" is not a valid boolean.')
+
+
+class PrefixSearchBackend(BaseFilterBackend):
+    """
+    Search the rows where each word of `?search=` starts one of the
+    `search_fields` of the view.
+
+    A prefix is queried as the `prefix <= field < successor` range rather than
+    a LIKE, so the index of the field is used. Two limitations follow:
+
+    - the search is case sensitive, `Bel` finds `Belgacem` but `bel` does not;
+    - the range only holds for a collation ordering the strings by code point,
+      as SQLite's default BINARY one and PostgreSQL's `C` one do. Under a
+      linguistic collation (`en_US.UTF-8`...) rows sorted outside the range
+      are missed, the columns searched must use a `C` collation there.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        fields = getattr(view, 'search_fields', ())
+        terms = request.query_params.get(self.search_param, '').split()
+        if not fields or not terms:
+            return queryset
+
+        condition = Q()
+        for term in terms:
+            condition &= Q(*(self.prefix_condition(field, term) for field in fields), _connector=Q.OR)
+        return queryset.filter(condition)
+
+    @staticmethod
+    def prefix_condition(field, prefix):
+        if ord(prefix[-1]) == sys.maxunicode:
+            return Q(**{f'{field}__startswith': prefix})
+        successor = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return Q(**{f'{field}__gte': prefix, f'{field}__lt': successor})
+
+
+class OrderingBackend(BaseFilterBackend):
+    """
+    Order on one of the `ordering_fields` of the view with `?ordering=field`
+    or `?ordering=-field`, the primary key breaking the ties.
+
+    Ordering fields must not be nullable, the keyset pagination follows the
+    ordering set here.
+    """
+    ordering_param = 'ordering'
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = request.query_params.get(self.ordering_param)
+        fields = getattr(view, 'ordering_fields', ())
+        if not ordering or not fields:
+            return queryset
+
+        if ordering.lstrip('-') not in fields:
+            raise ValidationError({self.ordering_param: [f'Must be one of: {", ".join(fields)}.']})
+        pk = queryset.model._meta.pk.name
+        return queryset.order_by(ordering, f'-{pk}' if ordering.startswith('-') else pk)
@@ -1,4 +1,20 @@
-from rest_framework import generics, mixins
+import csv
+import hashlib
+import io
+from calendar import timegm
+
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from rest_framework import generics, mixins, status
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from base.cache import detail_cache
+from base.routers import primary_reads
+from base.serializers import ValuesSerializer
 
 
 class ActivateModelMixin(mixins.UpdateModelMixin):
@@ -15,6 +31,9 @@ class ActivateAPIView(ActivateModelMixin, generics.GenericAPIView):
     """
     Concrete view for activating a model instance.
     """
+    # GET writes: the replica routing sends it to the primary
+    writes = True
+
     def get(self, request, *args, **kwargs):
         return self.activate(request, *args, **kwargs)
 
@@ -33,5 +52,224 @@ class DesactivateAPIView(DesactivateModelMixin, generics.GenericAPIView):
     """
     Concrete view for desactivating a model instance.
     """
+    # GET writes: the replica routing sends it to the primary
+    writes = True
+
     def get(self, request, *args, **kwargs):
         return self.desactivate(request, *args, **kwargs)
+
+
+class CachedRetrieveModelMixin(mixins.RetrieveModelMixin):
+    """
+    Retrieve a model instance, serving its payload from the detail cache when possible.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        model = self.get_queryset().model
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+
+        payload, generation = detail_cache.get(model, pk)
+        if payload is not None:
+            return Response(payload)
+
+        # the cache is filled from the primary: a lagging replica would cache a stale payload
+        with primary_reads():
+            response = super().retrieve(request, *args, **kwargs)
+        detail_cache.set(model, pk, dict(response.data), generation)
+        return response
+
+
+class ConditionalGetMixin:
+    """
+    Send strong ETag and Last-Modified headers computed from `updated_at` on list
+    and retrieve, and answer 304 Not Modified to up to date clients.
+
+    A detail is validated with one small query. A page of a list is validated
+    by the page itself, its ids and `updated_at` once fetched: the cost stays
+    the one of the page whatever the size of the table, and nothing is
+    serialized for a 304. A page has an ETag only, a row leaving it could make
+    its last modification older.
+    """
+
+    def page_response(self, page, serializer):
+        etag, _ = self.get_validators(self.page_validator(self.request, self.paginator, page), None)
+        response = get_conditional_response(self.request, etag=etag)
+        if response is None:
+            response = super().page_response(page, serializer)
+        return self.set_validators(response, etag, None)
+
+    @staticmethod
+    def page_validator(request, paginator, page):
+        # the query string is part of the validator: each page has its own ETag
+        rows = [(row['id'], row['updated_at']) for row in page]
+        return rows, paginator.has_next, paginator.has_previous, request.get_full_path()
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        last_modified = self.get_last_modified(pk)
+        if last_modified is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            (str(pk), last_modified), last_modified, super().retrieve, request, *args, **kwargs
+        )
+
+    def get_last_modified(self, pk):
+        queryset = self.get_queryset()
+        if isinstance(self, CachedRetrieveModelMixin):
+            payload = detail_cache.peek(queryset.model, pk)
+            if payload is not None:
+                return parse_datetime(payload['updated_at'])
+        return queryset.filter(pk=pk).values_list('updated_at', flat=True).first()
+
+    def conditional_response(self, validator, last_modified, view, request, *args, **kwargs):
+        etag, timestamp = self.get_validators(validator, last_modified)
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = view(request, *args, **kwargs)
+        return self.set_validators(response, etag, timestamp)
+
+    @staticmethod
+    def get_validators(validator, last_modified):
+        """
+        ETag and Last-Modified timestamp of a response
+        """
+        etag = quote_etag(hashlib.md5(repr(validator).encode()).hexdigest())
+        timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+        return etag, timestamp
+
+    @staticmethod
+    def set_validators(response, etag, timestamp):
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+
+class ValuesListModelMixin(mixins.ListModelMixin):
+    """
+    List a queryset read with `.values()` and serialized by the ValuesSerializer
+    of the serializer class, without building model instances.
+    """
+
+    def list(self, request, *args, **kwargs):
+        serializer = ValuesSerializer.of(self.get_serializer_class())
+        queryset = serializer.values(self.filter_queryset(self.get_queryset()))
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.page_response(page, serializer)
+        return Response(serializer.to_representation(queryset))
+
+    def page_response(self, page, serializer):
+        return self.get_paginated_response(serializer.to_representation(page))
+
+
+class BulkCreateModelMixin(mixins.CreateModelMixin):
+    """
+    Create a model instance, or a batch of them when the payload is a list.
+
+    A batch is created all at once or rejected as a whole, unless the `partial`
+    query parameter is set: the valid items are then created and the invalid
+    ones reported by index.
+    """
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+
+        context = self.get_serializer_context()
+        context['allow_partial'] = request.query_params.get('partial') in ('1', 'true')
+        serializer = self.get_serializer(data=request.data, many=True, context=context)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+
+        if not context['allow_partial']:
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(
+            {'created': serializer.data, 'errors': serializer.row_errors},
+            status=status.HTTP_207_MULTI_STATUS if serializer.row_errors else status.HTTP_201_CREATED
+        )
+
+
+class BulkListCreateAPIView(mixins.ListModelMixin, BulkCreateModelMixin, generics.GenericAPIView):
+    """
+    Concrete view for listing a queryset or creating one or many model instances.
+    """
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        return self.create(request, *args, **kwargs)
+
+
+class ExportModelMixin:
+    """
+    Stream the whole filtered queryset as NDJSON (default) or CSV.
+
+    Rows are read with `.values()` through a chunked iterator and written as
+    they come, so memory stays flat and the first bytes are sent right away
+    whatever the size of the table.
+    """
+    export_format_query_param = 'export_format'
+    export_content_types = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+    }
+    export_chunk_size = 2000
+
+    def export(self, request, *args, **kwargs):
+        export_format = request.query_params.get(self.export_format_query_param, 'ndjson')
+        if export_format not in self.export_content_types:
+            return Response(
+                data={'detail': f'Unknown export format "{export_format}"'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        serializer = ValuesSerializer.of(self.get_serializer_class())
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = serializer.values(queryset).iterator(chunk_size=self.export_chunk_size)
+        content = getattr(self, f'write_{export_format}')(serializer, serializer.iter_representation(rows))
+
+        response = StreamingHttpResponse(content, content_type=self.export_content_types[export_format])
+        response['Content-Disposition'] = f'attachment; filename="{queryset.model._meta.model_name}.{export_format}"'
+        return response
+
+    def export_chunks(self, items):
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) == self.export_chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def write_ndjson(self, serializer, items):
+        encode = JSONEncoder(ensure_ascii=not api_settings.UNICODE_JSON).encode
+        for chunk in self.export_chunks(items):
+            yield ''.join(encode(item) + '\n' for item in chunk)
+
+    def write_csv(self, serializer, items):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=[name for name, _, _ in serializer.columns])
+
+        def flush():
+            content = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return content
+
+        writer.writeheader()
+        yield flush()
+        for chunk in self.export_chunks(items):
+            writer.writerows(chunk)
+            yield flush()
+
+
+class ExportAPIView(ExportModelMixin, generics.GenericAPIView):
+    """
+    Concrete view for streaming the export of a queryset.
+    """
+    def get(self, request, *args, **kwargs):
+        return self.export(request, *args, **kwargs)
@@ -0,0 +1,306 @@
+import bisect
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.renderers import JSONRenderer
+
+from base.metrics import registry
+
+
+logger = logging.getLogger('coworking.requests')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'PATH_PREFIXES': ['/api/v1/'],
+    'SERVER_TIMING': True,
+    'LOG': True,
+    'N_PLUS_ONE_THRESHOLD': 5,
+    'HISTOGRAM_BUCKETS_MS': [5, 10, 25, 50, 100, 250, 500, 1000, 2500],
+    'HISTOGRAM_WINDOW': 300,
+    'HISTOGRAM_SLOTS': 10,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'REQUEST_INSTRUMENTATION', {})}
+
+
+# profile of the request being served, shared with the threads running its queries
+current_profile = ContextVar('current_profile', default=None)
+
+# runs of placeholders, `IN (%s, %s, %s)` has the shape of `IN (%s)`
+PLACEHOLDERS = re.compile(r'%s(?:\s*,\s*%s)+')
+
+
+class RequestProfile:
+    """
+    Queries and timings of a request.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.serializing = False
+        self.shapes = Counter()
+
+    def add_query(self, sql, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        self.shapes[PLACEHOLDERS.sub('%s', sql)] += 1
+
+    def repeated_queries(self, threshold):
+        """
+        Statements of the same shape run at least `threshold` times: the mark of an N+1
+        """
+        return [{'sql': sql, 'count': count} for sql, count in self.shapes.most_common() if count >= threshold]
+
+
+def query_timer(execute, sql, params, many, context):
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.perf_counter() - started)
+
+
+def install_query_timer(connection, **kwargs):
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+# connections are per thread: the ones opened later, by the threads of async views among others
+connection_created.connect(install_query_timer)
+
+
+@contextmanager
+def measure_serialization():
+    """
+    Add the time of the block to the serialization time of the request, less its queries.
+    A block nested in another one is already timed by it.
+    """
+    profile = current_profile.get()
+    if profile is None or profile.serializing:
+        yield
+        return
+    started, db_seconds = time.perf_counter(), profile.db_seconds
+    profile.serializing = True
+    try:
+        yield
+    finally:
+        profile.serializing = False
+        profile.serialize_seconds += time.perf_counter() - started - (profile.db_seconds - db_seconds)
+
+
+class InstrumentedJSONRenderer(JSONRenderer):
+    """
+    JSON renderer adding its rendering time to the serialization time of the request
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with measure_serialization():
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class RollingHistogram:
+    """
+    Latencies of the requests per view over the last `window` seconds.
+
+    The window is split in `slots` slices, the oldest one is dropped as a new
+    one starts, so the figures move with the traffic without keeping every
+    request. Bucket bounds are in milliseconds, the last bucket is unbounded.
+    """
+
+    def __init__(self, buckets=None, window=None, slots=None):
+        config = get_config()
+        self.buckets = list(buckets or config['HISTOGRAM_BUCKETS_MS'])
+        self.window = window or config['HISTOGRAM_WINDOW']
+        self.slots = deque(maxlen=slots or config['HISTOGRAM_SLOTS'])
+        self._lock = threading.Lock()
+
+    @property
+    def slot_seconds(self):
+        return self.window / self.slots.maxlen
+
+    def current_slot(self, now):
+        start = now - now % self.slot_seconds
+        if not self.slots or self.slots[-1][0] != start:
+            self.slots.append((start, {}))
+        return self.slots[-1][1]
+
+    def empty_stats(self):
+        return {
+            'counts': [0] * (len(self.buckets) + 1),
+            'count': 0, 'sum': 0.0, 'max': 0.0, 'queries': 0, 'db': 0.0, 'n_plus_one': 0,
+        }
+
+    def observe(self, view, seconds, queries, db_seconds, n_plus_one):
+        milliseconds = seconds * 1000
+        with self._lock:
+            views = self.current_slot(time.time())
+            if view not in views:
+                views[view] = self.empty_stats()
+            stats = views[view]
+            stats['counts'][bisect.bisect_left(self.buckets, milliseconds)] += 1
+            stats['count'] += 1
+            stats['sum'] += milliseconds
+            stats['max'] = max(stats['max'], milliseconds)
+            stats['queries'] += queries
+            stats['db'] += db_seconds * 1000
+            stats['n_plus_one'] += bool(n_plus_one)
+
+    def snapshot(self):
+        """
+        Figures of every view over the window, percentiles are the upper bounds of their bucket
+        """
+        merged = {}
+        with self._lock:
+            now = time.time()
+            for start, views in self.slots:
+                if start <= now - self.window:
+                    continue
+                for view, stats in views.items():
+                    if view not in merged:
+                        merged[view] = self.empty_stats()
+                    total = merged[view]
+                    total['counts'] = [a + b for a, b in zip(total['counts'], stats['counts'])]
+                    total['max'] = max(total['max'], stats['max'])
+                    for key in ('count', 'sum', 'queries', 'db', 'n_plus_one'):
+                        total[key] += stats[key]
+
+        return {
+            'window_seconds': self.window,
+            'buckets_ms': self.buckets,
+            'views': {
+                view: {
+                    'count': stats['count'],
+                    'counts': stats['counts'],
+                    'mean_ms': round(stats['sum'] / stats['count'], 3),
+                    'p50_ms': self.percentile(stats, 0.5),
+                    'p95_ms': self.percentile(stats, 0.95),
+                    'p99_ms': self.percentile(stats, 0.99),
+                    'max_ms': round(stats['max'], 3),
+                    'mean_queries': round(stats['queries'] / stats['count'], 2),
+                    'mean_db_ms': round(stats['db'] / stats['count'], 3),
+                    'n_plus_one': stats['n_plus_one'],
+                }
+                for view, stats in sorted(merged.items())
+            },
+        }
+
+    def percentile(self, stats, fraction):
+        rank, seen = fraction * stats['count'], 0
+        for bound, count in zip(self.buckets, stats['counts']):
+            seen += count
+            if seen >= rank:
+                return bound
+        return round(stats['max'], 3)
+
+    def reset(self):
+        with self._lock:
+            self.slots.clear()
+
+
+request_histogram = RollingHistogram()
+
+request_duration = registry.histogram(
+    'coworking_request_duration_seconds', 'Duration of the API requests per URL name',
+    ['url_name', 'method'], buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5],
+)
+
+
+class InstrumentationMiddleware:
+    """
+    Count the queries and time the requests of the instrumented paths.
+
+    Each response gets a `Server-Timing` header (database, serialization and
+    total time), a structured log line is written on the `coworking.requests`
+    logger, at the WARNING level when statements of the same shape repeat
+    (N+1), and the request is added to the rolling histogram of its view and
+    to the `coworking_request_duration_seconds` Prometheus histogram.
+    Configured by the `REQUEST_INSTRUMENTATION` setting.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = get_config()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        for connection in connections.all():
+            install_query_timer(connection)
+
+    def instrumented(self, request):
+        return self.config['ENABLED'] and request.path.startswith(tuple(self.config['PATH_PREFIXES']))
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.instrumented(request):
+            return self.get_response(request)
+
+        for connection in connections.all():
+            install_query_timer(connection)
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.process(request, response, profile)
+
+    async def __acall__(self, request):
+        if not self.instrumented(request):
+            return await self.get_response(request)
+
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.process(request, response, profile)
+
+    def process(self, request, response, profile):
+        total = time.perf_counter() - profile.started
+        repeated = profile.repeated_queries(self.config['N_PLUS_ONE_THRESHOLD'])
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+
+        if self.config['SERVER_TIMING']:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={profile.db_seconds * 1000:.3f};desc="{profile.queries} queries"',
+                f'serialize;dur={profile.serialize_seconds * 1000:.3f}',
+                f'total;dur={total * 1000:.3f}',
+            ])
+        if self.config['LOG']:
+            logger.log(logging.WARNING if repeated else logging.INFO, json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': view,
+                'status': response.status_code,
+                'queries': profile.queries,
+                'db_ms': round(profile.db_seconds * 1000, 3),
+                'serialize_ms': round(profile.serialize_seconds * 1000, 3),
+                'total_ms': round(total * 1000, 3),
+                'n_plus_one': repeated,
+            }))
+        request_histogram.observe(view, total, profile.queries, profile.db_seconds, repeated)
+        request_duration.observe(total, url_name=view, method=request.method)
+        return response
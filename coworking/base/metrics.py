@@ -0,0 +1,153 @@
+import bisect
+import threading
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')) for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Metric of the process, its samples are kept per combination of label values.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self.values = {}
+
+    def key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f'{self.name} takes the labels {", ".join(self.labels)}')
+        return tuple(labels[name] for name in self.labels)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def exposition(self):
+        with self._lock:
+            values = sorted(self.values.items())
+        return self.header() + [
+            f'{self.name}{format_labels(self.labels, key)} {format_value(value)}' for key, value in values
+        ]
+
+    def reset(self):
+        with self._lock:
+            self.values.clear()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(self.key(labels), 0)
+
+
+class Histogram(Metric):
+    """
+    Cumulative histogram, bucket bounds are upper bounds in the unit of the observations.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=()):
+        super().__init__(name, documentation, labels)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self._lock:
+            if key not in self.values:
+                self.values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            sample = self.values[key]
+            sample['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            sample['sum'] += value
+
+    def exposition(self):
+        with self._lock:
+            values = sorted((key, {'counts': list(sample['counts']), 'sum': sample['sum']})
+                            for key, sample in self.values.items())
+        lines = self.header()
+        for key, sample in values:
+            cumulated = 0
+            for bound, count in zip(self.buckets + [float('inf')], sample['counts']):
+                cumulated += count
+                lines.append(
+                    f'{self.name}_bucket{format_labels(self.labels, key, [("le", format_value(bound))])} {cumulated}'
+                )
+            lines.append(f'{self.name}_sum{format_labels(self.labels, key)} {format_value(sample["sum"])}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, key)} {cumulated}')
+        return lines
+
+
+class CallbackGauge(Metric):
+    """
+    Gauge whose samples are read from `callback`, a `{label values: value}` dict, when exposed.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def exposition(self):
+        return self.header() + [
+            f'{self.name}{format_labels(self.labels, key)} {format_value(value)}'
+            for key, value in sorted(self.callback().items())
+        ]
+
+
+class Registry:
+    """
+    Metrics exposed in the Prometheus text format.
+
+    Counters and histograms are kept by each process, like the other in-process
+    statistics, the scraper sees the process answering the scrape.
+    """
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'A metric named {metric.name} is already registered')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=()):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name, documentation, labels=(), callback=None):
+        return self.register(CallbackGauge(name, documentation, labels, callback))
+
+    def exposition(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines += metric.exposition()
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
@@ -12,6 +12,12 @@ class TrackTimeModel(models.Model):
     class Meta:
         abstract = True
         ordering = ['-created_at']
+        indexes = [
+            # default ordering plus the pagination tie-breaker
+            models.Index(fields=['-created_at', '-id'], name='%(class)s_created_idx'),
+            # ETag and Last-Modified validators of the lists
+            models.Index(fields=['updated_at'], name='%(class)s_updated_idx'),
+        ]
 
 
 class TypeOfEquipment(models.TextChoices):
@@ -30,3 +36,8 @@ class EmployeeRole(models.TextChoices):
 class EquipmentStatus(models.TextChoices):
     FREE = 'free', 'Free'
     USED = 'used', 'Used'
+
+
+class AssignmentOperation(models.TextChoices):
+    ASSIGN = 'assign', 'Assign'
+    REVOKE = 'revoke', 'Revoke'
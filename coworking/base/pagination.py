@@ -0,0 +1,166 @@
+import json
+import uuid
+from base64 import b64decode, b64encode
+from collections import namedtuple
+from datetime import date, time
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+Cursor = namedtuple('Cursor', ['position', 'reverse'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a unique ordering (keyset pagination).
+
+    The cursor holds the ordering values of the last row of a page, the next
+    page is read with a `WHERE (created_at, id) < (...)` range so it costs
+    the same index seek however deep the client goes.
+    Ordering fields must be non nullable and end with a unique field, the
+    default ordering is used unless the queryset is already ordered.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        page_size = api_settings.PAGE_SIZE
+        max_page_size = settings.PAGINATION_MAX_PAGE_SIZE
+        try:
+            requested = int(request.GET[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return min(page_size, max_page_size)
+        if requested <= 0:
+            return min(page_size, max_page_size)
+        return min(requested, max_page_size)
+
+    def get_ordering(self, request, queryset, view):
+        # an ordering set on the queryset (see `base.filters.OrderingBackend`) takes precedence
+        return queryset.query.order_by or self.ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        return self.build_page(list(queryset[:self.page_size + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        return self.build_page([row async for row in queryset[:self.page_size + 1]])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Return the ordered and cursor filtered queryset of the requested page.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = self.get_ordering(request, queryset, view)
+        self.fields = [name.lstrip('-') for name in ordering]
+        self.descending = [name.startswith('-') for name in ordering]
+        self.cursor = self.decode_cursor(request, queryset.model)
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        ordering = [
+            ('-' if descending != reverse else '') + field
+            for field, descending in zip(self.fields, self.descending)
+        ]
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self._keyset_filter(self.cursor.position, reverse))
+        return queryset
+
+    def build_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.cursor is not None and self.cursor.reverse:
+            rows.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(self._position(self.page[-1]), reverse=False))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(self._position(self.page[0]), reverse=True))
+
+    def decode_cursor(self, request, model):
+        encoded = request.GET.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            data = json.loads(b64decode(encoded.encode('ascii'), altchars=b'-_'))
+            position = data['p']
+            if len(position) != len(self.fields):
+                raise ValueError
+            position = [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, position)
+            ]
+            return Cursor(position, reverse=bool(data.get('r')))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, cursor):
+        data = {'p': [self._dump_value(value) for value in cursor.position]}
+        if cursor.reverse:
+            data['r'] = 1
+        encoded = b64encode(json.dumps(data, separators=(',', ':')).encode(), altchars=b'-_').decode('ascii')
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def _position(self, row):
+        if isinstance(row, dict):
+            return [row[field] for field in self.fields]
+        return [getattr(row, field) for field in self.fields]
+
+    @staticmethod
+    def _dump_value(value):
+        # isoformat keeps the microseconds DjangoJSONEncoder would truncate
+        if isinstance(value, (date, time)):
+            return value.isoformat()
+        if isinstance(value, uuid.UUID):
+            return str(value)
+        return value
+
+    def _keyset_filter(self, position, reverse):
+        """
+        Rows strictly after `position` in the pagination ordering.
+
+        Built as `f1 <= v1 AND (f1 < v1 OR (f1 = v1 AND ...))` so the leading
+        column bounds an index range scan.
+        """
+        condition = None
+        for field, descending, value in reversed(list(zip(self.fields, self.descending, position))):
+            lookup = '__lt' if descending != reverse else '__gt'
+            strict = Q(**{field + lookup: value})
+            condition = strict if condition is None else strict | (Q(**{field: value}) & condition)
+        field, descending, value = self.fields[0], self.descending[0], position[0]
+        bound = Q(**{field + ('__lte' if descending != reverse else '__gte'): value})
+        return bound & condition
@@ -0,0 +1,116 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+# whether the reads of the current request may go to a replica, set by `ReplicaMiddleware`
+replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Read from the primary in this block, for the reads filling a cache among others
+    """
+    token = replica_reads.set(False)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Send the reads of the requests marked by `ReplicaMiddleware` to one of the
+    `DATABASE_REPLICAS` aliases, everything else to the primary.
+
+    The reads outside such a request (writes, management commands, tasks) stay
+    on the primary, so the reads of a write path see what it wrote. The replicas
+    get their schema and rows through the replication, not from the migrations.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if replicas and replica_reads.get():
+            return random.choice(replicas)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaMiddleware:
+    """
+    Let the reads of the safe requests go to the replicas, unless the client
+    wrote less than `REPLICA_STICKY_SECONDS` ago.
+
+    A write answers a cookie holding the end of that window: the requests of
+    the client read from the primary until then, so they see their own writes
+    whatever the replication lag. The views writing on a safe method declare
+    `writes = True`: they are routed and answered like the unsafe methods.
+    """
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'coworking_primary_until'
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = replica_reads.set(self.reads_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        return self.process(request, response)
+
+    async def __acall__(self, request):
+        token = replica_reads.set(self.reads_replica(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        return self.process(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        if getattr(view_class, 'writes', False):
+            request.writes = True
+            replica_reads.set(False)
+
+    def writes(self, request):
+        return request.method not in self.safe_methods or getattr(request, 'writes', False)
+
+    def reads_replica(self, request):
+        if not settings.DATABASE_REPLICAS or request.method not in self.safe_methods:
+            return False
+        try:
+            return float(request.COOKIES[self.cookie_name]) <= time.time()
+        except (KeyError, ValueError):
+            return True
+
+    def process(self, request, response):
+        window = settings.REPLICA_STICKY_SECONDS
+        if settings.DATABASE_REPLICAS and self.writes(request) and window > 0:
+            response.set_cookie(
+                self.cookie_name, f'{time.time() + window:.3f}', max_age=window, httponly=True, samesite='Lax'
+            )
+        return response
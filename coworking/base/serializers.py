@@ -0,0 +1,252 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from rest_framework import relations, serializers
+from rest_framework.validators import UniqueTogetherValidator
+
+from base.instrumentation import measure_serialization
+from base.signals import bulk_created
+
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key related field reading the objects prefetched by a BulkListSerializer,
+    so a batch resolves its references with one query instead of one per item.
+    """
+
+    def to_internal_value(self, data):
+        prefetched = getattr(self.root, 'prefetched', {}).get(self.field_name)
+        if prefetched is None:
+            return super().to_internal_value(data)
+
+        try:
+            pk = self.get_queryset().model._meta.pk.to_python(data)
+        except (DjangoValidationError, TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in prefetched:
+            self.fail('does_not_exist', pk_value=data)
+        return prefetched[pk]
+
+
+class ModelSerializer(serializers.ModelSerializer):
+    """
+    Model serializer adding its representation time to the serialization time of the request,
+    the base of the serializers of the API
+    """
+
+    def to_representation(self, instance):
+        with measure_serialization():
+            return super().to_representation(instance)
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    List serializer creating its objects with `bulk_create`.
+
+    The objects referenced by the items are loaded with one query per relation,
+    the unique together constraints are checked with one query per batch.
+    With `allow_partial` in the context, the invalid items are reported in
+    `row_errors` and the valid ones are still created, otherwise the whole
+    batch is rejected or created at once.
+    """
+    batch_size = 1000
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            return super().to_internal_value(data)
+
+        self.prefetch_related(data)
+        self.take_unique_together_validators()
+        if not self.context.get('allow_partial'):
+            validated = super().to_internal_value(data)
+            errors = self.validate_batch(validated)
+            if any(errors):
+                raise serializers.ValidationError(errors)
+            return validated
+
+        validated, self.valid_indexes, self.row_errors = [], [], []
+        for index, item in enumerate(data):
+            try:
+                validated.append(self.child.run_validation(item))
+            except serializers.ValidationError as exc:
+                self.row_errors.append({'index': index, 'errors': exc.detail})
+            else:
+                self.valid_indexes.append(index)
+
+        errors = self.validate_batch(validated)
+        if any(errors):
+            for index, error in zip(self.valid_indexes, errors):
+                if error:
+                    self.row_errors.append({'index': index, 'errors': error})
+            validated = [attrs for attrs, error in zip(validated, errors) if not error]
+            self.valid_indexes = [index for index, error in zip(self.valid_indexes, errors) if not error]
+            self.row_errors.sort(key=lambda row: row['index'])
+        return validated
+
+    def validate_batch(self, validated):
+        """
+        Return the errors of the validated items checked against the whole batch, in order
+        """
+        return self.unique_together_errors(validated)
+
+    def take_unique_together_validators(self):
+        """
+        Take the unique together validators off the items, they are run on the whole batch
+        """
+        validators = self.child.validators
+        self.unique_validators = [
+            validator for validator in validators if isinstance(validator, UniqueTogetherValidator)
+        ]
+        self.child.validators = [
+            validator for validator in validators if not isinstance(validator, UniqueTogetherValidator)
+        ]
+
+    def unique_together_errors(self, validated):
+        """
+        Return the errors of the items taken by existing rows or by a previous item of the batch
+        """
+        errors = [{} for _ in validated]
+        for validator in self.unique_validators:
+            fields = validator.fields
+            keys = [tuple(getattr(attrs.get(name), 'pk', attrs.get(name)) for name in fields) for attrs in validated]
+            candidates = list({key for key in keys if None not in key})
+            taken = set()
+            for start in range(0, len(candidates), self.batch_size):
+                condition = Q(
+                    *(Q(**dict(zip(fields, key))) for key in candidates[start:start + self.batch_size]),
+                    _connector=Q.OR,
+                )
+                taken.update(validator.queryset.filter(condition).values_list(*fields))
+
+            message = validator.message.format(field_names=', '.join(fields))
+            seen = set()
+            for error, key in zip(errors, keys):
+                if key in taken or key in seen:
+                    error.setdefault('non_field_errors', []).append(message)
+                seen.add(key)
+        return errors
+
+    def prefetch_related(self, data):
+        # callers already holding the referenced objects pass them in the context
+        if 'prefetched' in self.context:
+            self.prefetched = self.context['prefetched']
+            return
+
+        self.prefetched = {}
+        for name, field in self.child.fields.items():
+            if field.read_only or not isinstance(field, PrefetchedPrimaryKeyRelatedField):
+                continue
+
+            pk_field = field.get_queryset().model._meta.pk
+            pks = set()
+            for item in data:
+                try:
+                    pks.add(pk_field.to_python(item[name]))
+                except (DjangoValidationError, KeyError, TypeError, ValueError):
+                    continue
+            self.prefetched[name] = field.get_queryset().in_bulk(pks - {None})
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        objs = [model(**attrs) for attrs in validated_data]
+
+        if not self.context.get('allow_partial'):
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_create(objs, batch_size=self.batch_size)
+                    bulk_created.send(sender=model, objs=objs)
+            except IntegrityError as error:
+                raise serializers.ValidationError({'non_field_errors': [str(error)]})
+            return objs
+
+        created = []
+        for start in range(0, len(objs), self.batch_size):
+            batch = objs[start:start + self.batch_size]
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_create(batch)
+                    bulk_created.send(sender=model, objs=batch)
+                created += batch
+            except IntegrityError:
+                created += self.create_one_by_one(batch, self.valid_indexes[start:start + self.batch_size])
+        return created
+
+    def create_one_by_one(self, objs, indexes):
+        """
+        Insert the items of a rejected batch on their own to find the faulty ones
+        """
+        created = []
+        for obj, index in zip(objs, indexes):
+            try:
+                with transaction.atomic():
+                    obj.save(force_insert=True)
+                created.append(obj)
+            except (IntegrityError, ValueError) as error:
+                self.row_errors.append({'index': index, 'errors': {'non_field_errors': [str(error)]}})
+        self.row_errors.sort(key=lambda row: row['index'])
+        return created
+
+
+class ValuesSerializer:
+    """
+    Read-only serializer of `.values()` rows, giving the same representation as a
+    ModelSerializer class.
+
+    The fields of the serializer are introspected once, a row is then turned into
+    a dict by applying the precomputed converter of each column: no model
+    instance, no field lookup and no per row serializer.
+    """
+    # representations of these fields are the database values themselves
+    identity_fields = (
+        serializers.BooleanField,
+        serializers.CharField,
+        serializers.ChoiceField,
+        serializers.IntegerField,
+        relations.PrimaryKeyRelatedField,
+    )
+    _instances = {}
+
+    def __init__(self, serializer_class):
+        self.columns = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            self.columns.append((name, field.source, self.get_converter(field)))
+        self.sources = [source for _, source, _ in self.columns]
+
+    @classmethod
+    def of(cls, serializer_class):
+        """
+        Return the values serializer of a serializer class, built once per class
+        """
+        if serializer_class not in cls._instances:
+            cls._instances[serializer_class] = cls(serializer_class)
+        return cls._instances[serializer_class]
+
+    def get_converter(self, field):
+        if isinstance(field, relations.PrimaryKeyRelatedField) and field.pk_field is not None:
+            return field.pk_field.to_representation
+        if isinstance(field, self.identity_fields):
+            return None
+        if isinstance(field, serializers.UUIDField) and field.uuid_format == 'hex_verbose':
+            return str
+        return field.to_representation
+
+    def values(self, queryset):
+        return queryset.values(*self.sources)
+
+    def to_representation(self, rows):
+        with measure_serialization():
+            return list(self.iter_representation(rows))
+
+    def iter_representation(self, rows):
+        """
+        Lazily represent the rows, for streamed responses
+        """
+        columns = self.columns
+        for row in rows:
+            item = {}
+            for name, source, convert in columns:
+                value = row[source]
+                item[name] = value if convert is None or value is None else convert(value)
+            yield item
@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+
+# sent by BulkListSerializer with the `objs` inserted by `bulk_create`, which sends no post_save,
+# in the transaction of the insert
+bulk_created = Signal()
@@ -1,3 +1,168 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.db import router, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.mixins import RetrieveModelMixin
+from rest_framework.renderers import JSONRenderer
+
+from api.serializers import CompanySerializer, EmployeeSerializer, EquipmentSerializer
+from base.cache import detail_cache
+from base.instrumentation import RollingHistogram
+from base.models import EmployeeRole
+from base.routers import ReplicaMiddleware, primary_reads
+from base.serializers import ValuesSerializer
+from management.models import Company, Employee, Equipment
+
+
+class ValuesSerializerTests(TestCase):
+
+    def setUp(self):
+        company = Company.objects.create(name='LtuTech', active=True)
+        employee = Employee.objects.create(
+            name='Rami', surname='Belgacem', active=True, role=EmployeeRole.DEV, company=company
+        )
+        Equipment.objects.create(equipment_type='screen', size=24, model='ACER', status='used', employee=employee)
+        Equipment.objects.create(equipment_type='pc', memory=32, hard_disk_size=512, model='HP', status='free')
+
+    def assertSameOutput(self, serializer_class):
+        queryset = serializer_class.Meta.model.objects.all()
+        values_serializer = ValuesSerializer.of(serializer_class)
+
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        rendered = JSONRenderer().render(values_serializer.to_representation(values_serializer.values(queryset)))
+        self.assertEqual(rendered, expected)
+
+    def test_same_output(self):
+        """
+        Ensure values rows render byte for byte like the model serializers.
+        """
+        for serializer_class in (CompanySerializer, EmployeeSerializer, EquipmentSerializer):
+            self.assertSameOutput(serializer_class)
+
+    @override_settings(TIME_ZONE='Europe/Paris')
+    def test_same_output_in_time_zone(self):
+        """
+        Ensure datetimes are converted to the current time zone like the model serializers do.
+        """
+        self.assertSameOutput(EquipmentSerializer)
+
+
+class RollingHistogramTests(TestCase):
+
+    def test_window(self):
+        """
+        Ensure requests leave the histogram once their slot is out of the window.
+        """
+        histogram = RollingHistogram(buckets=[10, 100], window=60, slots=6)
+        with mock.patch('base.instrumentation.time.time', return_value=1000.0):
+            histogram.observe('company-list', 0.005, 2, 0.001, [])
+            histogram.observe('company-list', 0.050, 12, 0.030, [{'sql': 'SELECT', 'count': 10}])
+        with mock.patch('base.instrumentation.time.time', return_value=1035.0):
+            histogram.observe('company-list', 0.500, 2, 0.001, [])
+            stats = histogram.snapshot()['views']['company-list']
+        self.assertEqual(stats['counts'], [1, 1, 1])
+        self.assertEqual((stats['p50_ms'], stats['p99_ms'], stats['max_ms']), (100, 500.0, 500.0))
+        self.assertEqual((stats['mean_queries'], stats['n_plus_one']), (5.33, 1))
+
+        with mock.patch('base.instrumentation.time.time', return_value=1065.0):
+            self.assertEqual(histogram.snapshot()['views']['company-list']['counts'], [0, 0, 1])
+
+
+class DetailCacheTests(TestCase):
+
+    def test_invalidated_on_commit(self):
+        """
+        Ensure a payload read before a write commits is never served, and a rolled back write keeps the payload.
+        """
+        company = Company.objects.create(name='LtuTech')
+        _, generation = detail_cache.get(Company, company.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            detail_cache.invalidate(Company, [company.pk])
+        # filled after the invalidation under the generation read before it
+        detail_cache.set(Company, company.pk, {'name': 'LtuTech'}, generation)
+        self.assertIsNone(detail_cache.peek(Company, company.pk))
+
+        _, generation = detail_cache.get(Company, company.pk)
+        detail_cache.set(Company, company.pk, {'name': 'LtuTech'}, generation)
+        with self.captureOnCommitCallbacks() as callbacks, self.assertRaises(ValueError):
+            with transaction.atomic():
+                detail_cache.invalidate(Company, [company.pk])
+                raise ValueError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(detail_cache.peek(Company, company.pk), {'name': 'LtuTech'})
+
+    def test_write_during_fill(self):
+        """
+        Ensure a detail read before a write committed during its fill is not cached.
+        """
+        company = Company.objects.create(name='LtuTech')
+        url = reverse('company-detail', args=(company.pk,))
+        retrieve = RetrieveModelMixin.retrieve
+
+        def retrieve_then_write(view, request, *args, **kwargs):
+            response = retrieve(view, request, *args, **kwargs)
+            written = Company.objects.get(pk=company.pk)
+            written.active = True
+            with self.captureOnCommitCallbacks(execute=True):
+                written.save()
+            return response
+
+        with mock.patch.object(RetrieveModelMixin, 'retrieve', retrieve_then_write):
+            self.assertEqual(self.client.get(url).json()['active'], False)
+        self.assertEqual(self.client.get(url).json()['active'], True)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'], REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.routed = []
+
+        def view(request):
+            self.routed.append((router.db_for_read(Employee), router.db_for_write(Employee)))
+            with primary_reads():
+                self.routed.append((router.db_for_read(Employee), router.db_for_write(Employee)))
+            return HttpResponse()
+
+        self.middleware = ReplicaMiddleware(view)
+
+    def test_safe_requests_read_replicas(self):
+        """
+        Ensure the safe requests read from a replica, the cache fills and everything else from the primary.
+        """
+        response = self.middleware(self.factory.get('/api/v1/employee/'))
+        self.assertIn(self.routed[0][0], ['replica1', 'replica2'])
+        self.assertEqual(self.routed[0][1], 'default')
+        self.assertEqual(self.routed[1], ('default', 'default'))
+        self.assertNotIn(ReplicaMiddleware.cookie_name, response.cookies)
+        # outside of a request
+        self.assertEqual(router.db_for_read(Employee), 'default')
+
+        self.routed.clear()
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.middleware(self.factory.get('/api/v1/employee/'))
+        self.assertEqual(self.routed[0], ('default', 'default'))
+
+    def test_reads_stick_to_primary_after_write(self):
+        """
+        Ensure a client reads from the primary during the window following its write.
+        """
+        response = self.middleware(self.factory.post('/api/v1/employee/'))
+        self.assertEqual(self.routed[0], ('default', 'default'))
+        cookie = response.cookies[ReplicaMiddleware.cookie_name]
+        self.assertEqual(cookie['max-age'], 5)
+
+        self.routed.clear()
+        request = self.factory.get('/api/v1/employee/')
+        request.COOKIES[ReplicaMiddleware.cookie_name] = cookie.value
+        self.middleware(request)
+        self.assertEqual(self.routed[0][0], 'default')
+
+        self.routed.clear()
+        with mock.patch('base.routers.time.time', return_value=time.time() + 6):
+            self.middleware(request)
+        self.assertIn(self.routed[0][0], ['replica1', 'replica2'])
@@ -1,65 +1,84 @@
+from collections import namedtuple
+
+from django.db.models import Q
+
 from base.models import TypeOfEquipment
 
 
-class RuleValidator:
+# limits of a role for a type of equipment, None when there is no limit
+Rule = namedtuple('Rule', ['max_count', 'min_memory', 'min_hard_disk_size'])
+
+
+class RolePolicy:
     """
-    Abstract class for all business rules
+    Compiled business rules of a role.
+
+    A role without rules may hold any equipment. Otherwise it may only hold the
+    types of equipment it has a rule for, within the limits of the rule.
     """
-    def __init__(self, employee, equipment):
-        self.employee = employee
-        self.equipment = equipment
+    def __init__(self, role, rules=None):
+        self.role = role
+        self.rules = rules
 
-    def is_valid(self):
+    def rule(self, equipment_type):
         """
-        Check if a rule is valid
+        Rule of a type of equipment, raise a ValueError if the role may not hold it
         """
-        return NotImplementedError("Subclass must implement this method!")
+        if self.rules is None:
+            return Rule(None, None, None)
+        if equipment_type not in self.rules:
+            raise ValueError(f'Employees of role {self.role} can not be given a {equipment_type}')
+        return self.rules[equipment_type]
 
+    def check_count(self, rule, equipment_type, counts):
+        if rule.max_count is not None and counts[equipment_type] >= rule.max_count:
+            raise ValueError(
+                f'Employees of role {self.role} can have at most {rule.max_count} {equipment_type}'
+            )
 
-class InternRuleValidator(RuleValidator):
-    """
-    Rule validator for Intern employees
-    """
-    def is_valid(self):
+    def criteria_error(self, rule, equipment_type):
+        return (
+            f'Employees of role {self.role} need a {equipment_type} with at least '
+            f'{rule.min_memory or 0}go of memory and {rule.min_hard_disk_size or 0}go of hard disk'
+        )
+
+    def check(self, equipment, counts):
         """
-        An Intern can have only 1 pc and 1 screen
+        Raise a ValueError if the equipment can not be given to an employee holding `counts` equipments per type
         """
-        if ((self.employee.equipments.filter(equipment_type=TypeOfEquipment.PC).count() < 1
-                and self.equipment.equipment_type == TypeOfEquipment.PC)
-                or
-                (self.employee.equipments.filter(equipment_type=TypeOfEquipment.SCREEN).count() < 1
-                 and self.equipment.equipment_type == TypeOfEquipment.SCREEN)):
-            return True
-        return False
-
+        rule = self.rule(equipment.equipment_type)
+        self.check_count(rule, equipment.equipment_type, counts)
+        if (rule.min_memory is not None and (equipment.memory or 0) < rule.min_memory) \
+                or (rule.min_hard_disk_size is not None and (equipment.hard_disk_size or 0) < rule.min_hard_disk_size):
+            raise ValueError(self.criteria_error(rule, equipment.equipment_type))
 
-class DevRuleValidator(RuleValidator):
-    """
-    Rule validator for developers employees
-    """
-    def is_valid(self):
+    def suitable_equipment(self, equipment_type, counts):
         """
-        A developer can have only  1 pc and no more than 2 screens.
+        Condition on the equipments of a type that can be given to an employee holding `counts`
+        equipments per type, raise a ValueError if there are none
         """
-        if ((self.employee.equipments.filter(equipment_type=TypeOfEquipment.PC).count() < 1
-                and self.equipment.equipment_type == TypeOfEquipment.PC)
-                or
-                (self.employee.equipments.filter(equipment_type=TypeOfEquipment.SCREEN).count() < 2
-                 and self.equipment.equipment_type == TypeOfEquipment.SCREEN)):
-            return True
-        return False
+        rule = self.rule(equipment_type)
+        self.check_count(rule, equipment_type, counts)
+        condition = Q()
+        if rule.min_memory is not None:
+            condition &= Q(memory__gte=rule.min_memory)
+        if rule.min_hard_disk_size is not None:
+            condition &= Q(hard_disk_size__gte=rule.min_hard_disk_size)
+        return condition
 
 
-class TechLeadRuleValidator(RuleValidator):
+class PolicyTable:
     """
-    Rule validator for tech lead employees
+    Policies of all roles, compiled from rows of
+    `(role, equipment_type, max_count, min_memory, min_hard_disk_size)`.
     """
-    def is_valid(self):
-        """
-        A Tech Lead pc must have minimum 32gb of memory and 512 hard disk.
-        """
-        if self.equipment.equipment_type == TypeOfEquipment.PC \
-                and self.equipment.memory >= 32 \
-                and self.equipment.hard_disk_size >= 512:
-            return True
-        return False
+    def __init__(self, rows):
+        rules = {}
+        for role, equipment_type, *limits in rows:
+            rules.setdefault(role, {})[TypeOfEquipment(equipment_type)] = Rule(*limits)
+        self.policies = {role: RolePolicy(role, role_rules) for role, role_rules in rules.items()}
+
+    def __getitem__(self, role):
+        if role not in self.policies:
+            return RolePolicy(role)
+        return self.policies[role]
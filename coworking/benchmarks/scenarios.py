@@ -0,0 +1,231 @@
+"""
+Run repeatable API scenarios on a seeded database and compare them to a baseline.
+
+Every scenario sends its requests through the whole Django stack in process
+and reports the throughput, the p50/p95/p99 latencies and the queries per
+request (from the `Server-Timing` header of the instrumentation middleware).
+The writes are undone by the scenarios themselves, so runs can be repeated.
+
+Run from the project directory, on a database of its own (seeded when empty):
+`COWORKING_DATABASE_NAME=bench-100k.sqlite3 python -m benchmarks.scenarios --rows 100k`
+  `[--scenarios list detail ...] [--requests 200] [--baseline benchmarks/baseline.json]`
+  `[--save-baseline] [--tolerance 0.5]`
+The run fails when a scenario runs more queries per request, or has a p50 latency
+or a throughput worse by more than the tolerance, than the baseline of the same
+number of rows. Latencies depend on the machine: record a baseline
+on the machine comparing against it.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'coworking.settings')
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from base.models import EmployeeRole, EquipmentStatus, TypeOfEquipment  # noqa: E402
+from benchmarks.seeding import parse_rows, seed, write  # noqa: E402
+from management.models import Employee, Equipment  # noqa: E402
+
+
+BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+class Scenarios:
+    """
+    Requests of every scenario, on rows sampled with a fixed seed
+    """
+    names = ('list', 'detail', 'assign', 'bulk', 'ledger', 'summary', 'lastyear', 'period', 'hiring')
+    bulk_size = 100
+
+    def __init__(self, requests, seed=0):
+        self.requests = requests
+        self.rng = random.Random(seed)
+        # primary keys are random: the first ones in their order are a sample
+        self.employees = list(Employee.objects.order_by('pk').values_list('pk', flat=True)[:requests])
+        self.equipments = list(Equipment.objects.order_by('pk').values_list('pk', flat=True)[:requests])
+
+    def list(self):
+        paths = [
+            reverse('company-list'),
+            reverse('employee-list') + '?active=true&ordering=surname',
+            reverse('equipment-list') + f'?status={EquipmentStatus.FREE}&equipment_type={TypeOfEquipment.PC}',
+            reverse('equipment-list') + '?memory__gte=32&page_size=500',
+        ]
+        for index in range(self.requests):
+            yield 'list', 'get', paths[index % len(paths)], None, 200
+
+    def detail(self):
+        for index in range(self.requests):
+            if index % 2:
+                yield 'detail', 'get', reverse('equipment-detail', args=(self.rng.choice(self.equipments),)), None, 200
+            else:
+                yield 'detail', 'get', reverse('employee-detail', args=(self.rng.choice(self.employees),)), None, 200
+
+    def unrestricted_pairs(self, count):
+        """
+        Free equipments and active employees whose role has no rules, so every assignment succeeds
+        """
+        employees = list(
+            Employee.objects.filter(active=True, role__in=[EmployeeRole.IT, EmployeeRole.CTO])
+            .order_by('pk').values_list('pk', flat=True)[:count]
+        )
+        equipments = Equipment.objects.filter(status=EquipmentStatus.FREE).order_by('pk') \
+            .values_list('pk', flat=True)[:count]
+        return [(equipment, employees[index % len(employees)]) for index, equipment in enumerate(equipments)]
+
+    def assign(self):
+        for equipment, employee in self.unrestricted_pairs(self.requests // 2):
+            yield 'assign', 'post', reverse('employee-equipment-assign', args=(equipment, employee)), None, 200
+            yield 'revoke', 'post', reverse('employee-equipment-revoke', args=(equipment, employee)), None, 200
+
+    def bulk(self):
+        pairs = self.unrestricted_pairs(self.bulk_size * max(1, self.requests // 20))
+        for start in range(0, len(pairs), self.bulk_size):
+            payload = [
+                {'equipment': str(equipment), 'employee': str(employee)}
+                for equipment, employee in pairs[start:start + self.bulk_size]
+            ]
+            yield 'bulk-assign', 'post', reverse('equipment-bulk-assign'), payload, 200
+            yield 'bulk-revoke', 'post', reverse('equipment-bulk-revoke'), payload, 200
+
+    def ledger(self):
+        for index in range(self.requests):
+            if index % 2:
+                path = reverse('equipment-holder', args=(self.rng.choice(self.equipments),))
+                yield 'holder', 'get', path, None, 200
+            else:
+                path = reverse('employee-holdings', args=(self.rng.choice(self.employees),))
+                yield 'holdings', 'get', path, None, 200
+
+    def summary(self):
+        for _ in range(self.requests):
+            yield 'summary', 'get', reverse('inventory-summary'), None, 200
+
+    def lastyear(self):
+        path = reverse('employee-hired') + f'?role={EmployeeRole.TECHLEAD}&start={date.today() - timedelta(days=365)}'
+        for _ in range(self.requests):
+            yield 'lastyear', 'get', path, None, 200
+
+    def period(self):
+        year = date.today().year
+        for index in range(self.requests):
+            start = year - 1 - index % 2
+            path = reverse('employee-hired') + f'?role={EmployeeRole.INTERN}&start={start}-01-01&end={year}-12-31'
+            yield 'period', 'get', path, None, 200
+
+    def hiring(self):
+        start = date.today() - timedelta(days=365)
+        for index in range(self.requests):
+            role = EmployeeRole.values[index % len(EmployeeRole.values)]
+            bucket = ('month', 'week')[index % 2]
+            path = reverse('employee-hired') + f'?role={role}&start={start}&bucket={bucket}'
+            yield 'hiring', 'get', path, None, 200
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(scenarios, names):
+    client = Client()
+    samples = {}
+    for name in names:
+        for step, method, path, data, expected in getattr(scenarios, name)():
+            started = time.perf_counter()
+            response = getattr(client, method)(path, data, content_type='application/json')
+            seconds = time.perf_counter() - started
+            if response.status_code != expected:
+                sys.exit(f'{step} {path}: status {response.status_code}, {response.content[:200]!r}')
+            queries = int(QUERIES.search(response['Server-Timing']).group(1))
+            samples.setdefault(step, []).append((seconds, queries))
+
+    results = {}
+    for step, values in samples.items():
+        latencies = sorted(seconds for seconds, _ in values)
+        results[step] = {
+            'requests': len(values),
+            'throughput': round(len(values) / sum(latencies), 1),
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'queries': round(sum(queries for _, queries in values) / len(values), 2),
+        }
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    found = []
+    for step, result in results.items():
+        reference = baseline.get(step)
+        if reference is None:
+            continue
+        if result['queries'] > reference['queries']:
+            found.append(f"{step}: {result['queries']} queries per request, baseline {reference['queries']}")
+        if result['p50_ms'] > reference['p50_ms'] * (1 + tolerance):
+            found.append(f"{step}: p50 {result['p50_ms']}ms, baseline {reference['p50_ms']}ms")
+        if result['throughput'] < reference['throughput'] / (1 + tolerance):
+            found.append(f"{step}: {result['throughput']} requests/s, baseline {reference['throughput']}")
+    return found
+
+
+def report(results):
+    write(f"{'scenario':<12} {'requests':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+    for step, result in results.items():
+        write(f"{step:<12} {result['requests']:>8} {result['throughput']:>9} {result['p50_ms']:>9} "
+              f"{result['p95_ms']:>9} {result['p99_ms']:>9} {result['queries']:>8}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=parse_rows, default=10_000, help='employees of the seeded database')
+    parser.add_argument('--scenarios', nargs='+', choices=Scenarios.names, default=list(Scenarios.names))
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='record the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='slowdown allowed against the baseline')
+    options = parser.parse_args()
+
+    if Path(settings.DATABASES['default']['NAME']) == settings.BASE_DIR / 'db.sqlite3':
+        parser.exit(1, 'Set COWORKING_DATABASE_NAME to a database file for the benchmarks\n')
+    call_command('migrate', verbosity=0)
+    employees = Employee.objects.count()
+    if not employees:
+        write(f'Seeding {options.rows} employees...')
+        write(seed(options.rows, options.seed))
+    elif employees != options.rows:
+        parser.exit(1, f'The database has {employees} employees, not {options.rows}\n')
+
+    # the query log of DEBUG would be part of the measures, the request log of the console
+    settings.DEBUG = False
+    settings.REQUEST_INSTRUMENTATION = {**settings.REQUEST_INSTRUMENTATION, 'LOG': False}
+    results = run(Scenarios(options.requests, options.seed), options.scenarios)
+    report(results)
+
+    baselines = json.loads(options.baseline.read_text()) if options.baseline.exists() else {}
+    key = str(options.rows)
+    if options.save_baseline:
+        baselines[key] = {**baselines.get(key, {}), **results}
+        options.baseline.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+        write(f'Baseline of {key} rows saved to {options.baseline}')
+    elif key in baselines:
+        found = regressions(results, baselines[key], options.tolerance)
+        if found:
+            sys.exit('Regressions against the baseline:\n' + '\n'.join(found))
+        write(f'No regression against the baseline of {key} rows')
+    else:
+        write(f'No baseline of {key} rows in {options.baseline}')
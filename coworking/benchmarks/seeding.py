@@ -0,0 +1,251 @@
+"""
+Fill the database with generated companies, employees and equipments.
+
+Roles, company sizes, equipment types and criteria follow realistic
+distributions, the equipments held respect the equipment rules, the
+employee counters match them and the assignment ledger opens their holdings.
+The company summary is rebuilt at the end. The same seed generates the same rows.
+
+Run from the project directory, on a database of its own:
+`COWORKING_DATABASE_NAME=bench.sqlite3 python manage.py migrate`
+`COWORKING_DATABASE_NAME=bench.sqlite3 python -m benchmarks.seeding ROWS [--seed 0] [--batch-size 5000]`
+ROWS is the number of employees (`10k`, `100k`, `1m` or a number), with
+one company per 50 employees and about two equipments per employee.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'coworking.settings')
+django.setup()
+
+from django.db import transaction  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from base.models import EmployeeRole, EquipmentStatus, TypeOfEquipment  # noqa: E402
+from management.metrics import stock  # noqa: E402
+from management.models import (  # noqa: E402
+    AssignmentEvent,
+    Company,
+    CompanyRoleSummary,
+    Employee,
+    Equipment,
+    EquipmentRule
+)
+
+
+ROLES = {
+    EmployeeRole.DEV: 55,
+    EmployeeRole.INTERN: 15,
+    EmployeeRole.TECHLEAD: 12,
+    EmployeeRole.IT: 13,
+    EmployeeRole.CTO: 5,
+}
+# equipments an equipped employee of a role asks for, within the limits of its rules
+KITS = {
+    EmployeeRole.DEV: {TypeOfEquipment.PC: 1, TypeOfEquipment.SCREEN: 2},
+    EmployeeRole.INTERN: {TypeOfEquipment.PC: 1, TypeOfEquipment.SCREEN: 1},
+    EmployeeRole.TECHLEAD: {TypeOfEquipment.PC: 1, TypeOfEquipment.SCREEN: 2},
+    EmployeeRole.IT: {TypeOfEquipment.PC: 1, TypeOfEquipment.SCREEN: 2},
+    EmployeeRole.CTO: {TypeOfEquipment.PC: 1, TypeOfEquipment.SCREEN: 1},
+}
+PC_MEMORY = {8: 20, 16: 40, 32: 30, 64: 10}
+PC_HARD_DISK = {256: 25, 512: 50, 1024: 25}
+PC_MODELS = ['HP EliteBook', 'Dell Latitude', 'Lenovo ThinkPad', 'Apple MacBook Pro']
+SCREEN_SIZES = {22: 15, 24: 45, 27: 30, 32: 10}
+SCREEN_MODELS = ['Dell P2422H', 'LG 27UL500', 'Samsung S24', 'ACER K242']
+
+EMPLOYEES_PER_COMPANY = 50
+ACTIVE_COMPANIES = 0.95
+ACTIVE_EMPLOYEES = 0.9
+# chance an active employee holds each equipment of its kit
+EQUIPPED = 0.8
+# free equipments, as a share of the held ones
+FREE_EQUIPMENTS = 0.3
+YEARS = 3
+
+
+def parse_rows(value):
+    value = value.lower()
+    for suffix, factor in (('k', 1_000), ('m', 1_000_000)):
+        if value.endswith(suffix):
+            return int(float(value[:-1]) * factor)
+    return int(value)
+
+
+def write(line):
+    """
+    Write a line of the report on the standard output
+    """
+    sys.stdout.write(f'{line}\n')
+
+
+@contextmanager
+def kept_timestamps(*models):
+    """
+    Insert the generated `created_at` and `updated_at` instead of the current time
+    """
+    fields = [model._meta.get_field(name) for model in models for name in ('created_at', 'updated_at')]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Seeder:
+
+    def __init__(self, rows, seed=0, batch_size=5000):
+        self.rows = rows
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.now = timezone.now()
+        self.policy = EquipmentRule.policy()
+        self.created = {Company: 0, Employee: 0, Equipment: 0, AssignmentEvent: 0}
+
+    def uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def moment(self, oldest_days, newest_days=0):
+        return self.now - timedelta(days=self.rng.uniform(newest_days, oldest_days))
+
+    def pick(self, weights):
+        return self.rng.choices(list(weights), weights=list(weights.values()))[0]
+
+    def run(self, progress=None):
+        started = time.monotonic()
+        with kept_timestamps(Company, Employee, Equipment):
+            companies = self.create_companies()
+            # a few large companies and many small ones
+            company_weights = list(accumulate(1 / (rank + 1) ** 0.8 for rank in range(len(companies))))
+            held = 0
+            for start in range(0, self.rows, self.batch_size):
+                size = min(self.batch_size, self.rows - start)
+                employees, equipments = self.make_employees(
+                    self.rng.choices(companies, cum_weights=company_weights, k=size)
+                )
+                held += len(equipments)
+                self.insert(Employee, employees)
+                self.insert(Equipment, equipments)
+                self.insert(AssignmentEvent, [
+                    AssignmentEvent.assignment(equipment.pk, equipment.employee_id, equipment.equipment_type,
+                                               equipment.created_at)
+                    for equipment in equipments
+                ])
+                if progress is not None:
+                    progress(self.report(started))
+
+            free = int(held * FREE_EQUIPMENTS)
+            for start in range(0, free, self.batch_size):
+                self.insert(Equipment, [self.make_equipment() for _ in range(min(self.batch_size, free - start))])
+        with transaction.atomic():
+            CompanyRoleSummary.rebuild()
+        stock.forget()
+        return self.report(started)
+
+    def report(self, started):
+        seconds = time.monotonic() - started
+        rows = sum(self.created.values())
+        return {
+            'created': {model.__name__.lower(): count for model, count in self.created.items()},
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(rows / seconds) if seconds else None,
+        }
+
+    def insert(self, model, objs):
+        with transaction.atomic():
+            model.objects.bulk_create(objs, batch_size=self.batch_size)
+        self.created[model] += len(objs)
+
+    def create_companies(self):
+        companies = []
+        for index in range(max(1, self.rows // EMPLOYEES_PER_COMPANY)):
+            created_at = self.moment(YEARS * 365 + 2 * 365, YEARS * 365)
+            companies.append(Company(
+                id=self.uuid(), name=f'Company {index}', active=self.rng.random() < ACTIVE_COMPANIES,
+                created_at=created_at, updated_at=created_at,
+            ))
+        for start in range(0, len(companies), self.batch_size):
+            self.insert(Company, companies[start:start + self.batch_size])
+        return [company.pk for company in companies]
+
+    def make_employees(self, company_ids):
+        employees, equipments = [], []
+        for company_id in company_ids:
+            index = self.created[Employee] + len(employees)
+            created_at = self.moment(YEARS * 365)
+            employee = Employee(
+                id=self.uuid(), name=f'Name {index}', surname=f'Surname {index}', company_id=company_id,
+                role=self.pick(ROLES), active=self.rng.random() < ACTIVE_EMPLOYEES,
+                created_at=created_at, updated_at=created_at,
+            )
+            if employee.active:
+                equipments += self.make_kit(employee)
+            employees.append(employee)
+        return employees, equipments
+
+    def make_kit(self, employee):
+        policy = self.policy[employee.role]
+        kit = []
+        for equipment_type, wanted in KITS[employee.role].items():
+            try:
+                rule = policy.rule(equipment_type)
+            except ValueError:
+                continue
+            if rule.max_count is not None:
+                wanted = min(wanted, rule.max_count)
+            for _ in range(wanted):
+                if self.rng.random() < EQUIPPED:
+                    kit.append(self.make_equipment(equipment_type, rule, employee))
+                    employee.shift_equipment_count(equipment_type, 1)
+        return kit
+
+    def make_equipment(self, equipment_type=None, rule=None, employee=None):
+        equipment_type = equipment_type or self.pick({TypeOfEquipment.PC: 45, TypeOfEquipment.SCREEN: 55})
+        created_at = self.moment(YEARS * 365)
+        if employee is not None:
+            created_at = max(created_at, employee.created_at)
+        equipment = Equipment(
+            id=self.uuid(), equipment_type=equipment_type, created_at=created_at, updated_at=created_at,
+            status=EquipmentStatus.USED if employee else EquipmentStatus.FREE, employee=employee,
+        )
+        if equipment_type == TypeOfEquipment.PC:
+            equipment.memory = self.pick(self.at_least(PC_MEMORY, rule and rule.min_memory))
+            equipment.hard_disk_size = self.pick(self.at_least(PC_HARD_DISK, rule and rule.min_hard_disk_size))
+            equipment.model = self.rng.choice(PC_MODELS)
+        else:
+            equipment.size = self.pick(SCREEN_SIZES)
+            equipment.model = self.rng.choice(SCREEN_MODELS)
+        return equipment
+
+    @staticmethod
+    def at_least(weights, minimum):
+        return {value: weight for value, weight in weights.items() if minimum is None or value >= minimum} \
+            or {minimum: 1}
+
+
+def seed(rows, seed=0, batch_size=5000, progress=None):
+    return Seeder(rows, seed, batch_size).run(progress)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('rows', type=parse_rows, help='number of employees')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    options = parser.parse_args()
+
+    if Employee.objects.exists():
+        parser.exit(1, 'The database already has employees, seed an empty one\n')
+    write(seed(options.rows, options.seed, options.batch_size, progress=write))
@@ -0,0 +1,86 @@
+"""
+Compare the list serialization of the model serializers and of ValuesSerializer.
+
+Run from the project directory: `python -m benchmarks.serializers [rows ...]`
+"""
+import os
+import sys
+import timeit
+import uuid
+from datetime import timedelta
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'coworking.settings')
+django.setup()
+
+from django.utils import timezone  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from api.serializers import EmployeeSerializer, EquipmentSerializer  # noqa: E402
+from base.models import EmployeeRole, EquipmentStatus, TypeOfEquipment  # noqa: E402
+from base.serializers import ValuesSerializer  # noqa: E402
+from management.models import Employee, Equipment  # noqa: E402
+
+
+def make_employee(index, now):
+    return Employee(
+        id=uuid.uuid4(), name=f'Name {index}', surname='Surname', active=bool(index % 2),
+        role=EmployeeRole.choices[index % len(EmployeeRole.choices)][0], company_id=uuid.uuid4(),
+        pc_count=index % 2, screen_count=index % 3,
+        created_at=now - timedelta(seconds=index), updated_at=now,
+    )
+
+
+def make_equipment(index, now):
+    if index % 2:
+        return Equipment(
+            id=uuid.uuid4(), equipment_type=TypeOfEquipment.SCREEN, size=24, model='ACER',
+            status=EquipmentStatus.FREE, created_at=now - timedelta(seconds=index), updated_at=now,
+        )
+    return Equipment(
+        id=uuid.uuid4(), equipment_type=TypeOfEquipment.PC, memory=16, hard_disk_size=512, model='HP',
+        status=EquipmentStatus.USED, employee_id=uuid.uuid4(),
+        created_at=now - timedelta(seconds=index), updated_at=now,
+    )
+
+
+def as_values(instances, sources):
+    """
+    Rows as returned by `.values()`, foreign keys by their column name
+    """
+    model = type(instances[0])
+    attnames = [model._meta.get_field(source).attname for source in sources]
+    return [
+        {source: getattr(instance, attname) for source, attname in zip(sources, attnames)}
+        for instance in instances
+    ]
+
+
+def run(serializer_class, factory, rows):
+    now = timezone.now()
+    instances = [factory(index, now) for index in range(rows)]
+    values_serializer = ValuesSerializer.of(serializer_class)
+    values = as_values(instances, values_serializer.sources)
+    renderer = JSONRenderer()
+
+    def model_serializer():
+        return renderer.render(serializer_class(instances, many=True).data)
+
+    def fast_serializer():
+        return renderer.render(values_serializer.to_representation(values))
+
+    if model_serializer() != fast_serializer():
+        sys.exit(f'{serializer_class.__name__}: outputs differ')
+
+    slow = min(timeit.repeat(model_serializer, number=1, repeat=3))
+    fast = min(timeit.repeat(fast_serializer, number=1, repeat=3))
+    sys.stdout.write(f'{serializer_class.__name__:<20} {rows:>8} rows  '
+                     f'ModelSerializer {slow:8.3f}s  ValuesSerializer {fast:8.3f}s  x{slow / fast:.1f}\n')
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    for rows in sizes:
+        run(EquipmentSerializer, make_equipment, rows)
+        run(EmployeeSerializer, make_employee, rows)
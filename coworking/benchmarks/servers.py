@@ -0,0 +1,112 @@
+"""
+Compare the WSGI and the ASGI deployments under many concurrent connections.
+
+Each server is started on its own port, then every connection sends its
+requests one after the other (keep-alive when the server allows it) and the
+requests per second and latency percentiles are reported.
+
+Run from the project directory, with gunicorn and uvicorn installed:
+`python -m benchmarks.servers [--connections 1000] [--requests 20] [--path /api/v1/equipment/]`
+"""
+import argparse
+import asyncio
+import resource
+import shlex
+import socket
+import subprocess
+import sys
+import time
+
+
+SERVERS = {
+    'wsgi': 'gunicorn coworking.wsgi:application --workers 4 --threads 8 --bind 127.0.0.1:{port}',
+    'asgi': 'uvicorn coworking.asgi:application --workers 4 --no-access-log --port {port}',
+}
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit(f'No server listening on port {port}')
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = dict(line.split(':', 1) for line in lines[1:] if ':' in line)
+    headers = {name.strip().lower(): value.strip() for name, value in headers.items()}
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection', '').lower() == 'close'
+
+
+async def connection(port, path, requests, latencies, failures):
+    request = f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: application/json\r\n\r\n'.encode()
+    reader = writer = None
+    for _ in range(requests):
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request)
+            status, close = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError):
+            failures.append(None)
+            writer = None
+            continue
+        latencies.append(time.perf_counter() - started)
+        if status != 200:
+            failures.append(status)
+        if close:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, path, connections, requests):
+    latencies, failures = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(connection(port, path, requests, latencies, failures) for _ in range(connections)))
+    return latencies, failures, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(name, command, port, options):
+    process = subprocess.Popen(shlex.split(command.format(port=port)), stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        latencies, failures, seconds = asyncio.run(load(port, options.path, options.connections, options.requests))
+    finally:
+        process.terminate()
+        process.wait()
+
+    latencies.sort()
+    sys.stdout.write(
+        f'{name}: {len(latencies) / seconds:8.0f} req/s  '
+        f'p50 {percentile(latencies, 0.5) * 1000:7.1f}ms  p99 {percentile(latencies, 0.99) * 1000:7.1f}ms  '
+        f'{len(failures)} failed\n'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=20, help='requests per connection')
+    parser.add_argument('--path', default='/api/v1/equipment/')
+    parser.add_argument('--servers', nargs='+', choices=SERVERS, default=list(SERVERS))
+    options = parser.parse_args()
+
+    # one file descriptor per connection
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    for port, name in enumerate(options.servers, start=8101):
+        run(name, SERVERS[name], port, options)
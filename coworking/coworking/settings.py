@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'base.instrumentation.InstrumentationMiddleware',
+    'base.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,10 +82,66 @@ WSGI_APPLICATION = 'coworking.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # the benchmarks run on databases of their own
+        'NAME': os.environ.get('COWORKING_DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# Read replicas, comma separated: database files with SQLite (refreshed from the
+# primary by `python manage.py copy_to_replicas`), `host[:port]` of the replicas
+# of the primary otherwise. The safe requests read from one of them, see `base.routers`.
+DATABASE_REPLICAS = []
+for index, location in enumerate(filter(None, os.environ.get('COWORKING_REPLICAS', '').split(',')), start=1):
+    replica = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if replica['ENGINE'] == 'django.db.backends.sqlite3':
+        replica['NAME'] = location
+    else:
+        replica['HOST'], _, replica['PORT'] = location.partition(':')
+    DATABASES[f'replica{index}'] = replica
+    DATABASE_REPLICAS.append(f'replica{index}')
+
+DATABASE_ROUTERS = ['base.routers.ReplicaRouter']
+
+# Seconds a client reads from the primary after a write, so it reads its own writes
+REPLICA_STICKY_SECONDS = float(os.environ.get('COWORKING_REPLICA_STICKY_SECONDS', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+# The equipment stock and the detail cache must be shared by the processes serving
+# the API: set `COWORKING_CACHE_URL` (`redis://host:port/db`) as soon as there are
+# several. Without it the caches are local to the process, for a single process
+# (development, tests) only, see `management.checks`.
+CACHE_URL = os.environ.get('COWORKING_CACHE_URL')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        },
+        'detail': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'detail',
+            'TIMEOUT': 300,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'detail': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'detail',
+            'TIMEOUT': 300,
+        },
+    }
+
+# Cache holding the payloads of the detail endpoints, any Django cache backend works
+DETAIL_CACHE_ALIAS = 'detail'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -124,3 +183,64 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'base.instrumentation.InstrumentedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'base.pagination.KeysetPagination',
+    'PAGE_SIZE': 100,
+    'DEFAULT_FILTER_BACKENDS': [
+        'base.filters.FieldFilterBackend',
+        'base.filters.PrefixSearchBackend',
+        'base.filters.OrderingBackend',
+    ],
+}
+
+# Upper bound of the `page_size` query parameter of list endpoints
+PAGINATION_MAX_PAGE_SIZE = 1000
+
+# Serve the hot read endpoints with the async views of `api.async_views`,
+# turned on by `coworking.asgi` for ASGI deployments
+ASYNC_READ_VIEWS = os.environ.get('COWORKING_ASYNC_READ_VIEWS') == '1'
+
+# Per-request queries and timings of `base.instrumentation.InstrumentationMiddleware`:
+# Server-Timing header, log line, and the rolling histogram of `/internal/metrics/`
+REQUEST_INSTRUMENTATION = {
+    'ENABLED': True,
+    'PATH_PREFIXES': ['/api/v1/'],
+    'SERVER_TIMING': True,
+    'LOG': True,
+    # statements of the same shape run this many times in a request are flagged as an N+1
+    'N_PLUS_ONE_THRESHOLD': 5,
+    'HISTOGRAM_BUCKETS_MS': [5, 10, 25, 50, 100, 250, 500, 1000, 2500],
+    'HISTOGRAM_WINDOW': 300,
+    'HISTOGRAM_SLOTS': 10,
+}
+
+
+# Logging
+# https://docs.djangoproject.com/en/4.0/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # one JSON line per request, only the N+1 ones at the default WARNING level
+        'coworking.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('COWORKING_REQUEST_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
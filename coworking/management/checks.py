@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core import checks
+
+# caches living in the memory of each process
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_caches(app_configs, **kwargs):
+    """
+    The equipment stock (default cache) and the detail cache are shifted and
+    invalidated by the process serving the write: a deployment with several
+    processes must share them.
+    """
+    errors = []
+    for alias in dict.fromkeys(['default', settings.DETAIL_CACHE_ALIAS]):
+        backend = settings.CACHES[alias]['BACKEND']
+        if backend in PROCESS_LOCAL_CACHES:
+            errors.append(checks.Error(
+                f'The "{alias}" cache is local to the process ({backend}).',
+                hint='Set COWORKING_CACHE_URL to a Redis server shared by the processes serving the API.',
+                id='management.E001',
+            ))
+    return errors
@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from management.models import ArchivedCompany, ArchivedEmployee
+
+
+class Command(BaseCommand):
+    help = 'Move the long inactive companies and employees, with their assignment events, to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Days since their last update after which the inactive rows are archived',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Number of companies archived per transaction, ten times as many employees',
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        batch_size = options['batch_size']
+
+        companies = employees = events = 0
+        while True:
+            archived = ArchivedCompany.archive_inactive(before, batch_size)
+            if not archived[0]:
+                break
+            companies, employees, events = companies + archived[0], employees + archived[1], events + archived[2]
+            self.stdout.write(f'{companies} companies archived')
+        while True:
+            archived = ArchivedEmployee.archive_inactive(before, batch_size * 10)
+            if not archived[0]:
+                break
+            employees, events = employees + archived[0], events + archived[1]
+            self.stdout.write(f'{employees} employees archived')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{companies} companies, {employees} employees and {events} assignment events archived'
+        ))
@@ -0,0 +1,28 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite primary database to the replica files, standing for the replication of a local setup'
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replica configured, set COWORKING_REPLICAS')
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('The replicas of this database are kept up to date by its replication')
+
+        primary.ensure_connection()
+        for alias in settings.DATABASE_REPLICAS:
+            connections[alias].close()
+            replica = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                # a consistent snapshot, even while the primary is written
+                primary.connection.backup(replica)
+            finally:
+                replica.close()
+            self.stdout.write(f'{alias} copied')
+        self.stdout.write(self.style.SUCCESS(f'{len(settings.DATABASE_REPLICAS)} replica(s) copied from the primary'))
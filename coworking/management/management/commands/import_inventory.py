@@ -0,0 +1,48 @@
+import json
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.inventory import InventoryImporter
+
+
+class Command(BaseCommand):
+    help = 'Import companies, employees and equipments from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, `-` for the standard input')
+        parser.add_argument(
+            '--format', choices=InventoryImporter.formats,
+            help='Format of the file, guessed from its extension by default',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=InventoryImporter.batch_size,
+            help='Number of rows validated and inserted per transaction',
+        )
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if file_format not in InventoryImporter.formats:
+            raise CommandError('Unknown file format, use --format')
+
+        importer = InventoryImporter(batch_size=options['batch_size'])
+        if options['path'] == '-':
+            report = importer.run(sys.stdin, file_format, progress=self.progress)
+        else:
+            try:
+                with open(options['path'], newline='', encoding='utf-8-sig') as stream:
+                    report = importer.run(stream, file_format, progress=self.progress)
+            except OSError as error:
+                raise CommandError(error)
+
+        for error in report['errors']:
+            self.stderr.write(f"line {error['line']}: {json.dumps(error['errors'])}")
+        created = ', '.join(f'{count} {kind}' for kind, count in report['created'].items())
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['rows']} rows imported in {report['seconds']}s ({report['rows_per_second']} rows/s): "
+            f"{created} created, {report['rejected']} rejected"
+        ))
+
+    def progress(self, report):
+        self.stdout.write(f"{report['rows']} rows, {report['rows_per_second']} rows/s")
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from base.cache import detail_cache
+from management.models import CompanyRoleSummary, Employee
+
+
+class Command(BaseCommand):
+    help = (
+        "Check the employees' equipment counters against the equipment table and rebuild the wrong ones, "
+        "with the summaries of their companies and their cached details"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only report the wrong counters, exit with an error if there are any',
+        )
+
+    def handle(self, *args, **options):
+        held = Employee.held_equipment_counts()
+        mismatch = Q()
+        for field in held:
+            mismatch |= ~Q(**{field: F('held_' + field)})
+        mismatched = Employee.objects.annotate(**{'held_' + field: expression for field, expression in held.items()}) \
+            .filter(mismatch)
+
+        if options['verify']:
+            rows = mismatched.values_list('pk', *held, *['held_' + field for field in held])
+            count = 0
+            for count, row in enumerate(rows.iterator(), start=1):
+                self.stdout.write(f'{row[0]}: counters {row[1:1 + len(held)]}, held {row[1 + len(held):]}')
+            if count:
+                raise CommandError(f'{count} employee(s) with wrong equipment counters')
+            self.stdout.write(self.style.SUCCESS('All equipment counters are right'))
+            return
+
+        with transaction.atomic():
+            repaired = list(mismatched.values_list('pk', 'company'))
+            updated = Employee.objects.filter(pk__in=mismatched.values('pk')) \
+                .update(**held, updated_at=timezone.now())
+            if repaired:
+                # the company summaries add up the counters, the cached details show them
+                CompanyRoleSummary.rebuild({company_id for _, company_id in repaired})
+                detail_cache.invalidate(Employee, [pk for pk, _ in repaired])
+        self.stdout.write(self.style.SUCCESS(f'{updated} employee(s) equipment counters rebuilt'))
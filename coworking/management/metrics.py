@@ -0,0 +1,114 @@
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from base.metrics import registry
+from base.models import EquipmentStatus, TypeOfEquipment
+from base.routers import primary_reads
+
+
+assignments = registry.counter(
+    'coworking_equipment_assignments_total', 'Equipments assigned to or revoked from employees, per role',
+    ['operation', 'role'],
+)
+rule_rejections = registry.counter(
+    'coworking_equipment_rule_rejections_total', 'Assignments rejected by the equipment rules of the role',
+    ['role', 'equipment_type'],
+)
+
+
+class EquipmentStock:
+    """
+    Number of equipments per type and status, kept in the default cache.
+
+    The writes shift the counts once committed, so a scrape reads a few cache
+    keys instead of counting the table. Missing counts (first read, eviction,
+    a write that could not tell what it changed) are loaded with one GROUP BY
+    query. They expire after `timeout` seconds, so the drift of a write racing
+    with a load does not last. Processes share the counts through the default
+    cache: with several processes it must be a shared one (`COWORKING_CACHE_URL`,
+    required by the deploy checks).
+    """
+    timeout = 3600
+
+    @staticmethod
+    def key(equipment_type, status):
+        return f'equipment-stock:{equipment_type}:{status}'
+
+    def keys(self):
+        return {
+            self.key(equipment_type, status): (equipment_type, status)
+            for equipment_type in TypeOfEquipment.values for status in EquipmentStatus.values
+        }
+
+    def shift(self, changes):
+        """
+        Shift the counts of `changes`, a `{(equipment_type, status): delta}` dict, once committed
+        """
+        changes = {state: delta for state, delta in changes.items() if delta}
+        if changes:
+            transaction.on_commit(lambda: self.apply(changes))
+
+    def apply(self, changes):
+        for (equipment_type, status), delta in changes.items():
+            try:
+                cache.incr(self.key(equipment_type, status), delta)
+            except ValueError:
+                # not loaded, the next read counts it
+                pass
+
+    def forget(self):
+        transaction.on_commit(lambda: cache.delete_many(list(self.keys())))
+
+    def counts(self):
+        keys = self.keys()
+        values = cache.get_many(list(keys))
+        if len(values) < len(keys):
+            values = self.load(keys)
+        return {keys[key]: value for key, value in values.items()}
+
+    def load(self, keys):
+        from management.models import Equipment
+
+        counts = dict.fromkeys(keys, 0)
+        rows = Equipment.objects.order_by().values_list('equipment_type', 'status').annotate(count=Count('pk'))
+        # the writes shift the counts from now on: they are read from the primary
+        with primary_reads():
+            for equipment_type, status, count in rows:
+                counts[self.key(equipment_type, status)] = count
+        for key, count in counts.items():
+            # keep the counts loaded and shifted by another process meanwhile
+            cache.add(key, count, self.timeout)
+        return {**counts, **cache.get_many(list(counts))}
+
+
+stock = EquipmentStock()
+
+registry.gauge(
+    'coworking_equipments', 'Equipments per type and status', ['equipment_type', 'status'], stock.counts
+)
+
+
+def moved_equipments(operation, moves):
+    """
+    Once committed, count the equipments assigned or revoked and shift the
+    stock, `moves` being the `(role, equipment_type)` of each of them
+    """
+    moves = list(moves)
+    if not moves:
+        return
+    taken, given = (EquipmentStatus.FREE, EquipmentStatus.USED) if operation == 'assign' \
+        else (EquipmentStatus.USED, EquipmentStatus.FREE)
+
+    def record():
+        for role, count in Counter(role for role, _ in moves).items():
+            assignments.inc(count, operation=operation, role=role)
+        changes = Counter()
+        for _, equipment_type in moves:
+            changes[equipment_type, taken] -= 1
+            changes[equipment_type, given] += 1
+        stock.apply(changes)
+
+    transaction.on_commit(record)
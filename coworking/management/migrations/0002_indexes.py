@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='employee',
+            options={'ordering': ['-created_at']},
+        ),
+        migrations.AlterModelOptions(
+            name='equipment',
+            options={'ordering': ['-created_at']},
+        ),
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['-created_at', '-id'], name='company_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['-created_at', '-id'], name='employee_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['role', 'created_at', 'id'], name='employee_role_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['-created_at', '-id'], name='equipment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(fields=['employee', 'equipment_type'], name='equipment_employee_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipment',
+            index=models.Index(condition=models.Q(('status', 'free')), fields=['equipment_type', 'created_at'], name='equipment_free_type_idx'),
+        ),
+    ]
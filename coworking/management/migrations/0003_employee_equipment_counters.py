@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:09
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Employee = apps.get_model('management', 'Employee')
+    Equipment = apps.get_model('management', 'Equipment')
+    Employee.objects.update(**{
+        field: Coalesce(Subquery(
+            Equipment.objects.filter(employee=OuterRef('pk'), equipment_type=equipment_type).order_by()
+            .values('employee').annotate(count=Count('pk')).values('count')
+        ), 0)
+        for equipment_type, field in (('pc', 'pc_count'), ('screen', 'screen_count'))
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0002_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='pc_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='screen_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
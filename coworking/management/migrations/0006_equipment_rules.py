@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:22
+
+import uuid
+from django.db import migrations, models
+
+
+# the rules hard-coded until now
+RULES = [
+    # role, equipment_type, max_count, min_memory, min_hard_disk_size
+    ('intern', 'pc', 1, None, None),
+    ('intern', 'screen', 1, None, None),
+    ('dev', 'pc', 1, None, None),
+    ('dev', 'screen', 2, None, None),
+    ('techlead', 'pc', None, 32, 512),
+]
+
+
+def create_rules(apps, schema_editor):
+    EquipmentRule = apps.get_model('management', 'EquipmentRule')
+    EquipmentRule.objects.bulk_create([
+        EquipmentRule(
+            role=role, equipment_type=equipment_type,
+            max_count=max_count, min_memory=min_memory, min_hard_disk_size=min_hard_disk_size,
+        )
+        for role, equipment_type, max_count, min_memory, min_hard_disk_size in RULES
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0005_list_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EquipmentRule',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('role', models.CharField(choices=[('intern', 'Intern'), ('dev', 'Dev'), ('techlead', 'TechLead'), ('it', 'IT'), ('cto', 'CTO')], max_length=100)),
+                ('equipment_type', models.CharField(choices=[('pc', 'PC'), ('screen', 'Screen')], max_length=6)),
+                ('max_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('min_memory', models.PositiveIntegerField(blank=True, null=True)),
+                ('min_hard_disk_size', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['-created_at', '-id'], name='equipmentrule_created_idx'), models.Index(fields=['updated_at'], name='equipmentrule_updated_idx')],
+                'constraints': [models.UniqueConstraint(fields=('role', 'equipment_type'), name='unique_equipment_rule')],
+            },
+        ),
+        migrations.RunPython(create_rules, migrations.RunPython.noop),
+    ]
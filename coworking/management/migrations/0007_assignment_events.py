@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:42
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+def open_held_equipments(apps, schema_editor):
+    # the holdings running before the ledger, as old as the last update of their equipment
+    Equipment = apps.get_model('management', 'Equipment')
+    AssignmentEvent = apps.get_model('management', 'AssignmentEvent')
+    held = Equipment.objects.filter(employee__isnull=False).order_by('pk') \
+        .values_list('pk', 'employee_id', 'equipment_type', 'updated_at')
+    events = []
+    for equipment_id, employee_id, equipment_type, updated_at in held.iterator(chunk_size=5000):
+        events.append(AssignmentEvent(
+            operation='assign', equipment_id=equipment_id, employee_id=employee_id,
+            equipment_type=equipment_type, held_since=updated_at, created_at=updated_at,
+        ))
+        if len(events) == 5000:
+            AssignmentEvent.objects.bulk_create(events)
+            events = []
+    AssignmentEvent.objects.bulk_create(events)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0006_equipment_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssignmentEvent',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('operation', models.CharField(choices=[('assign', 'Assign'), ('revoke', 'Revoke')], max_length=6)),
+                ('equipment_type', models.CharField(choices=[('pc', 'PC'), ('screen', 'Screen')], max_length=6)),
+                ('held_since', models.DateTimeField(null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('employee', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='management.employee')),
+                ('equipment', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='management.equipment')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['-created_at', '-id'], name='assignmentevent_created_idx'), models.Index(fields=['equipment', '-created_at', '-id'], name='assignmentevent_equipment_idx'), models.Index(fields=['employee', '-created_at', '-id'], name='assignmentevent_employee_idx')],
+            },
+        ),
+        migrations.RunPython(open_held_equipments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+ROLES = ['intern', 'dev', 'techlead', 'it', 'cto']
+TOTALS = ['head_count', 'active_count', 'pc_count', 'screen_count']
+
+
+def summarize_companies(apps, schema_editor):
+    Company = apps.get_model('management', 'Company')
+    Employee = apps.get_model('management', 'Employee')
+    CompanyRoleSummary = apps.get_model('management', 'CompanyRoleSummary')
+    totals = {
+        (row['company'], row['role']): row
+        for row in Employee.objects.order_by().values('company', 'role').annotate(
+            head_count=models.Count('pk'),
+            active_count=models.Count('pk', filter=models.Q(active=True)),
+            pc_count=models.Sum('pc_count'),
+            screen_count=models.Sum('screen_count'),
+        )
+    }
+    cells = []
+    for company_id in Company.objects.order_by().values_list('pk', flat=True).iterator(chunk_size=5000):
+        for role in ROLES:
+            row = totals.get((company_id, role), {})
+            cells.append(CompanyRoleSummary(
+                company_id=company_id, role=role, **{field: row.get(field, 0) for field in TOTALS}
+            ))
+    CompanyRoleSummary.objects.bulk_create(cells, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0007_assignment_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyRoleSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('intern', 'Intern'), ('dev', 'Dev'), ('techlead', 'TechLead'), ('it', 'IT'), ('cto', 'CTO')], max_length=100)),
+                ('head_count', models.IntegerField(default=0)),
+                ('active_count', models.IntegerField(default=0)),
+                ('pc_count', models.IntegerField(default=0)),
+                ('screen_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='management.company')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('company', 'role'), name='unique_company_role_summary')],
+            },
+        ),
+        migrations.RunPython(summarize_companies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0008_company_role_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAssignmentEvent',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('operation', models.CharField(choices=[('assign', 'Assign'), ('revoke', 'Revoke')], max_length=6)),
+                ('equipment', models.UUIDField(db_column='equipment_id')),
+                ('employee', models.UUIDField(db_column='employee_id')),
+                ('equipment_type', models.CharField(choices=[('pc', 'PC'), ('screen', 'Screen')], max_length=6)),
+                ('held_since', models.DateTimeField(null=True)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['employee'], name='archivedevent_employee_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedCompany',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100)),
+                ('active', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-archived_at'],
+                'indexes': [models.Index(fields=['-archived_at', '-id'], name='archivedcompany_archived_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedEmployee',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100)),
+                ('surname', models.CharField(max_length=100)),
+                ('active', models.BooleanField(default=False)),
+                ('role', models.CharField(choices=[('intern', 'Intern'), ('dev', 'Dev'), ('techlead', 'TechLead'), ('it', 'IT'), ('cto', 'CTO')], max_length=100)),
+                ('company', models.UUIDField(db_column='company_id')),
+                ('pc_count', models.IntegerField(default=0)),
+                ('screen_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-archived_at'],
+                'indexes': [models.Index(fields=['-archived_at', '-id'], name='archivedemployee_archived_idx'), models.Index(fields=['company'], name='archivedemployee_company_idx')],
+            },
+        ),
+    ]
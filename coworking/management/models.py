@@ -1,14 +1,22 @@
 import uuid
+from collections import Counter
 
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models.functions import Coalesce
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
 
+from base.cache import detail_cache
 from base.models import (
+    AssignmentOperation,
     EmployeeRole,
     EquipmentStatus,
     TrackTimeModel,
     TypeOfEquipment
 )
-from base.validators import InternRuleValidator, DevRuleValidator, TechLeadRuleValidator
+from base.routers import primary_reads
+from base.validators import PolicyTable
+from management.metrics import moved_equipments, rule_rejections
 
 
 class Company(TrackTimeModel):
@@ -16,6 +24,13 @@ class Company(TrackTimeModel):
     name = models.CharField(max_length=100)
     active = models.BooleanField(default=False)
 
+    class Meta(TrackTimeModel.Meta):
+        indexes = TrackTimeModel.Meta.indexes + [
+            # name prefix search and ordering
+            models.Index(fields=['name', 'id'], name='company_name_idx'),
+            models.Index(fields=['active', '-created_at', '-id'], name='company_active_created_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -27,22 +42,178 @@ class Employee(TrackTimeModel):
     active = models.BooleanField(default=False)
     role = models.CharField(choices=EmployeeRole.choices, max_length=100)
     company = models.ForeignKey('Company', on_delete=models.RESTRICT)
+    # denormalized number of equipments held, kept up to date by the assignment paths
+    pc_count = models.IntegerField(default=0)
+    screen_count = models.IntegerField(default=0)
 
-    class Meta:
+    counter_fields = {
+        TypeOfEquipment.PC: 'pc_count',
+        TypeOfEquipment.SCREEN: 'screen_count',
+    }
+
+    class Meta(TrackTimeModel.Meta):
         constraints = [
             models.UniqueConstraint(fields=['name', 'surname'], name='unique_booking'),
         ]
+        indexes = TrackTimeModel.Meta.indexes + [
+            # hiring window queries: role equality then a created_at range
+            models.Index(fields=['role', 'created_at', 'id'], name='employee_role_created_idx'),
+            # employees of a company, surname prefix search (name prefixes use the unique constraint)
+            models.Index(fields=['company', '-created_at', '-id'], name='employee_company_created_idx'),
+            models.Index(fields=['surname', 'id'], name='employee_surname_idx'),
+        ]
 
     def __str__(self):
         return ' '.join([self.name, self.surname])
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_company_id = instance.__dict__.get('company_id')
+        # totals as stored, to shift the company summary when they change
+        if all(name in instance.__dict__ for name in ('company_id', 'role', 'active', 'pc_count', 'screen_count')):
+            instance._loaded_summary = instance.summary_totals()
+        return instance
+
     def save(self, *args, **kwargs):
-        if not self.company.active:
+        # the company is only loaded when the employee joins it
+        joins_company = self._state.adding or self.company_id != getattr(self, '_loaded_company_id', None)
+        if joins_company and not self.company.active:
             raise ValueError("The company of the new employee must be active")
+        if not self._state.adding and not kwargs.get('force_insert'):
+            # the counters only move through the F() updates, a stale instance must not write them back
+            update_fields = kwargs.get('update_fields')
+            kwargs['update_fields'] = [
+                name for name in (self.updatable_fields() if update_fields is None else update_fields)
+                if name not in self.counter_fields.values()
+            ]
         super().save(*args, **kwargs)
+        self._loaded_company_id = self.company_id
+
+    def updatable_fields(self):
+        deferred = self.get_deferred_fields()
+        return [
+            field.attname for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname not in deferred
+        ]
+
+    def summary_totals(self):
+        """
+        The company summary cell of the employee and what it adds to its totals
+        """
+        return (self.company_id, self.role), {
+            'head_count': 1, 'active_count': int(self.active),
+            'pc_count': self.pc_count, 'screen_count': self.screen_count,
+        }
+
+    def equipment_counts(self):
+        """
+        Number of equipments held per type, read from the denormalized counters
+        """
+        return {
+            equipment_type: getattr(self, field)
+            for equipment_type, field in self.counter_fields.items()
+        }
+
+    def shift_equipment_count(self, equipment_type, delta):
+        field = self.counter_fields[equipment_type]
+        setattr(self, field, getattr(self, field) + delta)
+
+    @classmethod
+    def update_equipment_count(cls, pk, equipment_type, delta):
+        """
+        Shift the counter of an equipment type of an employee, locking its row, and its company summary.
+        Return the role of the employee, None when it does not exist.
+        """
+        field = cls.counter_fields[equipment_type]
+        updated = update_rows(
+            cls.objects.filter(pk=pk), ['role'], **{field: models.F(field) + delta}, updated_at=timezone.now()
+        )
+        if updated:
+            CompanyRoleSummary.shift_of(pk, {field: delta})
+        detail_cache.invalidate(cls, [pk])
+        return updated[0][0] if updated else None
+
+    @classmethod
+    def update_equipment_count_of(cls, pk, equipment_id, delta):
+        """
+        Shift the counter of the type of an equipment, read by the same statement, locking the employee row,
+        and its company summary. Return the role of the employee, None when it does not exist.
+        """
+        deltas = {
+            field: models.Case(
+                models.When(models.Exists(Equipment.objects.filter(pk=equipment_id, equipment_type=equipment_type)),
+                            then=delta),
+                default=0,
+            )
+            for equipment_type, field in cls.counter_fields.items()
+        }
+        updated = update_rows(
+            cls.objects.filter(pk=pk), ['role'],
+            **{field: models.F(field) + shift for field, shift in deltas.items()}, updated_at=timezone.now()
+        )
+        if updated:
+            CompanyRoleSummary.shift_of(pk, deltas)
+        detail_cache.invalidate(cls, [pk])
+        return updated[0][0] if updated else None
+
+    @classmethod
+    def held_equipment_counts(cls):
+        """
+        Expressions counting from the equipment table the equipments each employee holds per type
+        """
+        return {
+            field: Coalesce(models.Subquery(
+                Equipment.objects.filter(employee=models.OuterRef('pk'), equipment_type=equipment_type)
+                .order_by().values('employee').annotate(count=models.Count('pk')).values('count')
+            ), 0)
+            for equipment_type, field in cls.counter_fields.items()
+        }
+
+    @classmethod
+    def lock(cls, pks):
+        """
+        Lock employee rows until the end of the transaction, in primary key order
+        so concurrent batches can not deadlock. Assignments to an employee are
+        serialized on its row so they can not both pass the rules.
+        """
+        return cls.objects.select_for_update().order_by('pk').in_bulk(pks)
 
     def revoke_all(self):
-        self.equipments.update(status=EquipmentStatus.FREE, employee=None)
+        Employee.revoke_all_of(self.pk)
+        for field in self.counter_fields.values():
+            setattr(self, field, 0)
+
+    @classmethod
+    def revoke_all_of(cls, pk):
+        """
+        Revoke all the equipments of an employee, raise Employee.DoesNotExist.
+
+        Resetting the counters locks the employee row and tells whether it exists,
+        the equipments held are stable afterwards. Their ids are read before they
+        are freed so their cached details can be invalidated and their revoke
+        events inserted at once, an employee holding nothing costs the counters
+        update only.
+        """
+        with transaction.atomic():
+            now = timezone.now()
+            counters = dict.fromkeys(cls.counter_fields.values(), 0)
+            if not cls.objects.filter(pk=pk).update(**counters, updated_at=now):
+                raise cls.DoesNotExist('The employee does not exist')
+            held = list(Equipment.objects.filter(employee=pk).values_list('pk', 'employee__role', 'equipment_type'))
+            equipment_ids = [equipment_id for equipment_id, _, _ in held]
+            if equipment_ids:
+                Equipment.objects.filter(pk__in=equipment_ids) \
+                    .update(status=EquipmentStatus.FREE, employee=None, updated_at=now)
+                AssignmentEvent.record([
+                    AssignmentEvent.revocation(equipment_id, pk, equipment_type, now)
+                    for equipment_id, _, equipment_type in held
+                ])
+                held_counts = Counter(cls.counter_fields[equipment_type] for _, _, equipment_type in held)
+                CompanyRoleSummary.shift_of(pk, {field: -count for field, count in held_counts.items()})
+                moved_equipments('revoke', [(role, equipment_type) for _, role, equipment_type in held])
+        detail_cache.invalidate(Equipment, equipment_ids)
+        detail_cache.invalidate(cls, [pk])
 
 
 class Equipment(TrackTimeModel):
@@ -55,7 +226,20 @@ class Equipment(TrackTimeModel):
     status = models.CharField(choices=EquipmentStatus.choices, max_length=100)
     employee = models.ForeignKey('Employee', on_delete=models.SET_NULL, null=True, related_name='equipments')
 
-    class Meta:
+    class Meta(TrackTimeModel.Meta):
+        indexes = TrackTimeModel.Meta.indexes + [
+            # business rules count an employee's equipments per type
+            models.Index(fields=['employee', 'equipment_type'], name='equipment_employee_type_idx'),
+            models.Index(
+                fields=['equipment_type', 'created_at'],
+                name='equipment_free_type_idx',
+                condition=models.Q(status=EquipmentStatus.FREE),
+            ),
+            # list filters: status, then the criteria of a type of equipment
+            models.Index(fields=['status', '-created_at', '-id'], name='equipment_status_created_idx'),
+            models.Index(fields=['equipment_type', 'memory', 'hard_disk_size'], name='equipment_type_criteria_idx'),
+            models.Index(fields=['model', 'id'], name='equipment_model_idx'),
+        ]
         constraints = [
             models.CheckConstraint(
                 name="%(app_label)s_%(class)s_criteria_matches_equipment_type",
@@ -79,30 +263,789 @@ class Equipment(TrackTimeModel):
     def __str__(self):
         return ' '.join([self.equipment_type, self.model])
 
-    def is_valid_assignment(self, employee):
-        if employee.role == EmployeeRole.INTERN:
-            if not InternRuleValidator(employee, self).is_valid():
-                raise ValueError('An intern must have only one PC and one screen')
-        if employee.role == EmployeeRole.DEV:
-            if not DevRuleValidator(employee, self).is_valid():
-                raise ValueError('A developer must have only one PC and two screens')
-        if employee.role == EmployeeRole.TECHLEAD:
-            if not TechLeadRuleValidator(employee, self).is_valid():
-                raise ValueError('A tech lead must have a minimum 32go of memory or 512go of hard disk')
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # type and status as stored, to shift the stock when they change
+        instance._loaded_stock = (instance.__dict__.get('equipment_type'), instance.__dict__.get('status'))
+        return instance
 
-    def assign(self, employee):
+    @classmethod
+    def lock(cls, pks):
+        """
+        Lock equipment rows until the end of the transaction, in primary key order
+        """
+        return cls.objects.select_for_update().order_by('pk').in_bulk(pks)
+
+    def is_valid_assignment(self, employee, counts=None, policy=None):
+        policy = policy or EquipmentRule.policy()
+        try:
+            policy[employee.role].check(self, counts or employee.equipment_counts())
+        except ValueError:
+            rule_rejections.inc(role=employee.role, equipment_type=self.equipment_type)
+            raise
+
+    def check_assignment(self, employee, counts=None, policy=None):
         if self.status == EquipmentStatus.USED:
             raise ValueError('You can not assign this equipment, it is already used!')
+        self.check_holder(employee, counts, policy)
+
+    def check_holder(self, employee, counts=None, policy=None):
+        """
+        Check the employee may hold the equipment on top of the `counts` it already holds
+        """
         if not employee.active:
             raise ValueError('You can not assign this equipment to an inactive employee')
+        self.is_valid_assignment(employee, counts, policy)
 
-        self.is_valid_assignment(employee)
+    def assign(self, employee):
+        with transaction.atomic():
+            locked = Employee.lock([employee.pk])
+            if employee.pk not in locked:
+                raise ValueError('The employee does not exist')
+            self._assign_locked(locked[employee.pk])
+        detail_cache.invalidate(Equipment, [self.pk])
+
+    @classmethod
+    def assign_to(cls, pk, employee_id):
+        """
+        Assign an equipment to an employee from their ids, raise
+        Employee.DoesNotExist, Equipment.DoesNotExist or a ValueError.
+
+        The employee row is locked first, like in assign, the equipment is then
+        read once for the rules and taken by a conditional update.
+        """
+        with transaction.atomic():
+            employee = Employee.lock([employee_id]).get(employee_id)
+            if employee is None:
+                raise Employee.DoesNotExist('The employee does not exist')
+            equipment = cls.objects.filter(pk=pk).first()
+            if equipment is None:
+                raise cls.DoesNotExist('The equipment does not exist')
+            equipment._assign_locked(employee)
+        detail_cache.invalidate(cls, [pk])
+        return equipment
 
+    def _assign_locked(self, employee):
+        # the employee row is locked by the caller
+        self.check_assignment(employee)
+
+        # only a free equipment can be taken, whatever this instance has seen
+        now = timezone.now()
+        updated = Equipment.objects.filter(pk=self.pk, status=EquipmentStatus.FREE).update(
+            employee=employee, status=EquipmentStatus.USED, updated_at=now
+        )
+        if not updated:
+            raise ValueError('You can not assign this equipment, it is already used!')
+        Employee.update_equipment_count(employee.pk, self.equipment_type, 1)
+        AssignmentEvent.record([AssignmentEvent.assignment(self.pk, employee.pk, self.equipment_type, now)])
+        moved_equipments('assign', [(employee.role, self.equipment_type)])
+
+        employee.shift_equipment_count(self.equipment_type, 1)
         self.employee = employee
         self.status = EquipmentStatus.USED
-        self.save()
+        self._loaded_stock = (self.equipment_type, self.status)
 
     def revoke(self):
+        with transaction.atomic():
+            # the employee row is locked first, like in assign
+            if self.employee_id is not None:
+                role = Employee.update_equipment_count(self.employee_id, self.equipment_type, -1)
+            # only revoke the equipment from the employee this instance has seen
+            updated = Equipment.objects.filter(pk=self.pk, employee=self.employee_id).update(
+                employee=None, status=EquipmentStatus.FREE, updated_at=timezone.now()
+            )
+            if not updated:
+                raise ValueError('The employee is not assigned to this equipment')
+            if self.employee_id is not None:
+                AssignmentEvent.record([AssignmentEvent.revocation(self.pk, self.employee_id, self.equipment_type)])
+                moved_equipments('revoke', [(role, self.equipment_type)])
+        detail_cache.invalidate(Equipment, [self.pk])
+
         self.employee = None
         self.status = EquipmentStatus.FREE
-        self.save()
+        self._loaded_stock = (self.equipment_type, self.status)
+
+    @classmethod
+    def revoke_from(cls, pk, employee_id):
+        """
+        Revoke an equipment from an employee without loading either row, raise
+        Employee.DoesNotExist, Equipment.DoesNotExist or a ValueError.
+
+        The counter of the employee is shifted by the type of the equipment read
+        in the same statement, which locks the employee row first like in assign,
+        then the equipment is freed only if the employee holds it and its revoke
+        event inserted. The lookups telling the errors apart only run when one
+        of the updates misses, the role and type labelling the metrics are
+        returned by the updates.
+        """
+        with transaction.atomic():
+            role = Employee.update_equipment_count_of(employee_id, pk, -1)
+            if role is None:
+                raise Employee.DoesNotExist('The employee does not exist')
+            updated = update_rows(
+                cls.objects.filter(pk=pk, employee=employee_id), ['equipment_type'],
+                employee=None, status=EquipmentStatus.FREE, updated_at=timezone.now()
+            )
+            if not updated:
+                if not cls.objects.filter(pk=pk).exists():
+                    raise cls.DoesNotExist('The equipment does not exist')
+                raise ValueError('The employee is not assigned to this equipment')
+            [(equipment_type,)] = updated
+            AssignmentEvent.record([AssignmentEvent.revocation(pk, employee_id, equipment_type)])
+            moved_equipments('revoke', [(role, equipment_type)])
+        detail_cache.invalidate(cls, [pk])
+
+    @classmethod
+    def allocate(cls, employee_id, equipment_type):
+        """
+        Assign to an employee the oldest free equipment of a type its rules accept.
+
+        The candidate is claimed with `SELECT ... FOR UPDATE SKIP LOCKED`: concurrent
+        allocations each take a different equipment instead of waiting for or
+        retrying on the same one. Raise Employee.DoesNotExist or a ValueError.
+        """
+        with transaction.atomic():
+            employee = Employee.lock([employee_id]).get(employee_id)
+            if employee is None:
+                raise Employee.DoesNotExist('The employee does not exist')
+            if not employee.active:
+                raise ValueError('You can not assign this equipment to an inactive employee')
+
+            try:
+                condition = EquipmentRule.policy()[employee.role] \
+                    .suitable_equipment(equipment_type, employee.equipment_counts())
+            except ValueError:
+                rule_rejections.inc(role=employee.role, equipment_type=equipment_type)
+                raise
+
+            # served by the partial index of the free equipments
+            equipment = cls.objects.select_for_update(skip_locked=True) \
+                .filter(condition, status=EquipmentStatus.FREE, equipment_type=equipment_type) \
+                .order_by('equipment_type', 'created_at').first()
+            if equipment is None:
+                raise ValueError(f'There is no suitable free {equipment_type} for this employee')
+
+            # a no-op where rows are locked, it guards backends without row locks
+            now = timezone.now()
+            updated = cls.objects.filter(pk=equipment.pk, status=EquipmentStatus.FREE).update(
+                employee=employee, status=EquipmentStatus.USED, updated_at=now
+            )
+            if not updated:
+                raise ValueError(f'There is no suitable free {equipment_type} for this employee')
+            Employee.update_equipment_count(employee.pk, equipment_type, 1)
+            AssignmentEvent.record([AssignmentEvent.assignment(equipment.pk, employee.pk, equipment_type, now)])
+            moved_equipments('assign', [(employee.role, equipment_type)])
+        detail_cache.invalidate(cls, [equipment.pk])
+
+        employee.shift_equipment_count(equipment_type, 1)
+        equipment.employee = employee
+        equipment.status = EquipmentStatus.USED
+        equipment.updated_at = now
+        equipment._loaded_stock = (equipment_type, equipment.status)
+        return equipment
+
+    @classmethod
+    def bulk_assign(cls, pairs):
+        """
+        Assign a batch of (equipment id, employee id) pairs.
+
+        The rows are loaded with one IN query per table and the rules are checked
+        in memory, the pairs already accepted in the batch counting for their employee.
+        Return the error message of every pair, None when it has been assigned.
+        """
+        with transaction.atomic():
+            employees = Employee.lock({employee_id for _, employee_id in pairs})
+            equipments = cls.lock({equipment_id for equipment_id, _ in pairs})
+            errors, assigned = cls._check_bulk_assign(pairs, equipments, employees)
+            cls.objects.bulk_update(assigned, ['employee', 'status', 'updated_at'])
+            detail_cache.invalidate(cls, [equipment.pk for equipment in assigned])
+            cls._bulk_update_counters({equipment.employee for equipment in assigned})
+            AssignmentEvent.record([
+                AssignmentEvent.assignment(equipment.pk, equipment.employee_id, equipment.equipment_type,
+                                           equipment.updated_at)
+                for equipment in assigned
+            ])
+            moved_equipments('assign', [(equipment.employee.role, equipment.equipment_type) for equipment in assigned])
+        return errors
+
+    @staticmethod
+    def _bulk_update_counters(employees):
+        now = timezone.now()
+        for employee in employees:
+            employee.updated_at = now
+        Employee.objects.bulk_update(employees, [*Employee.counter_fields.values(), 'updated_at'])
+        # the employees are locked, their counters as loaded are the stored ones
+        CompanyRoleSummary.shift(
+            added=[employee.summary_totals() for employee in employees],
+            removed=[employee._loaded_summary for employee in employees],
+        )
+        for employee in employees:
+            employee._loaded_summary = employee.summary_totals()
+        detail_cache.invalidate(Employee, [employee.pk for employee in employees])
+
+    @classmethod
+    def _check_bulk_assign(cls, pairs, equipments, employees):
+        now = timezone.now()
+        policy = EquipmentRule.policy()
+
+        errors, assigned = [], {}
+        for equipment_id, employee_id in pairs:
+            equipment, employee = equipments.get(equipment_id), employees.get(employee_id)
+            try:
+                if equipment is None:
+                    raise ValueError('The equipment does not exist')
+                if employee is None:
+                    raise ValueError('The employee does not exist')
+                equipment.check_assignment(employee, employee.equipment_counts(), policy)
+            except ValueError as error:
+                errors.append(str(error))
+                continue
+
+            equipment.employee = employee
+            equipment.status = EquipmentStatus.USED
+            equipment.updated_at = now
+            employee.shift_equipment_count(equipment.equipment_type, 1)
+            assigned[equipment.pk] = equipment
+            errors.append(None)
+        return errors, list(assigned.values())
+
+    @classmethod
+    def bulk_revoke(cls, pairs):
+        """
+        Revoke a batch of (equipment id, employee id) pairs.
+
+        Return the error message of every pair, None when it has been revoked.
+        """
+        with transaction.atomic():
+            employees = Employee.lock({employee_id for _, employee_id in pairs})
+            equipments = cls.lock({equipment_id for equipment_id, _ in pairs})
+            errors, revoked = cls._check_bulk_revoke(pairs, equipments, employees)
+            cls.objects.bulk_update(revoked, ['employee', 'status', 'updated_at'])
+            detail_cache.invalidate(cls, [equipment.pk for equipment in revoked])
+            done = [pair for pair, error in zip(pairs, errors) if error is None]
+            cls._bulk_update_counters({employees[employee_id] for _, employee_id in done})
+            AssignmentEvent.record([
+                AssignmentEvent.revocation(equipment_id, employee_id, equipments[equipment_id].equipment_type)
+                for equipment_id, employee_id in done
+            ])
+            moved_equipments('revoke', [
+                (employees[employee_id].role, equipments[equipment_id].equipment_type)
+                for equipment_id, employee_id in done
+            ])
+        return errors
+
+    @classmethod
+    def _check_bulk_revoke(cls, pairs, equipments, employees):
+        now = timezone.now()
+
+        errors, revoked = [], {}
+        for equipment_id, employee_id in pairs:
+            equipment = equipments.get(equipment_id)
+            if equipment is None:
+                errors.append('The equipment does not exist')
+                continue
+            if equipment.employee_id != employee_id or employee_id not in employees:
+                errors.append('The employee is not assigned to this equipment')
+                continue
+
+            employees[employee_id].shift_equipment_count(equipment.equipment_type, -1)
+
+            equipment.employee = None
+            equipment.status = EquipmentStatus.FREE
+            equipment.updated_at = now
+            revoked[equipment.pk] = equipment
+            errors.append(None)
+        return errors, list(revoked.values())
+
+
+class AssignmentEvent(models.Model):
+    """
+    Append-only ledger of the assignments, written in the transaction of the
+    assignment paths.
+
+    An assign event opens a holding and a revoke event closes it, `held_since`
+    being the start of the holding (the time of the matching assign event). The
+    ids are kept without foreign key constraints so the history outlives the
+    deleted equipments and employees. Both the equipment and the employee lead
+    an index with the time: the holder of an equipment at a time is one index
+    seek, the holdings of an employee a range of its own events.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    operation = models.CharField(choices=AssignmentOperation.choices, max_length=6)
+    equipment = models.ForeignKey('Equipment', on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    employee = models.ForeignKey('Employee', on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    equipment_type = models.CharField(choices=TypeOfEquipment.choices, max_length=6)
+    held_since = models.DateTimeField(null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='assignmentevent_created_idx'),
+            models.Index(fields=['equipment', '-created_at', '-id'], name='assignmentevent_equipment_idx'),
+            models.Index(fields=['employee', '-created_at', '-id'], name='assignmentevent_employee_idx'),
+        ]
+
+    def __str__(self):
+        return ' '.join([self.operation, str(self.equipment_id), str(self.employee_id)])
+
+    @classmethod
+    def assignment(cls, equipment_id, employee_id, equipment_type, at=None):
+        at = at or timezone.now()
+        return cls(
+            operation=AssignmentOperation.ASSIGN, equipment_id=equipment_id, employee_id=employee_id,
+            equipment_type=equipment_type, held_since=at, created_at=at,
+        )
+
+    @classmethod
+    def revocation(cls, equipment_id, employee_id, equipment_type=None, at=None):
+        """
+        The event closing the holding of an equipment: the start of the holding,
+        and the type of equipment when it is not given, are read by the insert
+        """
+        if equipment_type is None:
+            equipment_type = models.Subquery(
+                Equipment.objects.filter(pk=equipment_id).order_by().values('equipment_type')
+            )
+        held_since = models.Subquery(
+            cls.objects.filter(equipment=equipment_id, employee=employee_id, operation=AssignmentOperation.ASSIGN)
+            .order_by('-created_at', '-id').values('created_at')[:1]
+        )
+        return cls(
+            operation=AssignmentOperation.REVOKE, equipment_id=equipment_id, employee_id=employee_id,
+            equipment_type=equipment_type, held_since=held_since, created_at=at or timezone.now(),
+        )
+
+    @classmethod
+    def record(cls, events):
+        if events:
+            cls.objects.bulk_create(events)
+
+    @classmethod
+    def holder_at(cls, equipment_id, at):
+        """
+        The last event of an equipment at `at`: its holder when it is an assign event
+        """
+        return cls.objects.filter(equipment=equipment_id, created_at__lte=at).order_by('-created_at', '-id').first()
+
+    @classmethod
+    def holdings(cls, employee_id, start=None, end=None):
+        """
+        The events of the holdings of an employee overlapping a period: revoke
+        events closing a holding in or after the period, and assign events of
+        the holdings still running
+        """
+        closed = models.Q(operation=AssignmentOperation.REVOKE)
+        if start is not None:
+            closed &= models.Q(created_at__gte=start)
+        running = models.Q(operation=AssignmentOperation.ASSIGN) & ~models.Exists(
+            cls.objects.filter(equipment=models.OuterRef('equipment'), created_at__gt=models.OuterRef('created_at'))
+        )
+        if end is not None:
+            closed &= models.Q(held_since__lte=end) | models.Q(held_since__isnull=True)
+            running &= models.Q(created_at__lte=end)
+        return cls.objects.filter(closed | running, employee=employee_id)
+
+
+class CompanyRoleSummary(models.Model):
+    """
+    Materialized totals of the employees of a company with a role: one row per
+    company and role, created with the company.
+
+    The writes shift the totals in their own transaction, the assignment paths
+    the equipments held and the employee signals the head and active counts,
+    so reading them costs a page of this table instead of counting the
+    employees. `rebuild` recomputes them from the employees.
+    """
+    company = models.ForeignKey('Company', on_delete=models.CASCADE, related_name='+')
+    role = models.CharField(choices=EmployeeRole.choices, max_length=100)
+    head_count = models.IntegerField(default=0)
+    active_count = models.IntegerField(default=0)
+    pc_count = models.IntegerField(default=0)
+    screen_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    total_fields = ('head_count', 'active_count', 'pc_count', 'screen_count')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'role'], name='unique_company_role_summary'),
+        ]
+
+    def __str__(self):
+        return ' '.join([str(self.company_id), self.role])
+
+    @classmethod
+    def create_for(cls, company_ids):
+        cls.objects.bulk_create(
+            [cls(company_id=company_id, role=role) for company_id in company_ids for role in EmployeeRole.values],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def shift(cls, added=(), removed=()):
+        """
+        Add and remove `(company id, role), {field: delta}` totals with one UPDATE
+        """
+        changes = {}
+        for sign, totals in ((1, added), (-1, removed)):
+            for cell, deltas in totals:
+                shifted = changes.setdefault(cell, {})
+                for field, delta in deltas.items():
+                    shifted[field] = shifted.get(field, 0) + sign * delta
+        changes = {
+            cell: {field: delta for field, delta in deltas.items() if delta} for cell, deltas in changes.items()
+        }
+        changes = {cell: deltas for cell, deltas in changes.items() if deltas}
+        if not changes:
+            return
+
+        cells = {cell: models.Q(company=cell[0], role=cell[1]) for cell in changes}
+        fields = {field for deltas in changes.values() for field in deltas}
+        updates = {
+            field: models.F(field) + models.Case(
+                *(models.When(cells[cell], then=deltas[field]) for cell, deltas in changes.items() if field in deltas),
+                default=0,
+            )
+            for field in fields
+        }
+        cls.objects.filter(models.Q(*cells.values(), _connector=models.Q.OR)) \
+            .update(**updates, updated_at=timezone.now())
+
+    @classmethod
+    def shift_of(cls, employee_id, deltas):
+        """
+        Shift the totals of the company and role of an employee, read by the same statement
+        """
+        employee = Employee.objects.filter(pk=employee_id).order_by()
+        cls.objects.filter(
+            company=models.Subquery(employee.values('company')), role=models.Subquery(employee.values('role'))
+        ).update(**{field: models.F(field) + delta for field, delta in deltas.items()}, updated_at=timezone.now())
+
+    @classmethod
+    def rebuild(cls, company_ids=None):
+        """
+        Recompute the totals of companies (all by default) from their employees
+        """
+        companies = Company.objects.order_by()
+        employees = Employee.objects.order_by()
+        if company_ids is not None:
+            companies = companies.filter(pk__in=company_ids)
+            employees = employees.filter(company__in=company_ids)
+        cells = {
+            (company_id, role): cls(company_id=company_id, role=role)
+            for company_id in companies.values_list('pk', flat=True) for role in EmployeeRole.values
+        }
+        rows = employees.values('company', 'role').annotate(
+            head_count=models.Count('pk'),
+            active_count=models.Count('pk', filter=models.Q(active=True)),
+            pc_count=models.Sum('pc_count'),
+            screen_count=models.Sum('screen_count'),
+        )
+        for row in rows:
+            cell = cells.get((row['company'], row['role']))
+            if cell is not None:
+                for field in cls.total_fields:
+                    setattr(cell, field, row[field])
+        cls.objects.bulk_create(
+            cells.values(), batch_size=5000, update_conflicts=True,
+            unique_fields=['company', 'role'], update_fields=[*cls.total_fields, 'updated_at'],
+        )
+
+
+class EquipmentRule(TrackTimeModel):
+    """
+    Business rule of a role for a type of equipment: how many it may hold and
+    the minimum criteria of the equipment.
+
+    A role without rules may hold any equipment, a role with rules only the
+    types of equipment it has a rule for. The rules are compiled into a policy
+    table cached by every process and rebuilt when their last update or their
+    number changes.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    role = models.CharField(choices=EmployeeRole.choices, max_length=100)
+    equipment_type = models.CharField(choices=TypeOfEquipment.choices, max_length=6)
+    max_count = models.PositiveIntegerField(null=True, blank=True)
+    min_memory = models.PositiveIntegerField(null=True, blank=True)
+    min_hard_disk_size = models.PositiveIntegerField(null=True, blank=True)
+
+    _compiled = (None, None)
+
+    class Meta(TrackTimeModel.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=['role', 'equipment_type'], name='unique_equipment_rule'),
+        ]
+
+    def __str__(self):
+        return ' '.join([self.role, self.equipment_type])
+
+    @classmethod
+    def policy(cls):
+        """
+        The policy table of the rules, compiled again with one more query when they have changed
+        """
+        # the version is read from the table so every process sees the rules changed by the others
+        with primary_reads():
+            version = cls.objects.order_by().aggregate(updated_at=models.Max('updated_at'), count=models.Count('*'))
+            compiled_version, table = cls._compiled
+            if compiled_version != version:
+                table = PolicyTable(cls.objects.order_by().values_list(
+                    'role', 'equipment_type', 'max_count', 'min_memory', 'min_hard_disk_size'
+                ))
+                cls._compiled = (version, table)
+        return table
+
+
+def copy_rows(queryset, model, **values):
+    """
+    Copy the rows of a queryset into the table of `model` with one INSERT ... SELECT,
+    the columns matched by name and `values` setting some of them to a constant.
+    Return the number of rows copied.
+    """
+    db = router.db_for_write(model)
+    sources = {field.column: field.attname for field in queryset.model._meta.concrete_fields}
+    copied = [field for field in model._meta.concrete_fields if field.name not in values]
+    constants = {name: model._meta.get_field(name) for name in values}
+    # the annotations are selected after the fields
+    query = queryset.using(db).order_by().annotate(**{
+        f'copied_{name}': models.Value(values[name], output_field=field) for name, field in constants.items()
+    }).values_list(*[sources[field.column] for field in copied], *[f'copied_{name}' for name in constants]).query
+    sql, params = query.get_compiler(db).as_sql()
+
+    connection = connections[db]
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in [*copied, *constants.values()])
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) {sql}', params)
+        return cursor.rowcount
+
+
+def update_rows(queryset, returning, **values):
+    """
+    Update the rows of a queryset like `QuerySet.update()`, with one UPDATE ... RETURNING
+    the columns of the `returning` fields. Return the updated rows as tuples of these columns.
+    """
+    db = router.db_for_write(queryset.model)
+    query = queryset.using(db).order_by().query.chain(UpdateQuery)
+    query.add_update_values(values)
+    sql, params = query.get_compiler(db).as_sql()
+
+    connection = connections[db]
+    columns = ', '.join(
+        connection.ops.quote_name(queryset.model._meta.get_field(name).column) for name in returning
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f'{sql} RETURNING {columns}', params)
+        return cursor.fetchall()
+
+
+def delete_rows(queryset):
+    """
+    Delete the rows of a queryset with one DELETE ... WHERE pk IN (SELECT ...), without
+    loading them: neither the deletion signals nor the `on_delete` of the foreign keys
+    run, the caller handles the rows referring to them. Return the number of rows deleted.
+    """
+    db = router.db_for_write(queryset.model)
+    sql, params = queryset.using(db).order_by().values('pk').query.get_compiler(db).as_sql()
+
+    connection = connections[db]
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    pk = connection.ops.quote_name(queryset.model._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {pk} IN ({sql})', params)
+        return cursor.rowcount
+
+
+class ArchivedCompany(models.Model):
+    """
+    Company moved out of the live tables after a long inactivity, with its
+    employees and their assignment events.
+
+    The live tables, their indexes and their default querysets only hold the
+    live rows. The rows are moved in both directions by INSERT ... SELECT
+    statements, without loading them.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    name = models.CharField(max_length=100)
+    active = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-archived_at']
+        indexes = [
+            models.Index(fields=['-archived_at', '-id'], name='archivedcompany_archived_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def archive_inactive(cls, before, batch_size=100):
+        """
+        Archive a batch of the companies inactive since `before`, in one transaction.
+        Return the number of companies, employees and assignment events archived.
+        """
+        with transaction.atomic():
+            company_ids = list(
+                Company.objects.select_for_update().filter(active=False, updated_at__lt=before)
+                .order_by('updated_at', 'id').values_list('pk', flat=True)[:batch_size]
+            )
+            if not company_ids:
+                return 0, 0, 0
+            now = timezone.now()
+            employees, events = ArchivedEmployee.move(Employee.objects.filter(company__in=company_ids), now)
+            companies = Company.objects.filter(pk__in=company_ids)
+            copy_rows(companies, cls, archived_at=now)
+            # their summary goes with them
+            companies.delete()
+        return len(company_ids), employees, events
+
+    @classmethod
+    def restore(cls, pk):
+        """
+        Move an archived company back to the live tables with its archived employees
+        and their assignment events, raise ArchivedCompany.DoesNotExist, or ValueError
+        when a live employee has the name of one of them
+        """
+        with transaction.atomic():
+            now = timezone.now()
+            archived = cls.objects.filter(pk=pk)
+            archived.select_for_update().get()
+            copy_rows(archived, Company, updated_at=now)
+            ArchivedEmployee.move_back(ArchivedEmployee.objects.filter(company=pk), now)
+            archived.delete()
+            CompanyRoleSummary.rebuild([pk])
+
+
+class ArchivedEmployee(models.Model):
+    """
+    Employee moved out of the live tables with its company, or alone after a
+    long inactivity. Its equipments are revoked before it is archived.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    name = models.CharField(max_length=100)
+    surname = models.CharField(max_length=100)
+    active = models.BooleanField(default=False)
+    role = models.CharField(choices=EmployeeRole.choices, max_length=100)
+    company = models.UUIDField(db_column='company_id')
+    pc_count = models.IntegerField(default=0)
+    screen_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-archived_at']
+        indexes = [
+            models.Index(fields=['-archived_at', '-id'], name='archivedemployee_archived_idx'),
+            models.Index(fields=['company'], name='archivedemployee_company_idx'),
+        ]
+
+    def __str__(self):
+        return ' '.join([self.name, self.surname])
+
+    @classmethod
+    def archive_inactive(cls, before, batch_size=1000):
+        """
+        Archive a batch of the employees inactive since `before`, in one transaction.
+        Return the number of employees and assignment events archived.
+        """
+        with transaction.atomic():
+            employee_ids = list(
+                Employee.objects.select_for_update().filter(active=False, updated_at__lt=before)
+                .order_by('updated_at', 'id').values_list('pk', flat=True)[:batch_size]
+            )
+            if not employee_ids:
+                return 0, 0
+            employees = Employee.objects.filter(pk__in=employee_ids)
+            # the revocations take their equipments out of the summary of their company, the rest leaves here
+            cells = employees.order_by().values_list('company', 'role').annotate(
+                head_count=models.Count('pk'), active_count=models.Count('pk', filter=models.Q(active=True)),
+            )
+            CompanyRoleSummary.shift(removed=[
+                ((company_id, role), {'head_count': head_count, 'active_count': active_count})
+                for company_id, role, head_count, active_count in cells
+            ])
+            return cls.move(employees, timezone.now())
+
+    @classmethod
+    def move(cls, employees, now):
+        """
+        Revoke the equipments of employees, then move them and their assignment events to the archive.
+        Return the number of employees and assignment events archived.
+        """
+        employee_ids = list(employees.select_for_update().values_list('pk', flat=True))
+        held = list(Equipment.objects.filter(employee__in=employees).values_list('pk', 'employee'))
+        if held:
+            Equipment.bulk_revoke(held)
+
+        events = AssignmentEvent.objects.filter(employee__in=employees.values('pk'))
+        archived_events = copy_rows(events, ArchivedAssignmentEvent, archived_at=now)
+        events.delete()
+        archived = copy_rows(employees, cls, archived_at=now)
+        # nothing refers to them anymore and the deletion signals have nothing left to do
+        delete_rows(employees)
+        detail_cache.invalidate(Employee, employee_ids)
+        return archived, archived_events
+
+    @classmethod
+    def move_back(cls, archived, now):
+        """
+        Move archived employees and their assignment events back to the live tables,
+        raise ValueError when a live employee has the name of one of them
+        """
+        taken = archived.filter(models.Exists(
+            Employee.objects.filter(name=models.OuterRef('name'), surname=models.OuterRef('surname'))
+        ))
+        if taken.exists():
+            raise ValueError('An employee with the same name and surname already exists')
+        events = ArchivedAssignmentEvent.objects.filter(employee__in=archived.values('pk'))
+        restored = copy_rows(archived, Employee, updated_at=now)
+        copy_rows(events, AssignmentEvent)
+        events.delete()
+        archived.delete()
+        return restored
+
+    @classmethod
+    def restore(cls, pk):
+        """
+        Move an archived employee back to the live tables with its assignment events,
+        raise ArchivedEmployee.DoesNotExist, or ValueError when its company is archived
+        or a live employee has its name
+        """
+        with transaction.atomic():
+            archived = cls.objects.filter(pk=pk)
+            employee = archived.select_for_update().get()
+            if not Company.objects.filter(pk=employee.company).exists():
+                raise ValueError('The company of the employee is archived, restore it first')
+            cls.move_back(archived, timezone.now())
+            CompanyRoleSummary.shift(added=[(
+                (employee.company, employee.role),
+                {'head_count': 1, 'active_count': int(employee.active)},
+            )])
+
+
+class ArchivedAssignmentEvent(models.Model):
+    """
+    Assignment event of an archived employee
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    operation = models.CharField(choices=AssignmentOperation.choices, max_length=6)
+    equipment = models.UUIDField(db_column='equipment_id')
+    employee = models.UUIDField(db_column='employee_id')
+    equipment_type = models.CharField(choices=TypeOfEquipment.choices, max_length=6)
+    held_since = models.DateTimeField(null=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['employee'], name='archivedevent_employee_idx'),
+        ]
+
+    def __str__(self):
+        return ' '.join([self.operation, str(self.equipment), str(self.employee)])
@@ -0,0 +1,102 @@
+from collections import Counter
+
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from base.cache import detail_cache
+from base.signals import bulk_created
+from management.metrics import stock
+from management.models import AssignmentEvent, Company, CompanyRoleSummary, Employee, Equipment
+
+
+@receiver(pre_delete, sender=Equipment)
+def release_deleted_equipment(sender, instance, **kwargs):
+    """
+    Keep the employee's equipment counters and the ledger right when an assigned equipment is deleted
+    """
+    if instance.employee_id is not None:
+        Employee.update_equipment_count(instance.employee_id, instance.equipment_type, -1)
+        AssignmentEvent.record([
+            AssignmentEvent.revocation(instance.pk, instance.employee_id, instance.equipment_type)
+        ])
+
+
+@receiver(pre_delete, sender=Employee)
+def invalidate_released_equipments(sender, instance, **kwargs):
+    """
+    The equipments of a deleted employee are released without any signal: their
+    cached details are invalidated and their holdings closed in the ledger
+    """
+    held = list(instance.equipments.values_list('pk', 'equipment_type'))
+    detail_cache.invalidate(Equipment, [equipment_id for equipment_id, _ in held])
+    AssignmentEvent.record([
+        AssignmentEvent.revocation(equipment_id, instance.pk, equipment_type) for equipment_id, equipment_type in held
+    ])
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_save, sender=Employee)
+@receiver(post_save, sender=Equipment)
+@receiver(post_delete, sender=Company)
+@receiver(post_delete, sender=Employee)
+@receiver(post_delete, sender=Equipment)
+def invalidate_detail_cache(sender, instance, **kwargs):
+    detail_cache.invalidate(sender, [instance.pk])
+
+
+@receiver(post_save, sender=Equipment)
+def shift_saved_equipment_stock(sender, instance, created, **kwargs):
+    state = (instance.equipment_type, instance.status)
+    loaded = getattr(instance, '_loaded_stock', None)
+    if created:
+        stock.shift({state: 1})
+    elif loaded is None:
+        # an update of an instance that was not loaded: what it replaced is unknown
+        stock.forget()
+    elif loaded != state:
+        stock.shift({loaded: -1, state: 1})
+    instance._loaded_stock = state
+
+
+@receiver(post_delete, sender=Equipment)
+def shift_deleted_equipment_stock(sender, instance, **kwargs):
+    stock.shift({getattr(instance, '_loaded_stock', (instance.equipment_type, instance.status)): -1})
+
+
+@receiver(bulk_created, sender=Equipment)
+def shift_created_equipments_stock(sender, objs, **kwargs):
+    stock.shift(Counter((equipment.equipment_type, equipment.status) for equipment in objs))
+
+
+@receiver(post_save, sender=Company)
+def create_company_summary(sender, instance, created, **kwargs):
+    if created:
+        CompanyRoleSummary.create_for([instance.pk])
+
+
+@receiver(bulk_created, sender=Company)
+def create_companies_summary(sender, objs, **kwargs):
+    CompanyRoleSummary.create_for([company.pk for company in objs])
+
+
+@receiver(post_save, sender=Employee)
+def shift_saved_employee_summary(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_summary', None)
+    if created:
+        CompanyRoleSummary.shift(added=[instance.summary_totals()])
+    elif loaded is None:
+        # an update of an instance that was not loaded: what it replaced is unknown
+        CompanyRoleSummary.rebuild([instance.company_id])
+    else:
+        CompanyRoleSummary.shift(added=[instance.summary_totals()], removed=[loaded])
+    instance._loaded_summary = instance.summary_totals()
+
+
+@receiver(post_delete, sender=Employee)
+def shift_deleted_employee_summary(sender, instance, **kwargs):
+    CompanyRoleSummary.shift(removed=[getattr(instance, '_loaded_summary', None) or instance.summary_totals()])
+
+
+@receiver(bulk_created, sender=Employee)
+def shift_created_employees_summary(sender, objs, **kwargs):
+    CompanyRoleSummary.shift(added=[employee.summary_totals() for employee in objs])
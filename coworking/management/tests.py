@@ -1,3 +1,434 @@
-from django.test import TestCase
+import json
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, models
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from base.cache import detail_cache
+from base.models import EmployeeRole, EquipmentStatus
+from management.checks import check_shared_caches
+from management.models import (
+    ArchivedCompany, ArchivedEmployee, Company, CompanyRoleSummary, Employee, Equipment, EquipmentRule,
+)
+
+
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'Query plans are only parsed for SQLite and PostgreSQL')
+class QueryPlanTests(APITestCase):
+    """
+    Ensure the hot endpoints are served by an index and never by a full table scan.
+    """
+
+    def setUp(self):
+        company = Company.objects.create(name='LtuTech', active=True)
+        self.employee = Employee.objects.create(
+            name='Rami', surname='Belgacem', active=True, role=EmployeeRole.INTERN, company=company
+        )
+        self.equipment = Equipment.objects.create(
+            equipment_type='pc', memory=32, hard_disk_size=512, model='HP', status='free'
+        )
+        # compiling the rules reads their whole (tiny) table, once per process
+        EquipmentRule.policy()
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # tiny test tables would always be sequentially scanned otherwise
+                cursor.execute('SET enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql)
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def assertIndexedQueries(self, url, method='get', data=None):
+        with CaptureQueriesContext(connection) as context:
+            getattr(self.client, method)(url, data)
+        selects = [query['sql'] for query in context.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            plan = self.explain(sql)
+            table_scan = re.search(r'\bSCAN management_\w+$', plan, re.MULTILINE) or 'Seq Scan' in plan
+            self.assertFalse(table_scan, f'Table scan for {url}:\n{sql}\n{plan}')
+
+    def test_list_endpoints(self):
+        for name in ('company-list', 'employee-list', 'equipment-list', 'employee-hired'):
+            self.assertIndexedQueries(reverse(name))
+        self.assertIndexedQueries(reverse('employee-equipment-list', args=(self.employee.id,)))
+
+    def test_filtered_lists(self):
+        for url in (
+            reverse('company-list') + '?active=true',
+            reverse('company-list') + '?search=Ltu',
+            reverse('company-list') + '?ordering=name',
+            reverse('employee-list') + f'?company={self.employee.company_id}',
+            reverse('employee-list') + '?search=Bel',
+            reverse('equipment-list') + '?status=free&equipment_type=pc&memory__gte=32',
+            reverse('equipment-list') + '?status=used',
+            reverse('equipment-list') + '?search=HP&ordering=-model',
+        ):
+            self.assertIndexedQueries(url)
+
+    def test_next_page(self):
+        for i in range(3):
+            Company.objects.create(name=f'Company {i}')
+        next_url = self.client.get(reverse('company-list') + '?page_size=1').json()['next']
+        self.assertIndexedQueries(next_url)
+
+    def test_assign(self):
+        url = reverse('employee-equipment-assign', args=(self.equipment.id, self.employee.id))
+        self.assertIndexedQueries(url, method='post')
+
+    def test_allocate(self):
+        data = {'employee': self.employee.id, 'equipment_type': 'pc'}
+        self.assertIndexedQueries(reverse('equipment-allocate'), method='post', data=data)
+
+    def test_ledger(self):
+        self.client.post(reverse('employee-equipment-assign', args=(self.equipment.id, self.employee.id)))
+        self.assertIndexedQueries(reverse('equipment-holder', args=(self.equipment.id,)))
+        self.assertIndexedQueries(reverse('employee-holdings', args=(self.employee.id,)) + '?start=2020-01-01T00:00')
+
+    def test_hiring_window(self):
+        for query in (
+            '?role=techlead&start=2020-01-01&bucket=month',
+            '?role=intern&start=2020-01-01&end=2030-12-31&bucket=week',
+            f'?company={self.employee.company_id}&start=2020-01-01T00:00&active=true',
+            '?start=2020-01-01&end=2030-12-31',
+        ):
+            self.assertIndexedQueries(reverse('employee-hired') + query)
+
+    def test_archive(self):
+        self.assertIndexedQueries(reverse('company-archived'))
+        self.assertIndexedQueries(reverse('employee-archived') + f'?company={self.employee.company_id}')
+
+    def test_inventory_summary(self):
+        self.assertIndexedQueries(reverse('inventory-summary') + f'?company={self.employee.company_id}')
+
+
+class EmployeeTests(TestCase):
+
+    def test_company_checked_when_joining(self):
+        """
+        Ensure the company is only loaded and checked when the employee joins it.
+        """
+        company = Company.objects.create(name='LtuTech', active=True)
+        inactive = Company.objects.create(name='Closed')
+        with self.assertRaises(ValueError):
+            Employee.objects.create(name='Rami', surname='Belgacem', role=EmployeeRole.DEV, company=inactive)
+
+        employee = Employee.objects.create(name='Rami', surname='Belgacem', role=EmployeeRole.DEV, company=company)
+        employee = Employee.objects.get(pk=employee.pk)
+        # the update and the active count of its company summary
+        with self.assertNumQueries(2):
+            employee.active = True
+            employee.save()
+
+        employee.company_id = inactive.id
+        with self.assertRaises(ValueError):
+            employee.save()
+
+    def test_equipment_counters(self):
+        """
+        Ensure the equipment counters follow the assignments without counting queries.
+        """
+        company = Company.objects.create(name='LtuTech', active=True)
+        employee = Employee.objects.create(
+            name='Rami', surname='Belgacem', active=True, role=EmployeeRole.DEV, company=company
+        )
+        screens = [
+            Equipment.objects.create(equipment_type='screen', size=24, model='ACER', status='free')
+            for _ in range(2)
+        ]
+        pc = Equipment.objects.create(equipment_type='pc', memory=16, hard_disk_size=256, model='HP', status='free')
+
+        for equipment in screens + [pc]:
+            equipment.assign(employee)
+        employee.refresh_from_db()
+        with self.assertNumQueries(0):
+            self.assertEqual(employee.equipment_counts(), {'pc': 1, 'screen': 2})
+
+        screens[0].revoke()
+        screens[1].delete()
+        employee.refresh_from_db()
+        self.assertEqual(employee.equipment_counts(), {'pc': 1, 'screen': 0})
+
+        employee.revoke_all()
+        employee.refresh_from_db()
+        self.assertEqual(employee.equipment_counts(), {'pc': 0, 'screen': 0})
+
+    def test_stale_save_keeps_counters(self):
+        """
+        Ensure saving an instance loaded before an assignment does not overwrite its counters.
+        """
+        company = Company.objects.create(name='LtuTech', active=True)
+        employee = Employee.objects.create(
+            name='Rami', surname='Belgacem', active=True, role=EmployeeRole.DEV, company=company
+        )
+        stale = Employee.objects.get(pk=employee.pk)
+        pc = Equipment.objects.create(equipment_type='pc', memory=16, hard_disk_size=256, model='HP', status='free')
+        Equipment.assign_to(pc.pk, employee.pk)
+
+        stale.surname = 'Belgacem Jr'
+        stale.save()
+        employee.refresh_from_db()
+        self.assertEqual(employee.surname, 'Belgacem Jr')
+        self.assertEqual(employee.equipment_counts(), {'pc': 1, 'screen': 0})
+        self.assertEqual(CompanyRoleSummary.objects.get(company=company, role=EmployeeRole.DEV).pc_count, 1)
+
+    def test_rebuild_equipment_counters(self):
+        """
+        Ensure the command finds and rebuilds wrong counters, with the company summary and the cached details.
+        """
+        company = Company.objects.create(name='LtuTech', active=True)
+        employee = Employee.objects.create(name='Rami', surname='Belgacem', role=EmployeeRole.DEV, company=company)
+        Equipment.objects.create(equipment_type='screen', size=24, model='ACER', status='used', employee=employee)
+        detail_cache.set(Employee, employee.pk, {'screen_count': 0}, detail_cache.get(Employee, employee.pk)[1])
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_equipment_counters', '--verify', stdout=StringIO())
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_equipment_counters', stdout=StringIO())
+        call_command('rebuild_equipment_counters', '--verify', stdout=StringIO())
+        employee.refresh_from_db()
+        self.assertEqual(employee.equipment_counts(), {'pc': 0, 'screen': 1})
+        self.assertEqual(CompanyRoleSummary.objects.get(company=company, role=EmployeeRole.DEV).screen_count, 1)
+        self.assertIsNone(detail_cache.peek(Employee, employee.pk))
+
+
+class EquipmentRuleTests(TestCase):
+
+    def setUp(self):
+        company = Company.objects.create(name='LtuTech', active=True)
+        self.employee = Employee.objects.create(
+            name='Rami', surname='Belgacem', active=True, role=EmployeeRole.IT, company=company
+        )
+
+    def create_pc(self):
+        return Equipment.objects.create(equipment_type='pc', memory=16, hard_disk_size=256, model='HP', status='free')
+
+    def test_policy_cached(self):
+        """
+        Ensure the compiled rules are kept while their version is unchanged and reloaded when they change.
+        """
+        EquipmentRule.policy()
+        with self.assertNumQueries(1):
+            EquipmentRule.policy()
+
+        # changed by another process: only the table tells
+        EquipmentRule.objects.filter(role=EmployeeRole.DEV, equipment_type='screen').delete()
+        with self.assertNumQueries(2):
+            policy = EquipmentRule.policy()
+        with self.assertRaises(ValueError):
+            policy[EmployeeRole.DEV].suitable_equipment('screen', {'pc': 0, 'screen': 0})
+
+    def test_configurable_role(self):
+        """
+        Ensure a role without rules may hold anything until rules are declared for it.
+        """
+        for _ in range(2):
+            self.create_pc().assign(self.employee)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            EquipmentRule.objects.create(role=EmployeeRole.IT, equipment_type='pc', max_count=2, min_memory=16)
+        with self.assertRaises(ValueError):
+            self.create_pc().assign(self.employee)
+        with self.assertRaises(ValueError):
+            Equipment.objects.create(equipment_type='screen', size=24, model='ACER', status='free') \
+                .assign(self.employee)
+
+
+class ImportInventoryTests(TestCase):
+
+    def test_import_inventory(self):
+        """
+        Ensure the command imports a file by batches and reports its throughput.
+        """
+        rows = [{'kind': 'company', 'name': 'LtuTech', 'active': True}] + [
+            {'kind': 'employee', 'name': f'Name {i}', 'surname': 'Surname', 'role': 'dev', 'company': 'LtuTech'}
+            for i in range(5)
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as file:
+            file.write('\n'.join(json.dumps(row) for row in rows))
+            file.flush()
+            stdout = StringIO()
+            call_command('import_inventory', file.name, '--batch-size', '2', stdout=stdout)
+
+        self.assertEqual(Employee.objects.filter(company__name='LtuTech').count(), 5)
+        self.assertIn('6 rows imported', stdout.getvalue())
+        self.assertIn('rows/s', stdout.getvalue())
+
+
+class ArchiveInactiveTests(TestCase):
+
+    def test_archive_inactive(self):
+        """
+        Ensure the command archives the long inactive companies by batches, then the long inactive employees.
+        """
+        long_ago = timezone.now() - timedelta(days=30)
+        for index in range(3):
+            company = Company.objects.create(name=f'Closed {index}', active=True)
+            Employee.objects.create(name=f'Name {index}', surname='Surname', role=EmployeeRole.DEV, company=company)
+        Company.objects.update(active=False, updated_at=long_ago)
+        company = Company.objects.create(name='LtuTech', active=True)
+        Employee.objects.create(name='Rami', surname='Belgacem', role=EmployeeRole.DEV, company=company)
+        Employee.objects.filter(company=company).update(updated_at=long_ago)
+
+        stdout = StringIO()
+        call_command('archive_inactive', '--days', '60', stdout=stdout)
+        self.assertFalse(ArchivedCompany.objects.exists())
+        call_command('archive_inactive', '--days', '7', '--batch-size', '2', stdout=stdout)
+
+        self.assertEqual(list(Company.objects.values_list('name', flat=True)), ['LtuTech'])
+        self.assertFalse(Employee.objects.exists())
+        self.assertEqual(ArchivedEmployee.objects.count(), 4)
+        self.assertIn('3 companies, 4 employees and 0 assignment events archived', stdout.getvalue())
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+
+    def test_process_local_caches(self):
+        """
+        Ensure the deploy checks require the stock and detail caches to be shared by the processes.
+        """
+        self.assertEqual(
+            [error.id for error in check_shared_caches(None)], ['management.E001', 'management.E001']
+        )
+        redis = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379/0'}
+        with override_settings(CACHES={'default': redis, 'detail': {**redis, 'KEY_PREFIX': 'detail'}}):
+            self.assertEqual(check_shared_caches(None), [])
+
+
+class ConcurrentAssignmentTests(TransactionTestCase):
+    """
+    Hammer the assignment paths from several threads at once.
+    Attempts may be rejected by the rules, but no rule may be broken.
+
+    SQLite locks the whole database instead of rows: an attempt failing on the
+    lock is retried, as a client would, so every attempt ends accepted or rejected.
+    """
+    threads = 8
+    retries = 50
+    # keep the rules created by the migrations
+    serialized_rollback = True
+
+    def setUp(self):
+        self.company = Company.objects.create(name='LtuTech', active=True)
+
+    def run_concurrently(self, calls):
+        barrier = threading.Barrier(len(calls))
+        successes = []
+        rejections = []
+
+        def attempt(call):
+            for _ in range(self.retries):
+                try:
+                    return call()
+                except OperationalError as error:
+                    if 'locked' not in str(error):
+                        raise
+                    time.sleep(random.uniform(0.001, 0.01))
+            return call()
+
+        def run(call):
+            try:
+                barrier.wait()
+                attempt(call)
+                successes.append(call)
+            except Exception as error:
+                rejections.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(call,)) for call in calls]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(len(successes), 1)
+        for error in rejections:
+            self.assertIsInstance(error, ValueError)
+        return successes
+
+    def create_employee(self, index, role=EmployeeRole.DEV):
+        return Employee.objects.create(
+            name=f'Name {index}', surname='Surname', active=True, role=role, company=self.company
+        )
+
+    def create_screen(self):
+        return Equipment.objects.create(equipment_type='screen', size=24, model='ACER', status='free')
+
+    def test_same_equipment(self):
+        """
+        Ensure an equipment is never given to two employees.
+        """
+        screen = self.create_screen()
+        employees = [self.create_employee(i) for i in range(self.threads)]
+        calls = [
+            lambda employee=employee: Equipment.objects.get(pk=screen.pk).assign(employee)
+            for employee in employees
+        ]
+
+        successes = self.run_concurrently(calls)
+        self.assertLessEqual(len(successes), 1)
+        self.assertEqual(Equipment.objects.filter(status=EquipmentStatus.USED).count(), len(successes))
+
+    def test_same_employee(self):
+        """
+        Ensure concurrent assignments to an intern can not both pass its rules.
+        """
+        intern = self.create_employee(0, role=EmployeeRole.INTERN)
+        screens = [self.create_screen() for _ in range(self.threads)]
+        calls = [lambda screen=screen: Equipment.objects.get(pk=screen.pk).assign(intern) for screen in screens]
+
+        successes = self.run_concurrently(calls)
+        self.assertLessEqual(len(successes), 1)
+        self.assertEqual(intern.equipments.count(), len(successes))
+        intern.refresh_from_db()
+        self.assertEqual(intern.screen_count, len(successes))
+
+    def test_allocate(self):
+        """
+        Ensure concurrent allocations never hand out the same equipment.
+        """
+        screens = [self.create_screen() for _ in range(self.threads // 2)]
+        employees = [self.create_employee(i) for i in range(self.threads)]
+        calls = [
+            lambda employee=employee: Equipment.allocate(employee.pk, 'screen')
+            for employee in employees
+        ]
+
+        successes = self.run_concurrently(calls)
+        self.assertLessEqual(len(successes), len(screens))
+        self.assertEqual(Equipment.objects.filter(status=EquipmentStatus.USED).count(), len(successes))
+        self.assertEqual(
+            Employee.objects.aggregate(total=models.Sum('screen_count'))['total'], len(successes)
+        )
+
+    def test_bulk_assign(self):
+        """
+        Ensure overlapping batches do not double assign equipments.
+        """
+        screens = [self.create_screen() for _ in range(self.threads)]
+        employees = [self.create_employee(i) for i in range(self.threads)]
+        calls = [
+            lambda employee=employee: Equipment.bulk_assign([(screen.pk, employee.pk) for screen in screens])
+            for employee in employees
+        ]
+
+        self.run_concurrently(calls)
+        for employee in employees:
+            self.assertLessEqual(employee.equipments.count(), 2)
+        self.assertEqual(
+            Equipment.objects.filter(status=EquipmentStatus.USED).count(),
+            Equipment.objects.filter(employee__isnull=False).count(),
+        )